@@ -0,0 +1,34 @@
+# Headless batch rebalance of many stored portfolios with one worker and
+# with one worker per core. Quotes come from a FakeQuoteProvider.
+#   python benchmarks/bench_batch.py [portfolios] [holdings]
+import os, sys, time, tempfile
+from pathlib import Path
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+from stock import Stock
+from portfolio import Portfolio
+from portfoliostore import PortfolioStore
+from manager import PortfolioManager
+from quotes import FakeQuoteProvider, Quote
+import batch
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    holdings = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    directory = Path(tempfile.mkdtemp())
+    PortfolioManager.DEFAULT_PATH = directory
+    store = PortfolioStore(directory / "portfolios.sqlite")
+    quotes = {f"t{j}": Quote(10.0 + j % 50, 'USD') for j in range(holdings)}
+    for i in range(n):
+        stocks = [Stock(f"t{j}", 0.0, 'USD', (i + j) % 7, 1 / holdings, 0.0) for j in range(holdings)]
+        store.save(Portfolio(f"p{i}", stocks, 0.0, 'USD'))
+
+    print(f"{n} portfolios of {holdings} holdings, optimal mode")
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        batch.rebalanceAll(store, liquidCash=1000.0, mode='optimal',
+                           provider=FakeQuoteProvider(quotes), maxWorkers=workers)
+        print(f"{workers} worker(s): {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Listing thousands of saved portfolios with their summary fields: the
+# catalog query against unpickling every portfolio file.
+#   python benchmarks/bench_catalog.py [portfolios] [holdings]
+import os, sys, time, pickle, tempfile
+from pathlib import Path
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+from stock import Stock
+from portfolio import Portfolio
+from portfoliostore import PortfolioStore, loadPickle
+
+def makePortfolio(i: int, holdings: int) -> Portfolio:
+    stocks = [Stock(f"t{j}", 10.0, 'USD', 1, 1 / holdings, 10.0) for j in range(holdings)]
+    return Portfolio(f"p{i}", stocks, float(i), 'USD' if i % 2 else 'CAD')
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    holdings = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    directory = Path(tempfile.mkdtemp())
+    store = PortfolioStore(directory / "portfolios.sqlite")
+    for i in range(n):
+        portfolio = makePortfolio(i, holdings)
+        store.save(portfolio)
+        with open(directory / f"p{i}.pickle", 'wb') as f:
+            pickle.dump(portfolio, f, pickle.HIGHEST_PROTOCOL)
+
+    start = time.perf_counter()
+    summaries = []
+    for path in directory.glob("*.pickle"):
+        portfolio = loadPickle(path)
+        summaries.append((path.stem, portfolio.totalValue, len(portfolio.stocks), path.stat().st_mtime))
+    summaries.sort(key=lambda s: s[1], reverse=True)
+    unpickled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store.catalog(sortBy='totalValue', descending=True)
+    listed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store.catalog(currency='usd', minValue=n / 2, sortBy='modifiedAt')
+    filtered = time.perf_counter() - start
+
+    print(f"{n} portfolios of {holdings} holdings")
+    print(f"unpickle every file: {unpickled * 1000:.1f}ms")
+    print(f"catalog, sorted:     {listed * 1000:.1f}ms")
+    print(f"catalog, filtered:   {filtered * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
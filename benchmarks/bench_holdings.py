@@ -0,0 +1,47 @@
+# Memory per holding and time for a value update: plain __dict__ objects
+# (the old Stock layout) against the slotted Stock over a HoldingsTable.
+#   python benchmarks/bench_holdings.py [holdings]
+import os, sys, time, tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+from stock import Stock
+from portfolio import Portfolio
+
+class DictStock:
+    def __init__(self, ticker, price, currency, units, percent, stockValue):
+        self._ticker = ticker
+        self._price = price
+        self._currency = currency
+        self._units = units
+        self._percent = percent
+        self._stockValue = stockValue
+
+def measure(build) -> tuple[object, int]:
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tickers = [f"t{i}" for i in range(n)]
+    dictStocks, dictSize = measure(lambda: [DictStock(t, 10.0, 'USD', 5, 0.001, 0.0) for t in tickers])
+    slotStocks, slotSize = measure(lambda: [Stock(t, 10.0, 'USD', 5, 0.001, 0.0) for t in tickers])
+    portfolio, portfolioSize = measure(lambda: Portfolio("bench", slotStocks, 0.0, 'USD'))
+    print(f"{n} holdings")
+    print(f"__dict__ objects: {dictSize / n:.0f} bytes/holding")
+    print(f"slotted Stock:    {slotSize / n:.0f} bytes/holding")
+    print(f"table + index:    {portfolioSize / n:.0f} bytes/holding on top")
+
+    start = time.perf_counter()
+    for s in dictStocks:
+        s._stockValue = s._price * s._units
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    portfolio.updateAllStockValues()
+    vectorized = time.perf_counter() - start
+    print(f"value update: per-object loop {loop * 1000:.2f}ms, columns {vectorized * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# Measures how long a fresh interpreter takes to import investool's
+# constants module with the network unavailable, and the whole CLI entry
+# point (which should not pull in yfinance or pandas).
+#   python benchmarks/bench_import.py [runs]
+import os, subprocess, sys, statistics, time
+
+INVESTOOL_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool")
+
+# requests is hidden so any network call made during import fails loudly
+IMPORT_CODE = """
+import sys, time
+sys.modules['requests'] = None
+start = time.perf_counter()
+import constants
+print(time.perf_counter() - start)
+"""
+
+CLI_IMPORT_CODE = """
+import sys, time
+start = time.perf_counter()
+import investool
+print(time.perf_counter() - start)
+"""
+
+def timeImport(code: str = IMPORT_CODE) -> float:
+    out = subprocess.run([sys.executable, "-c", code], cwd=INVESTOOL_DIR,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for label, code in (("constants", IMPORT_CODE), ("investool", CLI_IMPORT_CODE)):
+        times = [timeImport(code) for _ in range(runs)]
+        print(f"import {label}: median {statistics.median(times) * 1000:.2f}ms "
+              f"max {max(times) * 1000:.2f}ms over {runs} runs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# Persisting every trade of a scripted session on a large portfolio: a full
+# pickle rewrite per trade against one fsynced journal append per trade.
+#   python benchmarks/bench_journal.py [holdings] [trades]
+import os, sys, time, pickle, tempfile
+from pathlib import Path
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+from stock import Stock
+from portfolio import Portfolio
+from journal import TradeJournal
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    trades = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    directory = Path(tempfile.mkdtemp())
+    portfolio = Portfolio("bench", [Stock(f"t{i}", 10.0, 'USD', 1, 1 / n, 10.0) for i in range(n)], 0.0, 'USD')
+    tickers = portfolio.getStockTickers()
+
+    start = time.perf_counter()
+    for i in range(trades):
+        portfolio.getStock(tickers[i % n]).units += 1
+        with open(directory / "bench.pickle", 'wb') as f:
+            pickle.dump(portfolio, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+    rewrites = time.perf_counter() - start
+
+    journal = TradeJournal(directory / "bench.log")
+    start = time.perf_counter()
+    for i in range(trades):
+        portfolio.getStock(tickers[i % n]).units += 1
+        journal.append('trade', tickers[i % n], units=1)
+    appends = time.perf_counter() - start
+
+    print(f"{trades} trades on {n} holdings")
+    print(f"pickle rewrite per trade: {rewrites / trades * 1000:.2f}ms")
+    print(f"journal append per trade: {appends / trades * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Scaling benchmark for the vectorized rebalance engine against the original
+# per-stock Python planner, from 10 to 100k holdings. The last column is the
+# heap-based 'optimal' allocation mode.
+#   python benchmarks/bench_rebalance.py [sizes...]
+import os, sys, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+import numpy as np
+import rebalance
+
+SIZES = [10, 100, 1000, 10000, 100000]
+
+def pythonSellBuy(prices, units, targets, totalValue, liquidCash):
+    diff = {i: round((targets[i] * totalValue) / prices[i]) - units[i] for i in range(len(prices))}
+    sellList = sorted([x for x in diff.items() if x[1] < 0], key=lambda x: x[1])
+    buyList = sorted([x for x in diff.items() if x[1] >= 0], key=lambda x: x[1], reverse=True)
+    totalCash = liquidCash
+    for i, u in sellList:
+        totalCash += (-1 * u) * prices[i]
+    finalBuyList = []
+    for i, u in buyList:
+        if u * prices[i] > totalCash:
+            u = int(totalCash / prices[i])
+        totalCash -= u * prices[i]
+        finalBuyList.append((i, u))
+    return sellList + finalBuyList
+
+def best(fn, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main() -> None:
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    rng = np.random.default_rng(0)
+    print(f"{'holdings':>9} {'python':>10} {'numpy':>10} {'speedup':>8} {'optimal':>10}")
+    for n in sizes:
+        prices = rng.uniform(1, 500, n).round(2)
+        units = rng.integers(0, 200, n)
+        targets = rng.dirichlet(np.ones(n))
+        cash = 10000.0
+        totalValue = float(np.dot(prices, units)) + cash
+        lists = (prices.tolist(), units.tolist(), targets.tolist())
+
+        py = best(lambda: pythonSellBuy(*lists, totalValue, cash))
+        vec = best(lambda: rebalance.planSellBuy(prices, units, targets, totalValue, cash))
+        opt = best(lambda: rebalance.planSellBuy(prices, units, targets, totalValue, cash, mode='optimal'))
+        print(f"{n:>9} {py * 1000:>8.2f}ms {vec * 1000:>8.2f}ms {py / vec:>7.1f}x {opt * 1000:>8.2f}ms")
+
+if __name__ == "__main__":
+    main()
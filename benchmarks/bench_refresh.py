@@ -0,0 +1,42 @@
+# Compares a per-stock serial refresh with the batched refresh engine using a
+# local fake provider, so no network is involved.
+#   python benchmarks/bench_refresh.py [holdings] [latency seconds]
+import os, sys, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+from stock import Stock
+from portfolio import Portfolio
+from quotes import FakeQuoteProvider, Quote
+
+def makePortfolio(n: int) -> tuple[Portfolio, dict[str, Quote]]:
+    stocks = []
+    quotes = {}
+    for i in range(n):
+        ticker = f"t{i}"
+        stocks.append(Stock(ticker, 0.0, 'USD', 10, 1 / n, 0.0))
+        quotes[ticker] = Quote(10.0 + i % 50, 'USD')
+    return Portfolio("bench", stocks, 0.0, 'USD'), quotes
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    portfolio, quotes = makePortfolio(n)
+
+    # serial baseline: one provider round trip per stock
+    provider = FakeQuoteProvider(quotes, latency)
+    start = time.perf_counter()
+    for stock in portfolio.stocks:
+        stock.price = provider.getQuotes([stock.ticker]).quotes[stock.ticker].price
+    serial = time.perf_counter() - start
+
+    provider = FakeQuoteProvider(quotes, latency)
+    start = time.perf_counter()
+    result = portfolio.updateAllStockPrices(provider)
+    batched = time.perf_counter() - start
+
+    print(f"holdings={n} latency={latency}s")
+    print(f"serial:  {serial:.3f}s")
+    print(f"batched: {batched:.3f}s ({provider.calls} provider call(s), {len(result.errors)} errors)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Offline load test: refreshes, values and plans many portfolios against a
+# replayed recording. Record one with `investool.py --record day.jsonl.gz`;
+# without a file a market day of synthetic quotes is replayed instead.
+#   python benchmarks/bench_replay.py [recording] [portfolios] [speed] [latency seconds]
+import os, sys, time, random
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+import fxstore
+from stock import Stock
+from portfolio import Portfolio
+from manager import PortfolioManager
+from quotes import Quote
+from replay import Recording, ReplayQuoteProvider
+from synthetic import makePortfolio, PIVOT_RATES
+
+def syntheticDay(holdings: int = 500, minutes: int = 390, seed: int = 0) -> Recording:
+    # a refresh a minute over a trading day, prices take a random walk
+    rng = random.Random(seed)
+    _, quotes = makePortfolio(holdings, currencies=3, seed=seed)
+    recording = Recording(0.0)
+    recording.addRates(0.0, 'usd', '2024-03-01', PIVOT_RATES)
+    for minute in range(minutes):
+        quotes = {t: Quote(round(q.price * rng.uniform(0.995, 1.005), 2), q.currency) for t, q in quotes.items()}
+        recording.addQuotes(minute * 60.0, quotes)
+    return recording
+
+def main() -> None:
+    path = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] != "-" else None
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else 600.0
+    latency = float(sys.argv[4]) if len(sys.argv) > 4 else 0.0
+    recording = Recording.load(path) if path else syntheticDay()
+    provider = ReplayQuoteProvider(recording, speed, latency)
+    fxstore.setDefaultStore(fxstore.FxStore(fetcher=provider.fetchRates))
+
+    tickers = recording.tickers
+    rng = random.Random(1)
+    managers = []
+    for i in range(n):
+        chosen = rng.sample(tickers, min(len(tickers), 50))
+        stocks = [Stock(t, 0.0, recording.quoteAt(t, 0).currency or 'USD', rng.randint(0, 50), 1 / len(chosen), 0.0)
+                  for t in chosen]
+        managers.append(PortfolioManager(Portfolio(f"p{i}", stocks, 0.0, 'USD')))
+
+    print(f"{n} portfolios over {len(tickers)} recorded tickers, "
+          f"{recording.duration / 60:.0f} recorded minutes at x{speed}, latency {latency}s")
+    start = time.perf_counter()
+    plans = 0
+    while provider.position < recording.duration:
+        for manager in managers:
+            manager.currentPortfolio.updateAllStockPrices(provider)
+            manager.calculateRebalanceSellBuy(1000.0, manager.takeSnapshot(refresh=False))
+            plans += 1
+    elapsed = time.perf_counter() - start
+    print(f"{plans} refresh+plan rounds in {elapsed:.2f}s ({plans / elapsed:.0f}/s, {provider.calls} provider calls)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Bulk edits on a 10k-ticker portfolio: the old list scans against the
+# Portfolio ticker index.
+#   python benchmarks/bench_tickers.py [tickers]
+import os, sys, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+from stock import Stock
+from portfolio import Portfolio
+
+def makeStocks(n: int) -> list[Stock]:
+    return [Stock(f"t{i}", 10.0, 'USD', 1, 1 / n, 0.0) for i in range(n)]
+
+def listEdits(stocks: list[Stock]) -> None:
+    # what addStock/getStock/removeStock used to do
+    held = []
+    for stock in stocks:
+        if stock.ticker not in [s.ticker for s in held]:
+            held.append(stock)
+    for stock in stocks:
+        next(s for s in held if s.ticker == stock.ticker)
+    for stock in stocks:
+        for s in held:
+            if s.ticker == stock.ticker:
+                held.remove(s)
+                break
+
+def indexedEdits(stocks: list[Stock]) -> None:
+    portfolio = Portfolio("bench", [], 0.0, 'USD')
+    for stock in stocks:
+        portfolio.addStock(stock, updatePrice=False)
+    for stock in stocks:
+        portfolio.getStock(stock.ticker)
+    for stock in stocks:
+        portfolio.removeStock(stock.ticker)
+
+def timed(fn, stocks) -> float:
+    start = time.perf_counter()
+    fn(stocks)
+    return time.perf_counter() - start
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    stocks = makeStocks(n)
+    print(f"{n} adds, lookups and removes")
+    print(f"list scans:   {timed(listEdits, stocks):.3f}s")
+    print(f"ticker index: {timed(indexedEdits, stocks):.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Reproducible benchmark suite for the refresh, rebalance, persistence and
+# lookup hot paths on synthetic portfolios of several sizes. Quotes and FX
+# rates are fake, so runs are comparable across machines and commits.
+# Results are written as JSON; --compare reports changes against an older
+# result file and exits with 1 when a case got slower than --threshold.
+#   python benchmarks/suite.py [--sizes 10,100,1000] [--currencies 3]
+#                              [--repeat 5] [--output results.json]
+#                              [--compare old.json] [--threshold 1.25]
+import argparse, json, os, platform, statistics, subprocess, sys, tempfile, time
+from pathlib import Path
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+import fxstore
+import quotes
+from manager import PortfolioManager
+from portfoliostore import PortfolioStore
+from synthetic import makePortfolio, fakeProvider, fakeFxFetcher
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+def timeCase(fn, repeat: int, setup=None) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        if setup != None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+def runSize(size: int, currencies: int, repeat: int, directory: Path) -> dict[str, list[float]]:
+    portfolio, portfolioQuotes = makePortfolio(size, currencies)
+    quotes.setDefaultProvider(fakeProvider(portfolioQuotes))
+    fxstore.setDefaultStore(fxstore.FxStore(fetcher=fakeFxFetcher))
+
+    store = PortfolioStore(directory / f"store{size}.sqlite")
+    manager = PortfolioManager(portfolio, store)
+    manager.DEFAULT_PATH = directory
+    pickled = PortfolioManager(portfolio)
+    pickled.DEFAULT_PATH = directory
+    tickers = portfolio.getStockTickers()
+
+    results = {}
+    results['updateTotalPortfolioValue'] = timeCase(portfolio.updateTotalPortfolioValue, repeat)
+    snapshot = manager.takeSnapshot(refresh=False)
+    results['calculateRebalanceSellBuy'] = timeCase(lambda: manager.calculateRebalanceSellBuy(100.0, snapshot), repeat)
+    results['calculateRebalanceBuyOnly'] = timeCase(lambda: manager.calculateRebalanceBuyOnly(100.0, snapshot), repeat)
+    results['getStock'] = timeCase(lambda: [portfolio.getStock(t) for t in tickers], repeat)
+
+    manager.savePortfolio(overwrite=True)
+    trade = lambda: manager.buyStock(tickers[0], 1)
+    # the usual save: one trade since the last one
+    results['savePortfolio'] = timeCase(lambda: manager.savePortfolio(overwrite=True), repeat, trade)
+    results['loadPortfolio'] = timeCase(lambda: PortfolioManager(store=store).loadPortfolio(portfolio.portfolioName), repeat)
+    results['savePortfolio.pickle'] = timeCase(lambda: pickled.savePortfolio(overwrite=True), repeat)
+    results['loadPortfolio.pickle'] = timeCase(lambda: pickled.loadPortfolio(portfolio.portfolioName), repeat)
+    manager.journal.close()
+    return results
+
+def gitCommit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.realpath(__file__)), check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+def compare(results: list[dict], previous: list[dict], threshold: float) -> bool:
+    # prints the change of every case found in both runs, True if none regressed
+    old = {(r['case'], r['size']): r['best'] for r in previous}
+    ok = True
+    for r in results:
+        before = old.get((r['case'], r['size']))
+        if before == None or before == 0:
+            continue
+        ratio = r['best'] / before
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{r['case']:<28}{r['size']:>8}  {before * 1000:>10.3f}ms -> {r['best'] * 1000:>10.3f}ms  x{ratio:.2f}{flag}")
+    return ok
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--currencies", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio counted as a regression")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            for case, times in runSize(size, args.currencies, args.repeat, Path(directory)).items():
+                results.append({'case': case, 'size': size, 'currencies': args.currencies,
+                                'best': min(times), 'median': statistics.median(times), 'repeat': len(times)})
+                print(f"{case:<28}{size:>8}  best {min(times) * 1000:>10.3f}ms  median {statistics.median(times) * 1000:>10.3f}ms")
+
+    data = {'commit': gitCommit(), 'python': platform.python_version(), 'machine': platform.machine(),
+            'timestamp': time.time(), 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(data, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+        if not compare(results, previous, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Synthetic portfolios with a fake quote provider and fake FX rates, shared
+# by the benchmark scripts so nothing they time touches the network.
+import os, sys, random
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool"))
+
+from stock import Stock
+from portfolio import Portfolio
+from quotes import FakeQuoteProvider, Quote
+
+CURRENCIES = ['usd', 'cad', 'eur', 'gbp', 'jpy', 'chf', 'aud', 'sek']
+# units of each currency per USD, roughly
+PIVOT_RATES = {'usd': 1.0, 'cad': 1.36, 'eur': 0.92, 'gbp': 0.79, 'jpy': 151.0,
+               'chf': 0.9, 'aud': 1.52, 'sek': 10.5}
+
+def makePortfolio(holdings: int, currencies: int = 1, seed: int = 0,
+                  name: str = "synthetic") -> tuple[Portfolio, dict[str, Quote]]:
+    '''
+    A portfolio of `holdings` stocks spread over the first `currencies`
+    currencies, with random units and equal targets, and the quotes that
+    price it. The portfolio currency is the first currency. The same seed
+    always gives the same portfolio.
+    '''
+    rng = random.Random(seed)
+    codes = CURRENCIES[:max(1, min(currencies, len(CURRENCIES)))]
+    stocks = []
+    quotes = {}
+    for i in range(holdings):
+        ticker = f"s{i}"
+        currency = codes[i % len(codes)].upper()
+        stocks.append(Stock(ticker, 0.0, currency, rng.randint(0, 50), 1 / holdings, 0.0))
+        quotes[ticker] = Quote(round(rng.uniform(5, 500), 2), currency)
+    return Portfolio(name, stocks, 0.0, codes[0].upper()), quotes
+
+def fakeProvider(quotes: dict[str, Quote], latency: float = 0.0) -> FakeQuoteProvider:
+    return FakeQuoteProvider(quotes, latency)
+
+def fakeFxFetcher(base: str, day: str) -> dict[str, float]:
+    # fetcher for FxStore serving PIVOT_RATES, only USD is ever the pivot
+    if base != 'usd':
+        raise KeyError(base)
+    return dict(PIVOT_RATES)
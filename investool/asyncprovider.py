@@ -0,0 +1,136 @@
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import fetching
+import fxstore
+from quotes import Quote, RefreshResult
+from stock import fetchQuoteInfo
+from lazyimport import lazyImport
+
+yf = lazyImport("yfinance")
+
+# requests in flight at once for one getQuotes call
+DEFAULT_MAX_CONCURRENCY = 64
+
+class AsyncQuoteProvider(ABC):
+    '''
+    Base class for async quote and FX sources. getQuotes prices a list of
+    tickers the way QuoteProvider.getQuotes does, a ticker that could not
+    be priced goes into `errors`. getFx returns the rates of every
+    currency per unit of `base` on `day` (an ISO date, None for today) and
+    raises when they can't be fetched.
+    '''
+    @abstractmethod
+    async def getQuotes(self, tickers: list[str]) -> RefreshResult:
+        ...
+
+    @abstractmethod
+    async def getFx(self, base: str, day: str | None = None) -> dict[str, float]:
+        ...
+
+class DefaultAsyncProvider(AsyncQuoteProvider):
+    '''
+    yfinance quotes and jsdelivr exchange rates. Neither has an async
+    client, so each request runs on a bounded thread pool while the event
+    loop fans out and gathers them; requests still go through the shared
+    fetch layer (coalescing, rate limit, retries) and the HTTP cache.
+    '''
+    def __init__(self, maxConcurrency: int = DEFAULT_MAX_CONCURRENCY) -> None:
+        self.maxConcurrency = maxConcurrency
+        self._executor = ThreadPoolExecutor(max_workers=maxConcurrency, thread_name_prefix="investool-async")
+
+    def _fetchOne(self, ticker: str) -> Quote:
+        info = fetching.getDefaultFetcher().fetch(
+            ("quote", ticker.upper()), lambda: fetchQuoteInfo(yf.Ticker(ticker), "async"), "quote")
+        if info == None or info[0] == None:
+            raise LookupError(f"No price available for {ticker}.")
+        return Quote(info[0], info[1] or '')
+
+    async def getQuotes(self, tickers: list[str]) -> RefreshResult:
+        loop = asyncio.get_running_loop()
+        tickers = list(dict.fromkeys(tickers))
+        outcomes = await asyncio.gather(*(loop.run_in_executor(self._executor, self._fetchOne, ticker)
+                                          for ticker in tickers), return_exceptions=True)
+        result = RefreshResult()
+        for ticker, outcome in zip(tickers, outcomes):
+            if isinstance(outcome, Exception):
+                result.errors[ticker] = outcome
+            else:
+                result.quotes[ticker] = outcome
+        return result
+
+    async def getFx(self, base: str, day: str | None = None) -> dict[str, float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fxstore.fetchRates, base.lower(),
+                                          day or date.today().isoformat())
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+class FakeAsyncProvider(AsyncQuoteProvider):
+    '''
+    Serves quotes and pivot rates from dicts, sleeping `latency` seconds
+    per ticker on the event loop. Records the most requests it had in
+    flight at once. Used by tests and benchmarks.
+    '''
+    def __init__(self, quotes: dict[str, Quote], rates: dict[str, dict[str, float]] | None = None,
+                 latency: float = 0.0) -> None:
+        self.quotes = dict(quotes)
+        self.rates = dict(rates or {})
+        self.latency = latency
+        self.calls = 0
+        self.fxCalls = 0
+        self.maxInFlight = 0
+        self._inFlight = 0
+
+    async def _getOne(self, ticker: str) -> Quote:
+        self._inFlight += 1
+        self.maxInFlight = max(self.maxInFlight, self._inFlight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self._inFlight -= 1
+        if ticker not in self.quotes:
+            raise LookupError(f"No quote available for {ticker}.")
+        return self.quotes[ticker]
+
+    async def getQuotes(self, tickers: list[str]) -> RefreshResult:
+        self.calls += 1
+        tickers = list(dict.fromkeys(tickers))
+        outcomes = await asyncio.gather(*(self._getOne(t) for t in tickers), return_exceptions=True)
+        result = RefreshResult()
+        for ticker, outcome in zip(tickers, outcomes):
+            if isinstance(outcome, Exception):
+                result.errors[ticker] = outcome
+            else:
+                result.quotes[ticker] = outcome
+        return result
+
+    async def getFx(self, base: str, day: str | None = None) -> dict[str, float]:
+        self.fxCalls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return dict(self.rates[base.lower()])
+
+_defaultProvider: AsyncQuoteProvider | None = None
+
+def getDefaultProvider() -> AsyncQuoteProvider:
+    # created on first use so importing this module starts no threads
+    global _defaultProvider
+    if _defaultProvider == None:
+        _defaultProvider = DefaultAsyncProvider()
+    return _defaultProvider
+
+def setDefaultProvider(provider: AsyncQuoteProvider | None) -> None:
+    global _defaultProvider
+    _defaultProvider = provider
+
+async def warmFx(codes: list[str], provider: AsyncQuoteProvider | None = None, day: str | None = None) -> None:
+    # fetch the pivot rates the default FX store is missing for `codes`
+    store = fxstore.getDefaultStore()
+    if store.missingRates(codes, day):
+        provider = provider or getDefaultProvider()
+        store.putRates(await provider.getFx(store.pivot, day), day)
@@ -0,0 +1,180 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, TextIO
+
+import fxstore
+import metrics
+from manager import PortfolioManager
+from portfoliostore import PortfolioStore
+from quotes import Quote, QuoteProvider, RefreshResult, refreshStocks
+from snapshot import MarketSnapshot
+from stock import Stock
+from lazyimport import lazyImport
+
+requests = lazyImport("requests")
+
+BATCH_FORMATS = ('json', 'csv')
+
+class Trade(NamedTuple):
+    ticker: str
+    units: int
+    # price of one unit in the portfolio currency
+    price: float
+
+class BatchPlan(NamedTuple):
+    portfolio: str
+    currency: str
+    totalValue: float
+    liquidCash: float
+    cashRemaining: float
+    trades: list[Trade]
+    error: str | None = None
+
+class BatchSettings(NamedTuple):
+    # everything a worker needs, sent to each worker process once
+    storePath: str
+    directory: str
+    quotes: dict[str, tuple[float, str]]
+    pivotRates: dict[str, float] | None
+    liquidCash: float
+    buyOnly: bool
+    mode: str
+    # currency the pivot rates are quoted against
+    pivot: str = fxstore.DEFAULT_PIVOT
+
+def planPortfolio(store: PortfolioStore, settings: BatchSettings, name: str) -> BatchPlan:
+    '''
+    Load one portfolio, price it with the batch quotes and exchange rates
+    and plan its rebalance the way PortfolioManager would. Any error is
+    returned as a plan with `error` set, so one portfolio can't abort the
+    whole batch.
+    '''
+    # loading through a manager replays trades journaled since the save
+    manager = PortfolioManager(store=store)
+    manager.DEFAULT_PATH = Path(settings.directory)
+    currency = ''
+    try:
+        manager.loadPortfolio(name)
+        currency = manager.currentPortfolio.portfolioCurrency
+        return _planLoaded(manager, settings, name)
+    except Exception as e:
+        metrics.ERRORS.inc(site="batchPlan")
+        cash = settings.liquidCash
+        return BatchPlan(name, currency, 0.0, cash, cash, [], str(e) or type(e).__name__)
+    finally:
+        # the journal may be in use by an interactive session
+        if manager.journal != None:
+            manager.journal.close()
+
+def _batchRates(settings: BatchSettings) -> fxstore.FxStore:
+    # an FX store holding only the rates fetched for the whole batch, a
+    # currency they don't cover fails the portfolio instead of a download
+    def unavailable(base: str, day: str) -> dict[str, float]:
+        raise LookupError("No exchange rates for the holding currencies.")
+    store = fxstore.FxStore(fetcher=unavailable, pivot=settings.pivot)
+    if settings.pivotRates:
+        store.putRates(settings.pivotRates)
+    return store
+
+def _planLoaded(manager: PortfolioManager, settings: BatchSettings, name: str) -> BatchPlan:
+    # the batch quotes are applied like any refresh, then the portfolio is
+    # planned the same way the menus plan it
+    portfolio = manager.currentPortfolio
+    cash = settings.liquidCash
+    result = RefreshResult()
+    for ticker in portfolio.getStockTickers():
+        if ticker in settings.quotes:
+            result.quotes[ticker] = Quote(*settings.quotes[ticker])
+    portfolio.applyQuotes(result)
+
+    snapshot = MarketSnapshot.fromPortfolio(portfolio, _batchRates(settings))
+    if settings.buyOnly:
+        plan = manager.calculateRebalanceBuyOnly(cash, snapshot, settings.mode)
+    else:
+        plan = manager.calculateRebalanceSellBuy(cash, snapshot, settings.mode)
+    trades = [Trade(stock.ticker, units, snapshot.adjustedPrice(stock.ticker)) for stock, units in plan.items()]
+    return BatchPlan(name, portfolio.portfolioCurrency, snapshot.totalValue, cash,
+                     manager.cashRemaining(plan, cash), trades)
+
+_workerSettings: BatchSettings | None = None
+_workerStore: PortfolioStore | None = None
+
+def _initWorker(settings: BatchSettings) -> None:
+    global _workerSettings, _workerStore
+    _workerSettings = settings
+    _workerStore = PortfolioStore(settings.storePath)
+
+def _planInWorker(name: str) -> BatchPlan:
+    return planPortfolio(_workerStore, _workerSettings, name)
+
+def rebalanceAll(store: PortfolioStore, names: list[str] | None = None, liquidCash: float = 0.0,
+                 buyOnly: bool = False, mode: str = 'greedy', provider: QuoteProvider | None = None,
+                 refresh: bool = True, maxWorkers: int | None = None) -> tuple[list[BatchPlan], RefreshResult]:
+    '''
+    Plan a rebalance of every portfolio in `store` (or just `names`)
+    without any interaction. Quotes for the union of their tickers and the
+    exchange rates between all their currencies are fetched once, from the
+    store's index, before anything is loaded. Loading and planning each
+    portfolio then runs in a pool of worker processes, so the time taken
+    follows the number of cores rather than the number of portfolios.
+
+    Nothing is bought or sold. The plans are returned in the order of
+    `names` together with the result of the quote refresh. A portfolio
+    that can't be planned, for example because a holding has no price,
+    gets a plan with `error` set and no trades.
+    '''
+    if names == None:
+        names = store.listNames()
+
+    result = RefreshResult()
+    if refresh:
+        result = refreshStocks([Stock(ticker) for ticker in store.tickers(names)], provider)
+    quotes = {ticker: (quote.price, quote.currency) for ticker, quote in result.quotes.items()}
+
+    codes = list(dict.fromkeys(store.currencies(names) +
+                               [quote.currency.lower() for quote in result.quotes.values() if quote.currency]))
+    pivotRates = None
+    fx = fxstore.getDefaultStore()
+    if len(codes) > 1:
+        try:
+            matrix = fx.getMatrix(codes)
+            pivotRates = dict(zip(matrix.codes, matrix.pivotRates.tolist()))
+        except (requests.RequestException, LookupError):
+            pivotRates = None
+
+    settings = BatchSettings(str(store.path), str(PortfolioManager.DEFAULT_PATH), quotes, pivotRates,
+                             liquidCash, buyOnly, mode, fx.pivot)
+    workers = min(maxWorkers or os.cpu_count() or 1, len(names))
+    if workers <= 1:
+        return [planPortfolio(store, settings, name) for name in names], result
+    # a few chunks per worker keeps them busy without a round trip per name
+    chunksize = max(1, len(names) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(settings,)) as pool:
+        return list(pool.map(_planInWorker, names, chunksize=chunksize)), result
+
+def writeJson(plans: list[BatchPlan], out: TextIO) -> None:
+    data = [{**plan._asdict(), 'trades': [trade._asdict() for trade in plan.trades]} for plan in plans]
+    json.dump(data, out, indent=2)
+    out.write("\n")
+
+def writeCsv(plans: list[BatchPlan], out: TextIO) -> None:
+    # one row per trade, portfolios without trades still get a row
+    writer = csv.writer(out)
+    writer.writerow(['portfolio', 'currency', 'ticker', 'units', 'price', 'cashRemaining', 'error'])
+    for plan in plans:
+        if not plan.trades:
+            writer.writerow([plan.portfolio, plan.currency, '', '', '', plan.cashRemaining, plan.error or ''])
+        for trade in plan.trades:
+            writer.writerow([plan.portfolio, plan.currency, trade.ticker, trade.units, trade.price,
+                             plan.cashRemaining, ''])
+
+def writePlans(plans: list[BatchPlan], out: TextIO, format: str = 'json') -> None:
+    if format == 'json':
+        writeJson(plans, out)
+    elif format == 'csv':
+        writeCsv(plans, out)
+    else:
+        raise ValueError(f"Unknown output format {format}, expected one of {BATCH_FORMATS}.")
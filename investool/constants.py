@@ -1,11 +1,95 @@
-import requests
+import json
+import os
+import threading
+import time
+from pathlib import Path
 # https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@{date}/{apiVersion}/{endpoint}
 API_URL = "https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/{}"
 
-response = requests.get(API_URL.format("currencies.json"))
+PACKAGE_DIRECTORY = Path(__file__).absolute().parent
+CACHE_DIRECTORY = Path(os.environ.get("INVESTOOL_CACHE_DIR", PACKAGE_DIRECTORY.parent / "portfolios" / ".cache"))
 
-if response.status_code == 200:
-    json_data = response.json()
-    VALID_CURRENCIES = set(json_data.keys())
-else:
-    VALID_CURRENCIES = {'bone', 'theta', 'zwd', 'msol', 'ape', 'inj', 'lrd', 'ohm', 'shping', 'mwk', 'zar', 'syn', 'aergo', 'perp', 'gip', 'kuji', 'doge', 'hnl', 'mxn', 'badger', 'wif', 'rsd', 'nzd', 'ldo', 'azm', 'eur', 'ox', 'axs', 'dora', 'poly', 'wampl', 'bat', 'qar', 'grd', 'gns', 'meth', 'ens', 'ang', 'irr', 'ghs', 'plu', 'chf', 'yfi', 'tusd', 'dimo', 'near', 'xpf', 'mro', 'all', 'people', 'corgiai', 'pgk', 'rune', 'mina', 'dkk', 'azn', 'bhd', 'srg', 'iq', 'zmk', 'coq', 'ctx', 'fnsa', 'beam', 'jod', 'loka', 'drep', 'rndr', 'kava', 'metis', 'bonk', 'gyen', 'egp', 'nok', 'prom', 'pork', 'gmd', 'mdt', 'bit', 'tjs', 'ars', 'cuc', 'mavia', 'sdd', 'unfi', 'ron', 'sar', 'okb', 'gfi', 'gst', 'crc', 'coval', 'akt', 'blz', 'polyx', 'kmf', 'cvc', 'alcx', 'ugx', 'tao', 'arpa', 'cfg', 'ever', 'ttd', 'lkr', 'ordi', 'wbt', 'kpw', 'mir', 'xbt', 'rwf', 'idr', 'sll', 'rlb', 'btn', 'qtum', 'twt', 'btrst', 'wbtc', 'ftm', 'wld', 'gmx', 'awg', 'bsv', 'szl', 'flux', 'ocean', 'uma', 'nad', 'uqc', 'afn', 'gnt', 'kas', 'xcd', 'tor', 'bob', 'mx', 'mru', 'xlm', 'jup', 'usdc', 'avt', 'nlg', 'dem', 'ethdydx', 'usd', 'lsd', 'kub', 'etc', 'tel', 'fet', 'bora', 'cnh', 'apt', 'khr', 'rari', 'vanry', 'dnt', 'cdt', 'mln', 'yer', 'bdt', 'sbd', 'zmw', 'myr', 'icx', 'alusd', 'zec', 'dcr', 'esp', 'cwbtc', 'dai', 'elg', 'ils', 'ghst', 'lyx', 'mkd', 'strk', 'borg', 'busd', 'trl', 'alt', 'rai', 'forth', 'cdf', 'xmon', 'fei', 'sui', 'acs', 'snx', 'cake', 'nxm', 'rsr', 'stsol', 'uah', 'ooki', 'grt', 'glm', 'veb', 'eth', 'kes', 'btcb', 'trump', 'tone', 'aud', 'vnst', 'bef', 'enj', 'itl', 'kzt', 'pols', 'comai', 'qi', 'aave', 'nexo', 'omi', 'flow', 'chr', 'strax', 'lyxe', 'gtc', 'pyr', 'waxl', 'nmr', 'inv', 'bam', 'eos', 'strd', 'bnb', 'top', 'btc', 'lvl', 'gtq', 'hkd', 'gnf', 't', 'svc', 'qnt', 'bal', 'popcat', 'pepe', 'xem', 'bdx', 'bld', 'sdg', 'bbd', 'floki', 'mpl', 'etb', 'celo', 'savax', 'gala', 'ves', 'vef', 'gno', 'meme', 'reth', 'mzn', 'vnd', 'cspr', 'ltc', 'ondo', 'seam', 'fil', 'rseth', 'cad', 'edu', 'nkn', 'luna', 'apl', 'xaf', 'rbn', 'czk', 'aevo', 'one', 'rub', 'sol', 'ust', 'id', 'mask', 'om', 'pla', 'sweth', 'xpd', 'gf', 'jst', 'wbeth', 'htg', 'gel', 'loom', 'mkusd', 'sfrxeth', 'brl', 'cgld', 'dag', 'dao', 'voxel', 'vuv', 'rol', 'uzs', 'sushi', 'shib', 'mana', 'ved', 'sek', 'kgs', 'paal', 'bake', 'band', 'rss3', 'apex', 'lbp', 'ray', 'bch', 'ksm', 'ngn', 'bnt', 'xpt', 'fim', 'pen', 'xau', 'bzd', 'glmr', 'kda', 'ddx', 'pendle', 'ast', '1inch', 'cfx', 'snt', 'eth2', 'jep', 'lsl', 'rlc', 'bond', 'pln', 'xaut', 'ctsi', 'mmk', 'pokt', 'frxeth', 'cvx', 'ilv', 'lcx', 'mrs', 'ftt', 'pab', 'srd', 'uyu', 'babydoge', 'cheel', 'gyd', 'zeta', 'neo', 'klay', 'mobile', 'php', 'pandora', 'shp', 'lusd', 'high', 'xag', 'cop', 'time', 'pixel', 'krw', 'wcfg', 'try', 'ntrn', 'jpy', 'dym', 'ela', 'rad', 'orca', 'iep', 'chz', 'dzd', 'sos', 'aed', 'omr', 'xtz', '00', 'bsd', 'cro', 'tribe', 'ada', 'aurora', 'portal', 'omg', 'gxc', 'yfii', 'dop', 'hot', 'coti', 'aleph', 'mkr', 'ton', 'fx', 'amp', 'ladys', 'celr', 'gal', 'mop', 'alice', 'lrc', 'mvr', 'media', 'farm', 'audio', 'mdl', 'ethx', 'frf', 'canto', 'zen', 'cny', 'lunc', 'trx', 'xch', 'tia', 'auction', 'ogn', 'mav', 'rpl', 'gusd', 'sync', 'inr', 'pyusd', 'gbp', 'ceth', 'tvd', 'xrp', 'mona', 'mur', 'leo', 'xai', 'ltl', 'muse', 'hft', 'dar', 'wemix', 'usdd', 'index', 'spell', 'scr', 'sylo', 'weeth', 'ghc', 'gas', 'ark', 'mtl', 'mnde', 'ggp', 'sgd', 'tvk', 'dyp', 'grin', 'iqd', 'kwd', 'mgf', 'png', 'fjd', 'prq', 'fox', 'arkm', 'byn', 'pundix', '$myro', 'pyth', 'slp', 'lak', 'blur', 'repv2', 'imx', 'dexe', 'jto', 'cup', 'lit', 'stx', 'tfuel', 'trb', 'kyd', 'okt', 'quick', 'keep', 'osmo', 'arb', 'bnd', 'skk', 'ssv', 'isk', 'ar', 'usde', 'spa', 'stg', 'ctc', 'lyd', 'ttt', 'mzm', 'prime', 'atom', 'op', 'topia', 'xdr', 'tkx', 'crpt', 'boba', 'stn', 'cyp', 'clp', 'mbx', 'ats', 'ht', 'bif', 'upi', 'hbtc', 'comp', 'nu', 'mubi', 'rep', 'astr', 'agi', 'cqt', 'npr', 'iota', 'eek', 'ethw', 'tmm', 'honey', 'abt', 'kcs', 'nft', 'sit', 'mga', 'rare', 'nest', '$wen', 'fdusd', 'agix', 'hnt', 'movr', 'ont', 'waves', 'osak', 'bmd', 'gaj', 'elf', 'sc', 'vr', 'pond', 'zrx', 'nio', 'whrh', 'avax', '0x0', 'oas', 'ygg', 'usdt', 'fis', 'sfund', 'vet', 'ustc', 'tnd', 'lqty', 'c98', 'nos', 'lsk', 'joe', 'pkr', 'twd', 'xec', 'steth', 'multi', 'tmt', 'bico', 'dot', 'ckb', 'iotx', 'alex', 'orn', 'euroc', 'gmt', 'ren', 'sxp', 'thb', 'asm', 'mxv', 'imp', 'waxp', 'sgb', 'xvs', 'azero', 'dext', 'link', 'sle', 'fort', 'iost', 'gods', 'powr', 'zwl', 'hrk', 'xcn', 'vtho', 'matic', 'shdw', 'djf', 'core', 'bome', 'manta', 'pro', 'vgx', 'api3', 'bgb', 'bsw', 'ssp', 'hopr', 'nct', 'skl', 'rose', 'btt', 'xof', 'sfp', 'fida', 'edum', 'cve', 'tzs', 'axl', 'woo', 'frax', 'req', 'usdp', 'egld', 'mco2', 'neon', 'bigtime', 'paxg', 'ata', 'lseth', 'xmr', 'olas', 'ach', 'rly', '1000sats', 'bgn', 'sei', 'mxc', 'uos', 'alph', 'ant', 'cdai', 'ftn', 'std', 'mog', 'super', 'render', 'oxt', 'dash', 'clv', 'agld', 'jasmy', 'flr', 'spl', 'orai', 'luf', 'pax', 'pyg', 'ankr', 'aero', 'sand', 'dydx', 'sats', 'pte', 'math', 'wluna', 'aoa', 'amd', 'eeth', 'fxs', 'swftc', 'qsp', 'cbeth', 'velo', 'aioz', 'fkp', 'xyo', 'algo', 'lpt', 'suku', 'idex', 'mad', 'magic', 'btc.b', 'jmd', 'rif', 'rvn', 'rgt', 'zil', 'mnt', 'xdc', 'storj', 'uni', 'gt', 'icp', 'crv', 'val', 'btg', 'dfi', 'bwp', 'syp', 'tet', 'deso', 'huf', 'knc', 'byr', 'dia', 'krl', 'hbar', 'ai', 'trac', 'vara', 'wst', 'tru', 'ern', 'xrd'}
+# bump when the layout of the on-disk currency cache changes
+CURRENCY_CACHE_VERSION = 1
+CURRENCY_CACHE_FILE = f"currencies.v{CURRENCY_CACHE_VERSION}.json"
+CURRENCY_CACHE_MAX_AGE = 24 * 60 * 60
+# shipped copy of currencies.json used until the cache has been filled
+BUNDLED_CURRENCIES_FILE = PACKAGE_DIRECTORY / "currencies.json"
+
+_validCurrencies: set[str] | None = None
+_revalidating = threading.Lock()
+# the last background revalidation started
+_revalidation: threading.Thread | None = None
+
+def _readCache(path: Path) -> dict | None:
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != CURRENCY_CACHE_VERSION:
+        return None
+    return data
+
+def _writeCache(path: Path, currencies: set[str]) -> None:
+    data = {"version": CURRENCY_CACHE_VERSION, "fetchedAt": time.time(), "currencies": sorted(currencies)}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmpPath = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmpPath, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmpPath, path)
+
+def fetchCurrencies() -> set[str] | None:
+    import requests
+    import httpcache
+    try:
+        return set(httpcache.getJson(API_URL.format("currencies.json"), timeout=10).keys())
+    except (requests.RequestException, ValueError):
+        return None
+
+def revalidateCurrencies() -> None:
+    global _validCurrencies
+    # only one revalidation at a time, later callers just skip
+    if not _revalidating.acquire(blocking=False):
+        return
+    try:
+        currencies = fetchCurrencies()
+        if currencies:
+            _validCurrencies = currencies
+            try:
+                _writeCache(CACHE_DIRECTORY / CURRENCY_CACHE_FILE, currencies)
+            except OSError:
+                pass
+    finally:
+        _revalidating.release()
+
+def getValidCurrencies() -> set[str]:
+    '''
+    Currency codes accepted by the currency API. Served from the on-disk
+    cache (or the bundled list) without waiting on the network; when the
+    cache is missing or older than a day it is refreshed on a background
+    thread.
+    '''
+    global _validCurrencies, _revalidation
+    if _validCurrencies != None:
+        return _validCurrencies
+
+    cached = _readCache(CACHE_DIRECTORY / CURRENCY_CACHE_FILE)
+    if cached != None:
+        _validCurrencies = set(cached["currencies"])
+        stale = time.time() - cached.get("fetchedAt", 0) > CURRENCY_CACHE_MAX_AGE
+    else:
+        with open(BUNDLED_CURRENCIES_FILE) as f:
+            _validCurrencies = set(json.load(f))
+        stale = True
+
+    if stale:
+        _revalidation = threading.Thread(target=revalidateCurrencies, daemon=True)
+        _revalidation.start()
+    return _validCurrencies
+
+def __getattr__(name: str):
+    # VALID_CURRENCIES is loaded on first use instead of at import
+    if name == "VALID_CURRENCIES":
+        return getValidCurrencies()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
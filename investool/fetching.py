@@ -0,0 +1,175 @@
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Hashable, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+# requests per second over every thread, and how many may go out at once
+DEFAULT_RATE = float(os.environ.get("INVESTOOL_FETCH_RATE", 10))
+DEFAULT_BURST = float(os.environ.get("INVESTOOL_FETCH_BURST", 20))
+DEFAULT_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 30.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+RETRIES = metrics.counter("investool_fetch_retries_total", "Fetches retried after a transient error, by kind.")
+COALESCED = metrics.counter("investool_fetch_coalesced_total", "Fetches served by a request already in flight, by kind.")
+RATE_LIMIT_WAIT = metrics.histogram("investool_rate_limit_wait_seconds", "Time spent waiting for the rate limit, by kind.")
+
+def isRetryable(error: Exception) -> bool:
+    '''
+    Connection errors, timeouts, throttling (429) and server errors are
+    worth retrying, anything else fails at once. Only modules that are
+    already imported are looked at, so this never imports requests or
+    yfinance.
+    '''
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    requests = sys.modules.get("requests")
+    if requests != None:
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if isinstance(error, requests.HTTPError):
+            response = error.response
+            return response is not None and response.status_code in RETRY_STATUS_CODES
+    rateLimit = getattr(sys.modules.get("yfinance.exceptions"), "YFRateLimitError", None)
+    return rateLimit != None and isinstance(error, rateLimit)
+
+def retryAfter(error: Exception) -> float:
+    # seconds asked for by a Retry-After header, 0 without one
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    try:
+        return max(0.0, float(value)) if value != None else 0.0
+    except ValueError:
+        return 0.0
+
+def retry(fn: Callable[[], T], attempts: int = DEFAULT_ATTEMPTS, baseDelay: float = DEFAULT_BASE_DELAY,
+          maxDelay: float = DEFAULT_MAX_DELAY, retryable: Callable[[Exception], bool] = isRetryable,
+          sleep: Callable[[float], None] = time.sleep, rng: random.Random | None = None, kind: str = "http") -> T:
+    '''
+    Call fn until it succeeds, at most `attempts` times. After a retryable
+    error it waits a random time between 0 and baseDelay * 2**attempt
+    (capped at maxDelay, "full jitter") so callers throttled together
+    don't all come back together. A Retry-After header is honoured up to
+    maxDelay. The last error is raised as is.
+    '''
+    rng = rng or random
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts - 1 or not retryable(e):
+                raise
+            delay = rng.uniform(0, min(maxDelay, baseDelay * 2 ** attempt))
+            delay = min(maxDelay, max(delay, retryAfter(e)))
+            RETRIES.inc(kind=kind)
+            sleep(delay)
+
+class TokenBucket:
+    '''
+    Allows `rate` acquisitions per second on average and up to `capacity`
+    at once, shared by every thread.
+    '''
+    def __init__(self, rate: float, capacity: float | None = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive.")
+        self.rate = rate
+        self.capacity = capacity if capacity != None else max(1.0, rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        # blocks until `tokens` are available, returns the seconds waited
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+class Coalescer:
+    '''
+    Runs one call per key at a time: callers asking for a key that is
+    already being fetched wait for that fetch and share its result or
+    error instead of making their own request.
+    '''
+    def __init__(self) -> None:
+        self._inflight: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T], kind: str = "http") -> T:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future == None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            COALESCED.inc(kind=kind)
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+class Fetcher:
+    '''
+    The path every quote and FX request takes: duplicate requests in
+    flight are coalesced, each attempt takes a token from a bucket shared
+    by the whole process and transient errors are retried with jittered
+    exponential backoff. A rate of None disables the limit.
+    '''
+    def __init__(self, rate: float | None = DEFAULT_RATE, burst: float | None = DEFAULT_BURST,
+                 attempts: int = DEFAULT_ATTEMPTS, baseDelay: float = DEFAULT_BASE_DELAY,
+                 maxDelay: float = DEFAULT_MAX_DELAY, retryable: Callable[[Exception], bool] = isRetryable,
+                 sleep: Callable[[float], None] = time.sleep, rng: random.Random | None = None) -> None:
+        self.bucket = TokenBucket(rate, burst, sleep=sleep) if rate else None
+        self.coalescer = Coalescer()
+        self.attempts = attempts
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.retryable = retryable
+        self._sleep = sleep
+        self._rng = rng
+
+    def fetch(self, key: Hashable, fn: Callable[[], T], kind: str = "http") -> T:
+        def attempt() -> T:
+            if self.bucket != None:
+                waited = self.bucket.acquire()
+                if waited:
+                    RATE_LIMIT_WAIT.observe(waited, kind=kind)
+            return fn()
+        return self.coalescer.do(key, lambda: retry(attempt, self.attempts, self.baseDelay, self.maxDelay,
+                                                    self.retryable, self._sleep, self._rng, kind), kind)
+
+_defaultFetcher = Fetcher()
+
+def getDefaultFetcher() -> Fetcher:
+    return _defaultFetcher
+
+def setDefaultFetcher(fetcher: Fetcher) -> None:
+    global _defaultFetcher
+    _defaultFetcher = fetcher
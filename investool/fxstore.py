@@ -0,0 +1,199 @@
+import sqlite3
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from constants import API_URL
+import metrics
+import fetching
+import httpcache
+from lazyimport import lazyImport
+
+requests = lazyImport("requests")
+
+DEFAULT_FILE_NAME = ".fxstore.sqlite"
+DEFAULT_PIVOT = "usd"
+DATED_API_URL = "https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@{}/v1/{}"
+
+FX_SECONDS = metrics.histogram("investool_fx_fetch_seconds", "Time to download the exchange rates of a date.")
+
+def fetchRates(base: str, day: str) -> dict[str, float]:
+    endpoint = "currencies/" + base + ".json"
+    if day == date.today().isoformat():
+        url = API_URL.format(endpoint)
+    else:
+        url = DATED_API_URL.format(day, endpoint)
+
+    def get() -> dict[str, float]:
+        metrics.HTTP_REQUESTS.inc(kind="fx")
+        # pooled and revalidated, throttling and server errors raise an
+        # HTTPError that is retried
+        with FX_SECONDS.time():
+            return httpcache.getJson(url, timeout=10)[base]
+
+    try:
+        return fetching.getDefaultFetcher().fetch(("fx", url), get, "fx")
+    except requests.RequestException:
+        metrics.ERRORS.inc(site="fetchRates")
+        raise
+
+class FxMatrix:
+    '''
+    Exchange rates between a fixed set of currencies, derived from the rates
+    of a single pivot currency. `matrix[i, j]` converts one unit of
+    `codes[i]` into `codes[j]`.
+    '''
+    def __init__(self, codes: list[str], pivotRates: np.ndarray) -> None:
+        self.codes = codes
+        self.index = {code: i for i, code in enumerate(codes)}
+        self.pivotRates = pivotRates
+        self._matrix: np.ndarray | None = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.outer(1.0 / self.pivotRates, self.pivotRates)
+        return self._matrix
+
+    def rate(self, base: str, quote: str) -> float:
+        return float(self.pivotRates[self.index[quote.lower()]] / self.pivotRates[self.index[base.lower()]])
+
+    def ratesInto(self, quote: str) -> np.ndarray:
+        # rate from every currency in `codes` into `quote`, aligned with codes
+        return self.pivotRates[self.index[quote.lower()]] / self.pivotRates
+
+class FxStore:
+    '''
+    Exchange rates shared by every portfolio, keyed by (date, base).
+
+    Only the pivot currency is fetched: one download per date covers every
+    pair, cross rates are triangulated through the pivot. Fetched rates are
+    held in memory as plain floats and only the rates that were actually
+    used are written to disk, so past dates never need to be fetched again
+    and the file stays small. Without a path the store lives in memory only.
+    '''
+    def __init__(self, path: Path | None = None,
+                 fetcher: Callable[[str, str], dict[str, float]] = fetchRates,
+                 pivot: str = DEFAULT_PIVOT) -> None:
+        self.path = Path(path) if path != None else None
+        self.fetcher = fetcher
+        self.pivot = pivot.lower()
+        self._rates: dict[tuple[str, str], dict[str, float]] = {}
+        self._persisted: set[tuple[str, str, str]] = set()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        if self.path != None:
+            with self._connection() as conn:
+                conn.execute("""CREATE TABLE IF NOT EXISTS fx_rates (
+                                    date TEXT NOT NULL,
+                                    base TEXT NOT NULL,
+                                    quote TEXT NOT NULL,
+                                    rate REAL NOT NULL,
+                                    PRIMARY KEY (date, base, quote)) WITHOUT ROWID""")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn == None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _loadFromDisk(self, key: tuple[str, str]) -> dict[str, float]:
+        if self.path == None:
+            return {}
+        rows = self._connection().execute(
+            "SELECT quote, rate FROM fx_rates WHERE date = ? AND base = ?", key).fetchall()
+        for quote, _ in rows:
+            self._persisted.add((*key, quote))
+        return dict(rows)
+
+    def _persist(self, key: tuple[str, str], quotes: list[str], rates: dict[str, float]) -> None:
+        if self.path == None:
+            return
+        new = [(*key, q, rates[q]) for q in quotes if (*key, q) not in self._persisted]
+        if not new:
+            return
+        with self._connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO fx_rates VALUES (?, ?, ?, ?)", new)
+        self._persisted.update(row[:3] for row in new)
+
+    def _pivotRates(self, day: str | None, quotes: list[str]) -> dict[str, float]:
+        # pivot rates for `day` covering every code in quotes. The download
+        # runs without the lock so readers of rates already held never wait
+        # on the network.
+        key = (day or date.today().isoformat(), self.pivot)
+        quotes = [q for q in quotes if q != self.pivot]
+        with self._lock:
+            rates = self._rates.get(key)
+            if rates == None:
+                rates = self._rates[key] = self._loadFromDisk(key)
+            missing = any(q not in rates for q in quotes)
+        if missing:
+            metrics.CACHE_REQUESTS.inc(cache="fx", result="miss")
+            fetched = self.fetcher(self.pivot, key[0])
+            with self._lock:
+                rates.update(fetched)
+        else:
+            metrics.CACHE_REQUESTS.inc(cache="fx", result="hit")
+        with self._lock:
+            self._persist(key, quotes, rates)
+        return rates
+
+    def putRates(self, rates: dict[str, float], day: str | None = None) -> None:
+        # pivot rates fetched elsewhere, e.g. by an async provider, are kept
+        # on disk like the ones this store fetched itself
+        key = (day or date.today().isoformat(), self.pivot)
+        with self._lock:
+            if key not in self._rates:
+                self._rates[key] = self._loadFromDisk(key)
+            self._rates[key].update(rates)
+            self._persist(key, [q for q in rates if q != self.pivot], self._rates[key])
+
+    def missingRates(self, codes: list[str], day: str | None = None) -> list[str]:
+        # codes the store would have to fetch rates for
+        return [code.lower() for code in codes
+                if code.lower() != self.pivot and not self.hasRates(code, day)]
+
+    def hasRates(self, currency: str, day: str | None = None) -> bool:
+        currency = currency.lower()
+        key = (day or date.today().isoformat(), self.pivot)
+        with self._lock:
+            if key not in self._rates:
+                self._rates[key] = self._loadFromDisk(key)
+            rates = self._rates[key]
+            return len(rates) > 0 and (currency == self.pivot or currency in rates)
+
+    def getRate(self, base: str, quote: str, day: str | None = None) -> float:
+        # ex: USD -> CAD being 1.34 means for 1 USD you get 1.34 CAD
+        base = base.lower()
+        quote = quote.lower()
+        if base == quote:
+            return 1.0
+        rates = self._pivotRates(day, [base, quote])
+        pivotToBase = 1.0 if base == self.pivot else rates[base]
+        pivotToQuote = 1.0 if quote == self.pivot else rates[quote]
+        return pivotToQuote / pivotToBase
+
+    def getMatrix(self, codes: list[str], day: str | None = None) -> FxMatrix:
+        codes = list(dict.fromkeys(code.lower() for code in codes))
+        rates = self._pivotRates(day, codes)
+        pivotRates = np.array([1.0 if c == self.pivot else rates[c] for c in codes])
+        return FxMatrix(codes, pivotRates)
+
+    def clearMemory(self) -> None:
+        with self._lock:
+            self._rates.clear()
+            self._persisted.clear()
+
+_defaultStore = FxStore()
+
+def getDefaultStore() -> FxStore:
+    return _defaultStore
+
+def setDefaultStore(store: FxStore) -> None:
+    global _defaultStore
+    _defaultStore = store
@@ -0,0 +1,153 @@
+import numpy as np
+
+from stock import Stock
+
+class HoldingsTable:
+    '''
+    Columnar storage for the holdings of one portfolio. Price, units, target
+    percent and value are NumPy columns and every Stock in the portfolio is
+    a view over one row, so vectorized code can read and write the columns
+    directly without copying.
+
+    Rows stay in insertion order. Removing a holding only marks its row dead;
+    dead rows are compacted away the next time the columns are read.
+    '''
+    def __init__(self, capacity: int = 16) -> None:
+        capacity = max(capacity, 1)
+        self._price = np.zeros(capacity, dtype=np.float64)
+        self._units = np.zeros(capacity, dtype=np.int64)
+        self._percent = np.zeros(capacity, dtype=np.float64)
+        self._value = np.zeros(capacity, dtype=np.float64)
+        # when each price was fetched (epoch seconds), 0 for never
+        self._fetched = np.zeros(capacity, dtype=np.float64)
+        # currencies are stored as indexes into currencyCodes
+        self._currency = np.zeros(capacity, dtype=np.int32)
+        self._codes: list[str] = []
+        self._codeIndex: dict[str, int] = {}
+        self._stocks: list[Stock | None] = []
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._stocks) - self._dead
+
+    def _grow(self) -> None:
+        capacity = len(self._price) * 2
+        for name in ('_price', '_units', '_percent', '_value', '_fetched', '_currency'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def append(self, stock: Stock) -> int:
+        # a stock can only be a view over one table at a time
+        if stock._table != None:
+            raise ValueError(f"{stock.ticker} already belongs to a portfolio.")
+        row = len(self._stocks)
+        if row == len(self._price):
+            self._grow()
+        self._price[row] = stock.price
+        self._units[row] = stock.units
+        self._percent[row] = stock.percent
+        self._value[row] = stock.stockValue
+        self._fetched[row] = 0.0
+        self._stocks.append(stock)
+        self.setCurrency(row, stock.currency)
+        stock._attach(self, row)
+        return row
+
+    def setCurrency(self, row: int, currency: str) -> None:
+        code = currency.lower() if isinstance(currency, str) else currency
+        index = self._codeIndex.get(code)
+        if index == None:
+            index = self._codeIndex[code] = len(self._codes)
+            self._codes.append(code)
+        self._currency[row] = index
+
+    def setFetchedAt(self, row: int, fetchedAt: float) -> None:
+        # when the price in `row` was fetched, 0 for never
+        self._fetched[row] = fetchedAt
+
+    def remove(self, stock: Stock) -> None:
+        if stock._table is not self:
+            raise ValueError(f"{stock.ticker} is not in this table.")
+        row = stock._row
+        stock._detach()
+        self._stocks[row] = None
+        self._dead += 1
+
+    def compact(self) -> None:
+        if self._dead == 0:
+            return
+        keep = np.array([i for i, stock in enumerate(self._stocks) if stock is not None], dtype=np.int64)
+        n = len(keep)
+        for column in (self._price, self._units, self._percent, self._value, self._fetched, self._currency):
+            column[:n] = column[keep]
+        self._stocks = [self._stocks[i] for i in keep.tolist()]
+        for row, stock in enumerate(self._stocks):
+            stock._row = row
+        self._dead = 0
+
+    def _column(self, column: np.ndarray) -> np.ndarray:
+        self.compact()
+        return column[:len(self._stocks)]
+
+    @property
+    def prices(self) -> np.ndarray:
+        return self._column(self._price)
+
+    @property
+    def units(self) -> np.ndarray:
+        return self._column(self._units)
+
+    @property
+    def percents(self) -> np.ndarray:
+        return self._column(self._percent)
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._column(self._value)
+
+    @property
+    def fetchedAt(self) -> np.ndarray:
+        return self._column(self._fetched)
+
+    @property
+    def currencyIndex(self) -> np.ndarray:
+        # per row index into currencyCodes
+        return self._column(self._currency)
+
+    @property
+    def currencyCodes(self) -> list[str]:
+        # lower case codes, may include codes no row uses anymore
+        return self._codes
+
+    @property
+    def stocks(self) -> list[Stock]:
+        self.compact()
+        return list(self._stocks)
+
+    @property
+    def tickers(self) -> list[str]:
+        return [stock.ticker for stock in self.stocks]
+
+    @property
+    def currencies(self) -> list[str]:
+        return [stock.currency for stock in self.stocks]
+
+    @classmethod
+    def fromStocks(cls, stocks: list[Stock]) -> "HoldingsTable":
+        # fills every column at once instead of appending row by row
+        for stock in stocks:
+            if stock._table != None:
+                raise ValueError(f"{stock.ticker} already belongs to a portfolio.")
+        n = len(stocks)
+        table = cls(n)
+        table._price[:n] = [stock._price for stock in stocks]
+        table._units[:n] = [stock._units for stock in stocks]
+        table._percent[:n] = [stock._percent for stock in stocks]
+        table._value[:n] = [stock._stockValue for stock in stocks]
+        for row, stock in enumerate(stocks):
+            table.setCurrency(row, stock._currency)
+            stock._attach(table, row)
+        table._stocks = list(stocks)
+        return table
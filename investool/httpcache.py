@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+import metrics
+from lazyimport import lazyImport
+
+requests = lazyImport("requests")
+
+DEFAULT_FILE_NAME = ".httpcache.sqlite"
+# connections kept open per host, enough for the refresh thread pools
+POOL_SIZE = 16
+
+class CachedResponse(NamedTuple):
+    etag: str | None
+    lastModified: str | None
+    body: bytes
+    fetchedAt: float
+
+class HttpCache:
+    '''
+    Response bodies of the currency API with their ETag and Last-Modified
+    validators, shared by every investool process. A cached URL is
+    revalidated with a conditional GET, so an unchanged response costs a
+    304 with no body instead of the full download.
+    '''
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS http_cache (
+                                url TEXT PRIMARY KEY,
+                                etag TEXT,
+                                lastModified TEXT,
+                                body BLOB NOT NULL,
+                                fetchedAt REAL NOT NULL)""")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn == None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, url: str) -> CachedResponse | None:
+        row = self._connection().execute(
+            "SELECT etag, lastModified, body, fetchedAt FROM http_cache WHERE url = ?", (url,)).fetchone()
+        if row == None:
+            return None
+        etag, lastModified, body, fetchedAt = row
+        return CachedResponse(etag, lastModified, zlib.decompress(body), fetchedAt)
+
+    def put(self, url: str, etag: str | None, lastModified: str | None, body: bytes) -> None:
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?, ?)",
+                         (url, etag, lastModified, zlib.compress(body), time.time()))
+
+    def touch(self, url: str) -> None:
+        # the cached body was revalidated
+        with self._connection() as conn:
+            conn.execute("UPDATE http_cache SET fetchedAt = ? WHERE url = ?", (time.time(), url))
+
+    def clear(self) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM http_cache")
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM http_cache").fetchone()[0]
+
+_session = None
+_sessionLock = threading.Lock()
+
+def getSession() -> "requests.Session":
+    # one pooled session per process, connections are reused across calls
+    # and threads instead of a new TCP and TLS handshake per request
+    global _session
+    with _sessionLock:
+        if _session == None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+def getJson(url: str, timeout: float = 10, cache: HttpCache | None = None) -> object:
+    '''
+    GET `url` as JSON over the shared session. With a cache (or the
+    default cache) the stored validators are sent along and a 304 is
+    answered from the stored body. Errors raise requests exceptions.
+    '''
+    if cache == None:
+        cache = _defaultCache
+    entry = cache.get(url) if cache != None else None
+    headers = {}
+    if entry != None:
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.lastModified:
+            headers["If-Modified-Since"] = entry.lastModified
+
+    response = getSession().get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and entry != None:
+        metrics.CACHE_REQUESTS.inc(cache="http", result="hit")
+        cache.touch(url)
+        return json.loads(entry.body)
+    response.raise_for_status()
+    if response.status_code != 200:
+        raise requests.RequestException("There was an error with getting the request.")
+
+    body = response.content
+    if cache != None:
+        metrics.CACHE_REQUESTS.inc(cache="http", result="miss")
+        etag = response.headers.get("ETag")
+        lastModified = response.headers.get("Last-Modified")
+        if etag or lastModified:
+            cache.put(url, etag, lastModified, body)
+    return json.loads(body)
+
+_defaultCache: HttpCache | None = None
+
+def getDefaultCache() -> HttpCache | None:
+    return _defaultCache
+
+def setDefaultCache(cache: HttpCache | None) -> None:
+    global _defaultCache
+    _defaultCache = cache
@@ -1,5 +1,20 @@
+import argparse
+import datetime
+import sys
 import ui
 from manager import PortfolioManager
+from pathlib import Path
+import quotecache
+import fxstore
+import httpcache
+import portfoliostore
+import batch
+import rebalance
+import metrics
+import profiling
+import quotes
+import replay
+from refresher import BackgroundRefresher
 import os
 
 def setup() -> bool:
@@ -10,13 +25,154 @@ def setup() -> bool:
     except OSError:
         print("There was an error creating or checking for directory. Exiting.")
         exit(1)
+    # share fetched quotes with every other investool process
+    cachePath = Path(PortfolioManager.DEFAULT_PATH, quotecache.DEFAULT_FILE_NAME)
+    cache = quotecache.QuoteCache(cachePath)
+    quotecache.setDefaultCache(cache)
+    # every refresh is one bulk yfinance request for the tickers not cached
+    quotes.setDefaultProvider(quotes.CachedQuoteProvider(quotes.YFinanceQuoteProvider(), cache))
+    # currency API responses are revalidated instead of downloaded again
+    httpcache.setDefaultCache(httpcache.HttpCache(Path(PortfolioManager.DEFAULT_PATH, httpcache.DEFAULT_FILE_NAME)))
+    fxPath = Path(PortfolioManager.DEFAULT_PATH, fxstore.DEFAULT_FILE_NAME)
+    fxstore.setDefaultStore(fxstore.FxStore(fxPath))
+    # portfolios live in one database, pickles from older versions are
+    # imported the first time they are seen
+    storePath = Path(PortfolioManager.DEFAULT_PATH, portfoliostore.DEFAULT_FILE_NAME)
+    store = portfoliostore.PortfolioStore(storePath)
+    store.importDirectory(PortfolioManager.DEFAULT_PATH)
+    portfoliostore.setDefaultStore(store)
     return True
     
 
-def main() -> None:
+def useRecording(args: argparse.Namespace) -> replay.RecordingQuoteProvider | None:
+    # --record captures the live quotes and rates of a session, --replay
+    # serves such a capture instead of the network. Either way the rates
+    # stay out of the on-disk store.
+    if args.replay:
+        provider = replay.ReplayQuoteProvider(replay.Recording.load(args.replay), args.replay_speed)
+        quotes.setDefaultProvider(provider)
+        fxstore.setDefaultStore(fxstore.FxStore(fetcher=provider.fetchRates))
+    elif args.record:
+        recorder = replay.RecordingQuoteProvider(quotes.YFinanceQuoteProvider())
+        quotes.setDefaultProvider(recorder)
+        fxstore.setDefaultStore(fxstore.FxStore(fetcher=recorder.fetchRates))
+        return recorder
+    return None
+
+def parseArgs(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="investool", description="Manage and rebalance stock portfolios.")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write counters and timings to PATH on exit (JSON for .json, Prometheus text otherwise)")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="write a cProfile and tracemalloc report per action to DIR")
+    parser.add_argument("--refresh-every", type=float, metavar="SECONDS",
+                        help="keep quotes and exchange rates warm in the background")
+    parser.add_argument("--watch", action="append", default=[], metavar="NAME",
+                        help="also keep the quotes of a saved portfolio warm (repeatable)")
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument("--record", metavar="FILE",
+                           help="save every quote and exchange rate fetched to FILE on exit")
+    recording.add_argument("--replay", metavar="FILE",
+                           help="serve quotes and exchange rates from a recording instead of the network")
+    parser.add_argument("--replay-speed", type=float, default=1.0, metavar="X",
+                        help="replay the recording X times faster than it was recorded (0 freezes it)")
+    commands = parser.add_subparsers(dest="command")
+    history = commands.add_parser("history", help="list the saved versions of a portfolio")
+    history.add_argument("name")
+    restore = commands.add_parser("restore", help="make a saved version current again")
+    restore.add_argument("name")
+    restore.add_argument("version", type=int)
+    plan = commands.add_parser("rebalance", help="plan a rebalance of saved portfolios without the menus")
+    plan.add_argument("names", nargs="*", help="portfolios to plan (default: all)")
+    plan.add_argument("--buy-only", action="store_true", help="only buy, never sell")
+    plan.add_argument("--cash", type=float, default=0.0, help="liquid cash added to each portfolio")
+    plan.add_argument("--mode", choices=rebalance.ALLOCATION_MODES, default="greedy")
+    plan.add_argument("--format", choices=batch.BATCH_FORMATS, default="json")
+    plan.add_argument("--output", help="file to write the plans to (default: stdout)")
+    plan.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    plan.add_argument("--no-refresh", action="store_true", help="plan with the saved prices")
+    gc = commands.add_parser("gc", help="delete old versions and unused version blocks")
+    gc.add_argument("--keep", type=int, default=None, help="versions to keep per portfolio (default: all)")
+    return parser.parse_args(argv)
+
+def printHistory(manager: PortfolioManager, name: str) -> None:
+    for entry in manager.listVersions(name):
+        created = datetime.datetime.fromtimestamp(entry.createdAt).strftime("%Y-%m-%d %H:%M:%S")
+        print(f" {entry.id} - {created} ({entry.holdingCount} holdings, "
+              f"{entry.totalValue:.2f} {entry.currency.upper()})")
+
+def collectGarbage(manager: PortfolioManager, keep: int | None) -> None:
+    versions = manager.store.versions
+    pruned = 0
+    if keep != None:
+        for name in versions.portfolios():
+            pruned += versions.prune(name, keep)
+    print(f"Deleted {pruned} versions and {versions.gc()} unused blocks.")
+
+def batchRebalance(args: argparse.Namespace) -> None:
+    plans, result = batch.rebalanceAll(portfoliostore.getDefaultStore(), args.names or None, args.cash,
+                                       args.buy_only, args.mode, refresh=not args.no_refresh,
+                                       maxWorkers=args.workers)
+    for ticker, error in result.errors.items():
+        print(f"Could not refresh {ticker}: {error}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            batch.writePlans(plans, f, args.format)
+    else:
+        batch.writePlans(plans, sys.stdout, args.format)
+
+def runCommand(args: argparse.Namespace, profiler: profiling.Profiler | None = None) -> None:
+    match args.command:
+        case "history":
+            printHistory(PortfolioManager(), args.name)
+        case "restore":
+            manager = PortfolioManager()
+            try:
+                manager.loadPortfolio(args.name)
+                manager.restoreVersion(args.version, args.name)
+            except (FileNotFoundError, ValueError) as e:
+                print(e, file=sys.stderr)
+                exit(1)
+        case "rebalance":
+            batchRebalance(args)
+        case "gc":
+            collectGarbage(PortfolioManager(), args.keep)
+        case _:
+            investoolUI = ui.UI()
+            if profiler != None:
+                # one report per menu action and per manager call made
+                # outside of one
+                profiler.wrap(investoolUI, profiling.publicMethods(investoolUI, "UI") +
+                              ['loadPortfolio', 'choosePortfolio', 'createNewPortfolio', 'listPortfolios'])
+                profiler.wrap(investoolUI.manager, profiling.publicMethods(investoolUI.manager))
+            if args.refresh_every:
+                investoolUI.refresher = BackgroundRefresher(investoolUI.manager, args.refresh_every, args.watch)
+                investoolUI.refresher.start()
+            try:
+                investoolUI.run()
+            finally:
+                if investoolUI.refresher != None:
+                    investoolUI.refresher.stop(timeout=1.0)
+
+def main(argv: list[str] | None = None) -> None:
+    args = parseArgs(argv)
     setup()
-    investoolUI = ui.UI()
-    investoolUI.run()
+    recorder = useRecording(args)
+    profiler = profiling.Profiler(args.profile) if args.profile else None
+    try:
+        if profiler != None and args.command != None:
+            with profiler.action(args.command):
+                runCommand(args, profiler)
+        else:
+            runCommand(args, profiler)
+    finally:
+        # also written when the menus exit the process
+        if args.metrics:
+            metrics.REGISTRY.dump(args.metrics)
+        if profiler != None:
+            profiler.close()
+        if recorder != None:
+            recorder.recording.save(args.record)
     return
 
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks on this platform, a journal then has one writer
+    fcntl = None
+
+from portfolio import Portfolio
+from stock import Stock
+import metrics
+
+DEFAULT_DIRECTORY = ".journal"
+# pending entries after which the manager folds the journal into a save
+COMPACT_EVERY = 1000
+
+class TradeJournal:
+    '''
+    Append-only log of the trades and allocation changes made to one
+    portfolio since its last save. Every entry is one JSON line with an
+    increasing sequence number, written and fsynced as soon as the change
+    is made, so appending costs the same however large the portfolio is and
+    a crash loses nothing.
+
+    Loading a portfolio replays the entries newer than the sequence number
+    its save recorded. compact() then drops the entries that save covers.
+    A torn last line left by a crash is ignored and cut off, an entry that
+    can't be applied is skipped and copied to a .rejected file next to the
+    journal.
+
+    Several managers may write the same journal. Appends and compactions
+    hold a lock on a .lock file next to it, and a writer catches up with
+    the entries others added, or reopens the journal a compaction
+    replaced, before it takes the next sequence number.
+    '''
+    def __init__(self, path: Path, fsync: bool = True) -> None:
+        self.path = Path(path)
+        self.fsync = fsync
+        self._file = None
+        # offset just past the last entry this writer knows of
+        self._end = 0
+        self.lastSeq = 0
+        self.pending = 0
+        for entry, _ in self._read():
+            self.lastSeq = entry['seq']
+            if entry['op'] != 'checkpoint':
+                self.pending += 1
+
+    @property
+    def lockPath(self) -> Path:
+        return self.path.with_suffix('.lock')
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lockPath, 'ab') as lock:
+            if fcntl != None:
+                # released when the lock file is closed
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _repair(self, start: int = 0) -> int:
+        # read the entries after `start` and cut off a torn last line before
+        # writing after it. Only done by a writer holding the lock, so
+        # reading a journal never changes it. Returns the valid length.
+        validBytes = start
+        for entry, end in self._read(start):
+            self.lastSeq = max(self.lastSeq, entry['seq'])
+            if entry['op'] != 'checkpoint':
+                self.pending += 1
+            validBytes = end
+        if self.path.exists() and self.path.stat().st_size != validBytes:
+            with open(self.path, 'r+b') as f:
+                f.truncate(validBytes)
+        return validBytes
+
+    def _sync(self) -> None:
+        # with the lock held: reopen the journal when a compaction replaced
+        # it, otherwise read what other writers appended since our last entry
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._file != None and inode == os.fstat(self._file.fileno()).st_ino:
+            if os.fstat(self._file.fileno()).st_size != self._end:
+                self._end = self._repair(self._end)
+            return
+        self.close()
+        self.pending = 0
+        self._end = self._repair()
+        self._file = open(self.path, 'ab')
+
+    def _read(self, start: int = 0) -> Iterator[tuple[dict, int]]:
+        # (entry, offset just past it) for every complete line after start
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b'\n'):
+                    return
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    return
+                offset += len(line)
+                yield entry, offset
+
+    def entries(self, afterSeq: int = 0) -> Iterator[dict]:
+        for entry, _ in self._read():
+            if entry['seq'] > afterSeq and entry['op'] != 'checkpoint':
+                yield entry
+
+    def append(self, op: str, ticker: str, **fields) -> int:
+        with self._locked():
+            self._sync()
+            self.lastSeq += 1
+            entry = {'seq': self.lastSeq, 'time': time.time(), 'op': op, 'ticker': ticker, **fields}
+            line = json.dumps(entry).encode() + b'\n'
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._end += len(line)
+        self.pending += 1
+        return self.lastSeq
+
+    @staticmethod
+    def apply(portfolio: Portfolio, entry: dict) -> None:
+        op = entry['op']
+        ticker = entry['ticker']
+        if op == 'trade':
+            portfolio.getStock(ticker).units += entry['units']
+        elif op == 'percent':
+            portfolio.getStock(ticker).percent = entry['percent']
+        elif op == 'add':
+            stock = Stock(ticker, entry['price'], entry['currency'], entry['units'], entry['percent'], 0.0)
+            portfolio.addStock(stock, updatePrice=False)
+        elif op == 'remove':
+            portfolio.removeStock(ticker)
+        else:
+            raise ValueError(f"Unknown journal operation {op}.")
+
+    def replay(self, portfolio: Portfolio, afterSeq: int = 0) -> int:
+        # apply every entry newer than afterSeq, returns the last one read
+        seq = afterSeq
+        rejected = []
+        for entry in self.entries(afterSeq):
+            try:
+                self.apply(portfolio, entry)
+            except (ValueError, KeyError, TypeError):
+                metrics.ERRORS.inc(site="journalReplay")
+                rejected.append(entry)
+            seq = entry['seq']
+        if rejected:
+            self._quarantine(rejected)
+        return seq
+
+    @property
+    def rejectedPath(self) -> Path:
+        return self.path.with_suffix('.rejected')
+
+    def _quarantine(self, entries: list[dict]) -> None:
+        # kept for inspection, each entry once however often it is replayed
+        seen = set()
+        if self.rejectedPath.exists():
+            with open(self.rejectedPath, 'rb') as f:
+                seen = {json.loads(line)['seq'] for line in f if line.strip()}
+        with open(self.rejectedPath, 'ab') as f:
+            for entry in entries:
+                if entry['seq'] not in seen:
+                    f.write(json.dumps(entry).encode() + b'\n')
+
+    def compact(self, uptoSeq: int) -> None:
+        '''
+        Drop the entries up to and including uptoSeq once a save holds
+        them. A checkpoint line keeps the sequence numbers increasing.
+        '''
+        self.close()
+        with self._locked():
+            kept = [entry for entry in self.entries(uptoSeq)]
+            tmpPath = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmpPath, 'wb') as f:
+                f.write(json.dumps({'seq': uptoSeq, 'op': 'checkpoint'}).encode() + b'\n')
+                for entry in kept:
+                    f.write(json.dumps(entry).encode() + b'\n')
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmpPath, self.path)
+        self.pending = len(kept)
+
+    def close(self) -> None:
+        if self._file != None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,32 @@
+import importlib
+import types
+
+class LazyModule(types.ModuleType):
+    '''
+    Stands in for a module until one of its attributes is used, then
+    imports the real module. Attributes set on the stand-in, for example by
+    mock.patch, take precedence over the real module's.
+    '''
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.__dict__['_lazyModule'] = None
+
+    def _lazyLoad(self) -> types.ModuleType:
+        module = self.__dict__['_lazyModule']
+        if module == None:
+            module = self.__dict__['_lazyModule'] = importlib.import_module(self.__name__)
+        return module
+
+    def __getattr__(self, name: str):
+        return getattr(self._lazyLoad(), name)
+
+    def __dir__(self) -> list[str]:
+        return dir(self._lazyLoad())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__['_lazyModule'] != None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+def lazyImport(name: str) -> LazyModule:
+    # heavy optional dependencies are only imported once they are used
+    return LazyModule(name)
@@ -1,11 +1,36 @@
 import datetime
-import requests
+import os
 from pathlib import Path
 import pickle
+import sqlite3
+import numpy as np
 
-from portfolio import Portfolio
+from portfolio import Portfolio, DEFAULT_MAX_PRICE_AGE
+from quotes import RefreshResult, refreshStocks
 from stock import Stock
-from constants import VALID_CURRENCIES
+from snapshot import MarketSnapshot
+from asyncprovider import AsyncQuoteProvider
+import rebalance
+import constants
+import portfoliostore
+from portfoliostore import PortfolioStore, CatalogEntry
+from versions import VersionEntry
+import journal
+from journal import TradeJournal
+import metrics
+
+PERSIST_SECONDS = metrics.histogram("investool_persistence_seconds",
+                                    "Time to save or load a portfolio, by operation and backend.")
+
+class RebalancePlan(dict):
+    '''
+    Units to sell (-ve) and buy (+ve) per stock, together with the snapshot
+    and liquid cash the plan was calculated from.
+    '''
+    def __init__(self, items=(), snapshot: MarketSnapshot | None = None, liquidCash: float = 0.0):
+        super().__init__(items)
+        self.snapshot = snapshot
+        self.liquidCash = liquidCash
 
 class PortfolioManager():
 
@@ -13,8 +38,63 @@ class PortfolioManager():
     DEFAULT_DIRECTORY = "portfolios"
     DEFAULT_PATH = Path(MANAGER_LOCATION.parent, "..", DEFAULT_DIRECTORY)
 
-    def __init__(self, portfolio=Portfolio()):
+    def __init__(self, portfolio=Portfolio(), store: PortfolioStore | None = None):
         self._currentPortfolio = portfolio
+        self._store = store
+        # name the current portfolio is saved under and its trade journal,
+        # both only exist once it has been loaded from or saved to a store
+        self._currentName: str | None = None
+        self._journal: TradeJournal | None = None
+        self._journalOwner: Portfolio | None = None
+
+    @property
+    def store(self) -> PortfolioStore | None:
+        # portfolios are pickled into DEFAULT_PATH when there is no store
+        if self._store != None:
+            return self._store
+        return portfoliostore.getDefaultStore()
+
+    @store.setter
+    def store(self, store: PortfolioStore | None) -> None:
+        self._store = store
+
+    @property
+    def journal(self) -> TradeJournal | None:
+        return self._journal
+
+    def _journalPath(self, name: str) -> Path:
+        return Path(self.DEFAULT_PATH, journal.DEFAULT_DIRECTORY, name + '.log')
+
+    def _openJournal(self, name: str) -> TradeJournal:
+        self._closeJournal()
+        self._currentName = name
+        self._journal = TradeJournal(self._journalPath(name))
+        self._journalOwner = self._currentPortfolio
+        return self._journal
+
+    def _closeJournal(self) -> None:
+        if self._journal != None:
+            self._journal.close()
+        self._journal = None
+        self._journalOwner = None
+        self._currentName = None
+
+    def _record(self, op: str, ticker: str, **fields) -> None:
+        # trades are durable as soon as they are made, the journal is folded
+        # into a save once it gets long. Only changes to the portfolio the
+        # journal was opened for are written to it.
+        if self._journal == None or self._journalOwner is not self._currentPortfolio:
+            return
+        self._journal.append(op, ticker, **fields)
+        if self._journal.pending >= journal.COMPACT_EVERY:
+            self.compactJournal()
+
+    def compactJournal(self) -> None:
+        if self._journal == None:
+            return
+        seq = self._journal.lastSeq
+        self.store.save(self.currentPortfolio, self._currentName, {'journalSeq': str(seq)})
+        self._journal.compact(seq)
 
     @property
     def currentPortfolio(self) -> Portfolio:
@@ -22,55 +102,113 @@ class PortfolioManager():
     
     @currentPortfolio.setter
     def currentPortfolio(self, newPortfolio:Portfolio) -> None:
+        # the saved name and journal belong to the portfolio being replaced
+        if newPortfolio is not self._currentPortfolio:
+            self._closeJournal()
         self._currentPortfolio = newPortfolio
 
     def createStock(self, ticker: str, units: int, percent: float, currency: str = 'CAD') -> Stock:
         newStock = Stock(ticker, 0, currency, units, percent, 0);
-        newStock.updatePrice()
+        refreshStocks([newStock])
         newStock.updateValue()
         return newStock
 
-    def addStockToPortfolio(self, ticker: str, units: int, percent: float, currency: str = 'CAD') -> None:
-        newStock = self.createStock(ticker, units, percent, currency)
-        self.currentPortfolio.addStock(newStock)
-        self.currentPortfolio.updatePortfolio()
+    def addStockToPortfolio(self, ticker: str, units: int, percent: float, currency: str = 'CAD',
+                            maxAge: float | None = DEFAULT_MAX_PRICE_AGE) -> RefreshResult | None:
+        # the portfolio prices the stock as it is added
+        newStock = Stock(ticker, 0, currency, units, percent, 0)
+        result = self.currentPortfolio.addStock(newStock)
+        self._record('add', ticker, price=newStock.price, currency=newStock.currency, units=units, percent=percent)
+        # the new stock was just priced, only prices older than maxAge are
+        # fetched
+        self.currentPortfolio.updatePortfolio(maxAge=maxAge)
+        return result
 
     def removeStockFromPortfolio(self, ticker: str) -> None:
-        if ticker not in self.currentPortfolio.getStockTickers():
+        if not self.currentPortfolio.hasStock(ticker):
             raise ValueError("Stock not in portfolio! Cannot remove stock.")
-        stock = self.getStock(ticker)
-        self.currentPortfolio.stocks.remove(stock)
+        self.currentPortfolio.removeStock(ticker)
+        self._record('remove', ticker)
 
     def renamePortfolio(self, newName: str) -> None:
         self.currentPortfolio.portfolioName = newName
 
     def changePortfolioCurrency(self, newCurrency: str) -> None:
-        if newCurrency.lower() not in VALID_CURRENCIES:
+        if newCurrency.lower() not in constants.VALID_CURRENCIES:
             raise ValueError("The provided currency is invalid.")
         self.currentPortfolio.portfolioCurrency = newCurrency
 
     def changePercentage(self, stockTicker: str, percent: float) -> None:
         if percent > 100:
             raise ValueError("Percent for any one stock cannot be > 100.")
-        self.getStock(stockTicker).percent = percent
+        with self.currentPortfolio.lock:
+            self.getStock(stockTicker).percent = percent
+        self._record('percent', stockTicker, percent=percent)
 
     def getFilePath(self, fileName: str) -> Path:
         if not fileName.endswith('.pickle'):
             fileName = fileName + '.pickle'
         return Path(self.DEFAULT_PATH, fileName)
 
-    def loadPortfolio(self, fileName: str) -> bool:
+    @staticmethod
+    def getStoreName(fileName: str) -> str:
+        return fileName[:-len('.pickle')] if fileName.endswith('.pickle') else fileName
+
+    def listPortfolios(self) -> list[str]:
+        if self.store != None:
+            return self.store.listNames()
+        return [f for f in os.listdir(self.DEFAULT_PATH) if f.endswith('.pickle')]
+
+    def getCatalog(self, **filters) -> list[CatalogEntry]:
+        # summaries of the saved portfolios, see PortfolioStore.catalog for
+        # the filters. Pickled portfolios aren't loaded, their entries only
+        # hold the name and file time so only the search, sortBy,
+        # descending and limit filters apply to them.
+        if self.store != None:
+            return self.store.catalog(**filters)
+        unsupported = sorted(set(filters) - {'search', 'sortBy', 'descending', 'limit'})
+        if unsupported:
+            raise ValueError(f"Pickled portfolios can't be filtered by {', '.join(unsupported)}.")
+        sortBy = filters.get('sortBy', 'name')
+        if sortBy not in ('name', 'modifiedAt'):
+            raise ValueError(f"Pickled portfolios can't be sorted by {sortBy}.")
+        search = (filters.get('search') or '').lower()
+        entries = []
+        for fileName in sorted(self.listPortfolios()):
+            name = self.getStoreName(fileName)
+            if search in name.lower():
+                modifiedAt = self.getFilePath(fileName).stat().st_mtime
+                entries.append(CatalogEntry(name, name, '', 0.0, 0, modifiedAt))
+        # a stable sort keeps names in order between equal times
+        entries.sort(key=lambda entry: getattr(entry, sortBy), reverse=filters.get('descending', False))
+        limit = filters.get('limit')
+        return entries if limit == None else entries[:limit]
+
+    def loadPortfolio(self, fileName: str, lazy: bool = False) -> bool:
+        if self.store != None:
+            # FileNotFoundError when the store has no such portfolio
+            name = self.getStoreName(fileName)
+            with PERSIST_SECONDS.time(op="load", backend="store"):
+                portfolio = self.store.load(name, lazy)
+                self.currentPortfolio = portfolio
+                # trades made after the last save are replayed from the journal
+                savedSeq = int(self.store.getMetadata(name, 'journalSeq') or 0)
+                self._openJournal(name).replay(portfolio, savedSeq)
+            return True
         currFilePath = self.getFilePath(fileName)
         if not currFilePath.exists():
             raise FileNotFoundError("file does not exist.")
         try:
-            with open(currFilePath, 'rb') as f:
-                self.currentPortfolio = pickle.load(f)
-        except IOError:
+            with PERSIST_SECONDS.time(op="load", backend="pickle"):
+                self.currentPortfolio = portfoliostore.loadPickle(currFilePath)
+        except (IOError, pickle.UnpicklingError):
+            metrics.ERRORS.inc(site="loadPortfolio")
             return False
         return True
 
     def checkFileExists(self, fileName: str) -> bool:
+        if self.store != None:
+            return self.store.exists(self.getStoreName(fileName))
         currFilePath = self.getFilePath(fileName)
         return currFilePath.exists()
 
@@ -78,22 +216,71 @@ class PortfolioManager():
     def checkDirectoryExists(cls, directoryName: Path=DEFAULT_PATH) -> bool:
         return directoryName.exists()
 
-    def savePortfolio(self, fileName: str="new_portfolio", overwrite: bool=False) -> bool:
-        if self.currentPortfolio.portfolioName:
-            fileName = self.currentPortfolio.portfolioName
+    def savePortfolio(self, fileName: str | None = None, overwrite: bool=False) -> bool:
+        if fileName == None:
+            fileName = self.currentPortfolio.portfolioName or "new_portfolio"
+        if self.store != None:
+            with PERSIST_SECONDS.time(op="save", backend="store"):
+                return self._saveToStore(self.getStoreName(fileName), overwrite)
+
         currFilePath = self.getFilePath(fileName)
         if currFilePath.exists() and not overwrite:
             timeStamp = datetime.datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
             newFileName = f"{fileName}_{timeStamp}"
             currFilePath = self.getFilePath(newFileName)
-
         try:
-            with open(currFilePath, 'wb') as f:
+            with PERSIST_SECONDS.time(op="save", backend="pickle"), open(currFilePath, 'wb') as f:
                 pickle.dump(self.currentPortfolio, f, pickle.HIGHEST_PROTOCOL)
             return True
         except IOError:
+            metrics.ERRORS.inc(site="savePortfolio")
             return False
 
+    def _saveToStore(self, name: str, overwrite: bool) -> bool:
+        try:
+            if not overwrite and self.store.exists(name):
+                # instead of a timestamped copy, the saved portfolio that is
+                # about to be replaced becomes a version of it
+                self.store.versions.commit(self._savedPortfolio(name), name, self.store.getModifiedAt(name))
+            # saving under another name moves the journal to that name, the
+            # entries it holds for the portfolio saved there are replaced by
+            # this save. Only the holdings that changed are written.
+            if name != self._currentName:
+                self._openJournal(name)
+            self.compactJournal()
+            return True
+        except sqlite3.Error:
+            metrics.ERRORS.inc(site="savePortfolio")
+            return False
+
+    def _savedPortfolio(self, name: str) -> Portfolio:
+        # the portfolio saved as `name`. Another portfolio's journaled trades
+        # are part of it and are replayed, without opening that journal for
+        # writing. Trades journaled for the current one are in the portfolio
+        # being saved, so its version is the last explicit save.
+        portfolio = self.store.load(name)
+        if name != self._currentName:
+            savedSeq = int(self.store.getMetadata(name, 'journalSeq') or 0)
+            trades = TradeJournal(self._journalPath(name))
+            trades.replay(portfolio, savedSeq)
+        return portfolio
+
+    def listVersions(self, name: str | None = None) -> list[VersionEntry]:
+        name = name or self._currentName or self.currentPortfolio.portfolioName
+        return self.store.versions.listVersions(name)
+
+    def restoreVersion(self, versionId: int, name: str | None = None) -> bool:
+        # make an old version of `name` current again, the replaced one is
+        # kept as a version. Raises ValueError when the id belongs to
+        # another portfolio.
+        name = name or self._currentName or self.currentPortfolio.portfolioName
+        portfolio = self.store.versions.restore(versionId, name)
+        if name == self._currentName:
+            # fold the journaled trades in first so the version keeps them
+            self.compactJournal()
+        self.currentPortfolio = portfolio
+        return self._saveToStore(name, overwrite=False)
+
     def portfolioPercentValid(self) -> bool:
         currentPercentTotal = self.currentPortfolio.getTotalPercent()
         if currentPercentTotal > 1:
@@ -102,34 +289,71 @@ class PortfolioManager():
             return False
         return True
 
-    def getAdjustedPrice(self, stock: Stock) -> float:
+    def getAdjustedPrice(self, stock: Stock, snapshot: MarketSnapshot | None = None) -> float:
+        if snapshot != None:
+            return snapshot.adjustedPrice(stock.ticker)
 
         if self.currentPortfolio.portfolioCurrency == stock.currency:
             return stock.price
         else:
-            try:
-                exchangeRate = self.currentPortfolio.getCurrencyExchange(stock.currency, self.currentPortfolio.portfolioCurrency)
-            except requests.RequestException:
-                exchangeRate = 1
+            # a failed lookup raises, pricing at a rate of 1 would be wrong
+            exchangeRate = self.currentPortfolio.getCurrencyExchange(stock.currency, self.currentPortfolio.portfolioCurrency)
             return stock.price * exchangeRate
 
-    def _calculateAllocationDifference(self, liquidCash: float=0) -> dict[Stock, int]:
+    def takeSnapshot(self, refresh: bool = True, maxAge: float | None = None,
+                     cachedOnly: bool = False) -> MarketSnapshot:
+        # capture prices and exchange rates once so a plan can be previewed
+        # and executed against the same numbers, with maxAge only prices
+        # older than it are fetched first. cachedOnly makes no request at
+        # all, e.g. while a BackgroundRefresher does the fetching.
+        if cachedOnly:
+            return MarketSnapshot.fromPortfolio(self.currentPortfolio, cachedOnly=True)
+        if refresh:
+            self.currentPortfolio.updatePortfolio(maxAge)
+        return MarketSnapshot.fromPortfolio(self.currentPortfolio)
+
+    async def takeSnapshotAsync(self, provider: AsyncQuoteProvider | None = None,
+                                maxAge: float | None = None) -> MarketSnapshot:
+        # takeSnapshot for asyncio callers, nothing blocks the event loop
+        # on the network
+        await self.currentPortfolio.updateTotalPortfolioValueAsync(provider, maxAge)
+        return MarketSnapshot.fromPortfolio(self.currentPortfolio)
+
+    def _planWeights(self, stocks: list[Stock], weights: dict[str, float] | None) -> np.ndarray | None:
+        # drift weights aligned with the plan's holdings
+        if weights == None:
+            return None
+        return np.array([weights.get(stock.ticker, 1.0) for stock in stocks], dtype=float)
+
+    def _planInputs(self, snapshot: MarketSnapshot) -> tuple[list[Stock], dict[str, np.ndarray]]:
+        # aligned arrays for the vectorized rebalance engine
+        stocks = self.currentPortfolio.stocks
+        holdings = self.currentPortfolio.holdings
+        prices, fx = snapshot.priceArrays([stock.ticker for stock in stocks])
+        arrays = {
+            'prices': prices,
+            'fx': fx,
+            'units': holdings.units,
+            'targets': holdings.percents,
+        }
+        return stocks, arrays
+
+    def _calculateAllocationDifference(self, liquidCash: float=0, snapshot: MarketSnapshot | None = None) -> dict[Stock, int]:
         # calculate how many units need to be sold (-ve val) and 
         # purchased (+ve val)
-        self.currentPortfolio.updatePortfolio()
+        if snapshot == None:
+            snapshot = self.takeSnapshot()
 
-        totalValue = self.currentPortfolio.totalValue + liquidCash
+        totalValue = snapshot.totalValue + liquidCash
 
         # for each stock find how many units we should have based on target
         # percent of totalValue
-        stocksUnitDifference = {}
-        for stock in self.currentPortfolio.stocks:
-            newUnitCount = round((stock.percent * totalValue) / self.getAdjustedPrice(stock))
-            stockUnitDiff = newUnitCount - stock.units
-            stocksUnitDifference[stock] = stockUnitDiff
-        return stocksUnitDifference
-
-    def calculateRebalanceSellBuy(self, liquidCash: float = 0.0) -> dict[Stock, int]:
+        stocks, arrays = self._planInputs(snapshot)
+        diff = rebalance.allocationDifference(totalValue=totalValue, **arrays)
+        return dict(zip(stocks, diff.tolist()))
+
+    def calculateRebalanceSellBuy(self, liquidCash: float = 0.0, snapshot: MarketSnapshot | None = None,
+                                  mode: str = 'greedy', weights: dict[str, float] | None = None) -> RebalancePlan:
         '''
         Function will calculate how to rebalance a portfolio by selling and
         then buying stocks. If there is not enough cash there will be some
@@ -138,98 +362,97 @@ class PortfolioManager():
         The function takes into consideration the fact that stocks can only
         be sold as in whole units.
 
+        Prices come from `snapshot`, a fresh one is taken when none is given.
+        `mode` chooses how the cash is spent on buys: 'greedy' buys the
+        largest unit differences first, 'optimal' and 'exact' minimize the
+        drift from the target allocations (see rebalance.py). `weights`
+        maps tickers to how much their drift counts in those two modes,
+        1.0 for any ticker left out.
+
         Returns a dictionary of stocks as keys and how many units to sell (-ve)
         and buy (+ve) for each stock
         '''
-        stocksUnitDifference = self._calculateAllocationDifference(liquidCash)
-
-        sellList = [stock for stock in stocksUnitDifference.items() if stock[1] < 0]
-        sellList.sort(key=lambda x: x[1])
-        buyList = [stock for stock in stocksUnitDifference.items() if stock[1] >= 0]
-        buyList.sort(key=lambda x: x[1], reverse=True)
-
-        totalCash = liquidCash
-        for stock, units in sellList:
-            totalCash += (-1 * units) * self.getAdjustedPrice(stock)
-            
-        # need a new buyList because values could change, depending on price
-        finalBuyList = []
-        for stock, units in buyList:
-            cost = units * self.getAdjustedPrice(stock)
-            if cost > totalCash:
-                units = int(totalCash / self.getAdjustedPrice(stock))
-            totalCash -= units * self.getAdjustedPrice(stock)
-            finalBuyList.append((stock, units))
-
-        return dict(sellList + finalBuyList)
-
-    def calculateRebalanceBuyOnly(self, liquidCash: float = 0.0) -> dict[Stock, int]:
-        stocksUnitDifference = self._calculateAllocationDifference(liquidCash)
-
+        if snapshot == None:
+            snapshot = self.takeSnapshot()
+        stocks, arrays = self._planInputs(snapshot)
+        order, deltas = rebalance.planSellBuy(totalValue=snapshot.totalValue + liquidCash, liquidCash=liquidCash,
+                                              mode=mode, weights=self._planWeights(stocks, weights), **arrays)
+        return RebalancePlan(((stocks[i], d) for i, d in zip(order.tolist(), deltas.tolist())), snapshot, liquidCash)
+
+    def calculateRebalanceBuyOnly(self, liquidCash: float = 0.0, snapshot: MarketSnapshot | None = None,
+                                  mode: str = 'greedy', weights: dict[str, float] | None = None) -> RebalancePlan:
         # only purchase stocks that are most skewed away from target percentages
-        buyList = [stock for stock in stocksUnitDifference.items() if stock[1] >= 0]
-        buyList.sort(key=lambda x: x[1], reverse=True)
-        
-        modifiedBuyList = []
-
-        for i in range(len(buyList)):
-            stock = buyList[i][0]
-            units = buyList[i][1]
-            cashNeeded = units * self.getAdjustedPrice(stock)
-            
-            if cashNeeded > liquidCash:
-                units = int(liquidCash / self.getAdjustedPrice(stock))
-            liquidCash -= units * self.getAdjustedPrice(stock)
-            modifiedBuyList.append((stock, units))
-
-        return dict(modifiedBuyList)
+        if snapshot == None:
+            snapshot = self.takeSnapshot()
+        stocks, arrays = self._planInputs(snapshot)
+        order, deltas = rebalance.planBuyOnly(totalValue=snapshot.totalValue + liquidCash, liquidCash=liquidCash,
+                                              mode=mode, weights=self._planWeights(stocks, weights), **arrays)
+        return RebalancePlan(((stocks[i], d) for i, d in zip(order.tolist(), deltas.tolist())), snapshot, liquidCash)
+
+    async def calculateRebalanceSellBuyAsync(self, liquidCash: float = 0.0, provider: AsyncQuoteProvider | None = None,
+                                             mode: str = 'greedy', maxAge: float | None = None) -> RebalancePlan:
+        snapshot = await self.takeSnapshotAsync(provider, maxAge)
+        return self.calculateRebalanceSellBuy(liquidCash, snapshot, mode)
+
+    async def calculateRebalanceBuyOnlyAsync(self, liquidCash: float = 0.0, provider: AsyncQuoteProvider | None = None,
+                                             mode: str = 'greedy', maxAge: float | None = None) -> RebalancePlan:
+        snapshot = await self.takeSnapshotAsync(provider, maxAge)
+        return self.calculateRebalanceBuyOnly(liquidCash, snapshot, mode)
 
     def cashRemaining(self, buySellMap: dict[Stock, int], liquidCash: float = 0.0) -> float:
+        # plans carry the snapshot they were made with, so no prices are fetched
+        snapshot = getattr(buySellMap, 'snapshot', None)
         rem = liquidCash
         for stock, units in buySellMap.items():
-            rem -= units * self.getAdjustedPrice(stock)
+            rem -= units * self.getAdjustedPrice(stock, snapshot)
         return rem
 
-    def rebalanceSellBuy(self, liquidCash: float = 0.0):
-        rebalanceMap = self.calculateRebalanceSellBuy(liquidCash)
-
-        for stock, units in rebalanceMap.items():
+    def applyRebalancePlan(self, plan: dict[Stock, int], buyOnly: bool = False) -> None:
+        # execute an already computed plan, nothing is recalculated or fetched
+        for stock, units in plan.items():
             if units > 0:
                 self.buyStock(stock.ticker, units)
-            elif units < 0:
+            elif units < 0 and not buyOnly:
                 self.sellStock(stock.ticker, units)
 
-    def rebalanceOnlyBuy(self, liquidCash: float = 0.0):
-        rebalanceMap = self.calculateRebalanceSellBuy(liquidCash)
+    def rebalanceSellBuy(self, liquidCash: float = 0.0, plan: dict[Stock, int] | None = None):
+        if plan == None:
+            plan = self.calculateRebalanceSellBuy(liquidCash)
+        self.applyRebalancePlan(plan)
 
-        for stock, units in rebalanceMap.items():
-            if units > 0:
-                self.buyStock(stock.ticker, units)
+    def rebalanceOnlyBuy(self, liquidCash: float = 0.0, plan: dict[Stock, int] | None = None):
+        if plan == None:
+            plan = self.calculateRebalanceBuyOnly(liquidCash)
+        self.applyRebalancePlan(plan, buyOnly=True)
 
     def getStock(self, stockTicker: str) -> Stock:
-        for i, stock in enumerate(self.currentPortfolio.stocks):
-            if stockTicker == stock.ticker:
-                return self.currentPortfolio.stocks[i]
-        raise ValueError("The provided ticker does not exist in the portfolio.")
+        return self.currentPortfolio.getStock(stockTicker)
 
     def buyStock(self, stockTicker: str, quantity: int) -> int:
         # when quantity < 0 we are selling
-        if stockTicker not in self.currentPortfolio.getStockTickers(): 
+        if not self.currentPortfolio.hasStock(stockTicker):
             raise ValueError(f"stock {stockTicker} is not in the portfolio")
 
-        stock = self.getStock(stockTicker)
-        stock.units += quantity
+        with self.currentPortfolio.lock:
+            stock = self.getStock(stockTicker)
+            stock.units += quantity
+            units = stock.units
+        self._record('trade', stockTicker, units=quantity)
 
-        return stock.units
+        return units
 
     def sellStock(self, stockTicker: str, quantity) -> int:
-        if stockTicker not in self.currentPortfolio.getStockTickers(): 
+        if not self.currentPortfolio.hasStock(stockTicker):
             raise ValueError(f"stock {stockTicker} is not in the portfolio")
         
-        stock = self.getStock(stockTicker)
-        if quantity > stock.units:
-            stock.units = 0
-        else:
-            stock.units += quantity
-
-        return stock.units
+        with self.currentPortfolio.lock:
+            stock = self.getStock(stockTicker)
+            previousUnits = stock.units
+            if quantity > stock.units:
+                stock.units = 0
+            else:
+                stock.units += quantity
+            units = stock.units
+        self._record('trade', stockTicker, units=units - previousUnits)
+
+        return units
@@ -0,0 +1,187 @@
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# seconds, from a cached lookup up to a slow network call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+def _labelKey(labels: dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _formatLabels(key: LabelKey, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _formatNumber(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    '''
+    Monotonic count per label set, e.g. requests.inc(kind="quote").
+    '''
+    def __init__(self, name: str, help: str = '') -> None:
+        self.name = name
+        self.help = help
+        self._values: dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labelKey(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labelKey(labels), 0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def toPrometheus(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_formatLabels(key)} {_formatNumber(value)}")
+        return lines
+
+    def toJson(self) -> list[dict]:
+        return [{'labels': dict(key), 'value': value} for key, value in sorted(self._values.items())]
+
+class Histogram:
+    '''
+    Distribution of observed values (latencies in seconds) per label set,
+    counted into fixed buckets like a Prometheus histogram.
+    '''
+    def __init__(self, name: str, help: str = '', buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # label set -> [count per bucket (+Inf last), sum, count]
+        self._values: dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labelKey(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry == None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(_labelKey(labels))
+        return 0 if entry == None else entry[2]
+
+    def sum(self, **labels) -> float:
+        entry = self._values.get(_labelKey(labels))
+        return 0.0 if entry == None else entry[1]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def _cumulative(self, counts: list[int]) -> list[tuple[float, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def toPrometheus(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._values.items()):
+            for bound, cumulative in self._cumulative(counts):
+                lines.append(f"{self.name}_bucket{_formatLabels(key, (('le', _formatNumber(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_formatLabels(key)} {_formatNumber(total)}")
+            lines.append(f"{self.name}_count{_formatLabels(key)} {count}")
+        return lines
+
+    def toJson(self) -> list[dict]:
+        return [{'labels': dict(key), 'count': count, 'sum': total,
+                 'buckets': {_formatNumber(bound): c for bound, c in self._cumulative(counts)}}
+                for key, (counts, total, count) in sorted(self._values.items())]
+
+class Registry:
+    '''
+    Every metric of the process by name. counter() and histogram() return
+    the existing metric when the name is already registered, so modules can
+    declare the metrics they use at import.
+    '''
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric == None:
+                metric = self._metrics[name] = cls(name, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} is already registered as a {type(metric).__name__}.")
+            return metric
+
+    def counter(self, name: str, help: str = '') -> Counter:
+        return self._get(Counter, name, help)
+
+    def histogram(self, name: str, help: str = '', buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets)
+
+    def reset(self) -> None:
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def toPrometheus(self) -> str:
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].toPrometheus())
+        return "\n".join(lines) + "\n"
+
+    def toJson(self) -> dict:
+        return {name: {'type': type(metric).__name__.lower(), 'help': metric.help, 'values': metric.toJson()}
+                for name, metric in sorted(self._metrics.items())}
+
+    def dump(self, path: str) -> None:
+        # JSON for .json files, Prometheus text format otherwise
+        with open(path, 'w') as f:
+            if str(path).endswith('.json'):
+                json.dump(self.toJson(), f, indent=2)
+            else:
+                f.write(self.toPrometheus())
+
+REGISTRY = Registry()
+
+def counter(name: str, help: str = '') -> Counter:
+    return REGISTRY.counter(name, help)
+
+def histogram(name: str, help: str = '', buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, help, buckets)
+
+# shared by every call site that goes to the network or a cache
+HTTP_REQUESTS = counter("investool_http_requests_total", "HTTP requests made, by kind.")
+ERRORS = counter("investool_errors_total", "Errors, by call site.")
+CACHE_REQUESTS = counter("investool_cache_requests_total", "Cache lookups, by cache and hit or miss.")
@@ -1,35 +1,132 @@
-import requests
-
 from stock import Stock
-from constants import API_URL
-from datetime import date
+from holdings import HoldingsTable
+from quotes import QuoteProvider, RefreshResult, fetchQuotes, applyQuotes, refreshStocks
+import fxstore
+import asyncprovider
+from asyncprovider import AsyncQuoteProvider
+import metrics
+import numpy as np
+import os
+import threading
+import time
+from typing import Callable
+
+# prices younger than this many seconds are not fetched again on a redraw
+DEFAULT_MAX_PRICE_AGE = float(os.environ.get("INVESTOOL_PRICE_MAX_AGE", 300))
+
+EXCHANGE_SECONDS = metrics.histogram("investool_exchange_rate_seconds", "Time to look up one exchange rate.")
+
+class StockList(list):
+    '''
+    The holdings of a portfolio as a list that can't be modified, so code
+    that appends or removes stocks fails instead of changing a copy the
+    portfolio never sees. Use Portfolio.addStock/removeStock.
+    '''
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError("Use addStock/removeStock to change the stocks of a portfolio.")
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _readOnly
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readOnly
 
 class Portfolio:
     def __init__(self, portfolioName='', stocks=list(), totalValue=0.0, portfolioCurrency='CAD'):
         self._portfolioName: str = portfolioName
-        self._stocks: list[Stock] = stocks
+        # ticker -> holding, kept in insertion order so it doubles as the
+        # stock list while giving O(1) membership, lookup and removal. The
+        # numeric fields of every holding live in the columnar table.
+        self._setStocks(stocks)
         self._totalValue: float = totalValue
         self._portfolioCurrency: str = portfolioCurrency
-        self._currencyExchangeCache: dict = {}
+        # held while holdings are written so a background refresh and the
+        # UI or planners never see a half updated portfolio
+        self._lock = threading.RLock()
 
     def __str__(self) -> str:
         form = "Portfolio: {}\n  - stocks: {}\n  - totalValue: {}\n  - currency: {}"
-        return form.format(self._portfolioName, self._stocks, self._totalValue, self._portfolioCurrency)
+        return form.format(self._portfolioName, self.stocks, self._totalValue, self._portfolioCurrency)
 
     def __repr__(self) -> str:
-        return f"Portfolio('{self.portfolioName}', {self._stocks}, {self._totalValue}, {self._portfolioCurrency})"
+        return f"Portfolio('{self.portfolioName}', {self.stocks}, {self._totalValue}, {self._portfolioCurrency})"
 
     def __eq__(self, other) -> bool:
         if not isinstance(other, Portfolio):
             return NotImplemented
         if (self._portfolioName == other._portfolioName and
-            self._stocks == other._stocks and
+            self.stocks == other.stocks and
             self._totalValue == other._totalValue and 
             self._portfolioCurrency == other._portfolioCurrency):
             return True
         else:
             return False
 
+    def __getstate__(self) -> dict:
+        # pickle the plain stock list, the index is rebuilt on load
+        stocks = self.stocks
+        state = self.__dict__.copy()
+        state['_stocks'] = list(stocks)
+        del state['_holdings']
+        del state['_stockList']
+        del state['_table']
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        # portfolios saved before the shared FX store carried their own cache
+        state.pop('_currencyExchangeCache', None)
+        stocks = state.pop('_stocks', [])
+        self.__dict__.update(state)
+        self._setStocks(stocks)
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name: str):
+        # only called for missing attributes: the holdings of a lazily
+        # loaded portfolio are fetched the first time anything needs them
+        if name in ('_holdings', '_table', '_stockList'):
+            loadStocks = self.__dict__.pop('_loadStocks', None)
+            if loadStocks != None:
+                self._setStocks(loadStocks())
+                return self.__dict__[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    @classmethod
+    def lazy(cls, loadStocks: Callable[[], list[Stock]], portfolioName: str = '',
+             totalValue: float = 0.0, portfolioCurrency: str = 'CAD') -> "Portfolio":
+        # a portfolio whose stocks are only loaded when first used
+        portfolio = cls.__new__(cls)
+        portfolio._portfolioName = portfolioName
+        portfolio._totalValue = totalValue
+        portfolio._portfolioCurrency = portfolioCurrency
+        portfolio._loadStocks = loadStocks
+        portfolio._lock = threading.RLock()
+        return portfolio
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    @property
+    def stocksLoaded(self) -> bool:
+        return '_loadStocks' not in self.__dict__
+
+    def _setStocks(self, stocks: list[Stock]) -> None:
+        self.__dict__.pop('_loadStocks', None)
+        # stocks of the table being replaced are released from it, a stock
+        # that belongs to another portfolio is copied instead of taken away
+        old = self.__dict__.get('_table')
+        holdings = {}
+        for stock in stocks:
+            if stock.ticker in holdings:
+                continue
+            if stock._table != None:
+                if stock._table is old:
+                    old.remove(stock)
+                else:
+                    stock = stock.copy()
+            holdings[stock.ticker] = stock
+        self._holdings: dict[str, Stock] = holdings
+        self._table = HoldingsTable.fromStocks(list(holdings.values()))
+        self._stockList: StockList | None = None
+
     @property
     def portfolioName(self) -> str:
         return self._portfolioName
@@ -41,14 +138,23 @@ class Portfolio:
         self._portfolioName = portfolioName
 
     @property
-    def stocks(self) -> list[Stock]:
-        return self._stocks
+    def stocks(self) -> StockList:
+        # rebuilt after holdings change and read-only, use addStock and
+        # removeStock to modify the portfolio
+        if self._stockList == None:
+            self._stockList = StockList(self._holdings.values())
+        return self._stockList
 
     @stocks.setter
     def stocks(self, stocks: list[Stock]) -> None:
         if not isinstance(stocks, list):
             raise TypeError("stocks must be a list")
-        self._stocks = stocks
+        self._setStocks(stocks)
+
+    @property
+    def holdings(self) -> HoldingsTable:
+        # columns are aligned with `stocks`
+        return self._table
 
     @property
     def totalValue(self) -> float:
@@ -76,61 +182,169 @@ class Portfolio:
         return sum(stock.percent for stock in self.stocks)
 
     def getStockTickers(self) -> list[str]:
-        return [stock.ticker for stock in self._stocks]
+        return list(self._holdings)
+
+    def hasStock(self, ticker: str) -> bool:
+        return ticker in self._holdings
+
+    def getStock(self, ticker: str) -> Stock:
+        stock = self._holdings.get(ticker)
+        if stock == None:
+            raise ValueError("The provided ticker does not exist in the portfolio.")
+        return stock
 
-    def addStock(self, stock: Stock) -> None:
-        if stock.ticker not in self.getStockTickers():
-            stock.updatePrice()
+    def addStock(self, stock: Stock, updatePrice: bool = True) -> RefreshResult | None:
+        # the price comes from the default quote provider like any refresh,
+        # a ticker it can't price is added at its current price
+        result = None
+        if stock.ticker not in self._holdings:
+            if stock._table != None:
+                # held by another portfolio, which keeps it
+                stock = stock.copy()
+            if updatePrice:
+                result = refreshStocks([stock])
             stock.updateValue()
-            self._stocks.append(stock)
+            with self._lock:
+                self._holdings[stock.ticker] = stock
+                row = self._table.append(stock)
+                if result != None and stock.ticker in result.quotes and stock.ticker not in result.errors:
+                    fetchedAt = result.quotes[stock.ticker].fetchedAt
+                    self._table.setFetchedAt(row, time.time() if fetchedAt == None else fetchedAt)
+                self._stockList = None
+        return result
 
     def removeStock(self, ticker: str) -> None:
-        for stock in self._stocks:
-            if stock.ticker == ticker:
-                self._stocks.remove(stock)
-                return
-        raise ValueError(f"{ticker} not in portfolio.")
+        with self._lock:
+            stock = self._holdings.get(ticker)
+            if stock == None:
+                raise ValueError(f"{ticker} not in portfolio.")
+            self._table.remove(stock)
+            del self._holdings[ticker]
+            self._stockList = None
+
+    def staleStocks(self, maxAge: float, now: float | None = None) -> list[Stock]:
+        # stocks whose price was fetched more than maxAge seconds ago, or never
+        stocks = self.stocks
+        if not stocks:
+            return []
+        now = time.time() if now == None else now
+        stale = now - self._table.fetchedAt > maxAge
+        return [stocks[i] for i in np.flatnonzero(stale).tolist()]
+
+    def pricesFetchedAt(self) -> float | None:
+        # when the oldest price was fetched, None if one never was
+        if not self.stocks:
+            return None
+        oldest = float(self._table.fetchedAt.min())
+        return oldest if oldest > 0 else None
+
+    def updateAllStockPrices(self, provider: QuoteProvider | None = None,
+                             maxAge: float | None = None) -> RefreshResult:
+        # with maxAge only the prices older than it are fetched
+        with self._lock:
+            stocks = list(self.stocks) if maxAge == None else self.staleStocks(maxAge)
+        if not stocks:
+            return RefreshResult()
+        # the portfolio isn't locked while waiting on the network
+        result = fetchQuotes(stocks, provider)
+        self.applyQuotes(result)
+        return result
 
-    def updateAllStockPrices(self) -> None:
-        for stock in self._stocks:
-            stock.updatePrice()
+    async def updateAllStockPricesAsync(self, provider: AsyncQuoteProvider | None = None,
+                                        maxAge: float | None = None) -> RefreshResult:
+        # updateAllStockPrices on an event loop, every ticker is requested at once
+        with self._lock:
+            stocks = list(self.stocks) if maxAge == None else self.staleStocks(maxAge)
+        if not stocks:
+            return RefreshResult()
+        provider = provider or asyncprovider.getDefaultProvider()
+        result = await provider.getQuotes([stock.ticker for stock in stocks])
+        self.applyQuotes(result)
+        return result
+
+    def applyQuotes(self, result: RefreshResult) -> None:
+        # write fetched quotes into the holdings they price, other tickers
+        # in the result are ignored
+        with self._lock:
+            stocks = [stock for ticker, stock in self._holdings.items() if ticker in result.quotes]
+            applyQuotes(stocks, result)
+            now = time.time()
+            for stock in stocks:
+                if stock.ticker not in result.errors:
+                    fetchedAt = result.quotes[stock.ticker].fetchedAt
+                    self._table.setFetchedAt(stock._row, now if fetchedAt == None else fetchedAt)
 
     def updateAllStockValues(self) -> None:
-        for stock in self._stocks:
-            stock.updateValue()
-            if stock.currency != self.portfolioCurrency:
-                exchangeRate = self.getCurrencyExchange(stock.currency, self.portfolioCurrency)
-                stock.stockValue *= exchangeRate
+        with self._lock:
+            self._updateAllStockValues()
+
+    def _updateAllStockValues(self) -> None:
+        if not self.stocks:
+            return
+        # one FX matrix covers every currency in the portfolio, then all
+        # holdings are converted with a single vectorized multiply
+        table = self._table
+        values = table.prices * table.units
+        usedCodes = [table.currencyCodes[i] for i in np.unique(table.currencyIndex).tolist()]
+        if any(code != self.portfolioCurrency.lower() for code in usedCodes):
+            fxMatrix = fxstore.getDefaultStore().getMatrix([self.portfolioCurrency] + usedCodes)
+            rates = fxMatrix.ratesInto(self.portfolioCurrency)
+            # FX rate for every currency code the table knows, by code index
+            codeRates = np.array([rates[fxMatrix.index[c]] if c in fxMatrix.index else 0.0
+                                  for c in table.currencyCodes])
+            values *= codeRates[table.currencyIndex]
+        table.values[:] = values
 
     def currencyUpToDate(self, currency: str) -> bool:
-        today = date.today().strftime("%Y-%m-%d")
-        return self._currencyExchangeCache[currency.lower()]['date'] == today
+        return fxstore.getDefaultStore().hasRates(currency)
 
     def getCurrencyExchange(self, currency1: str, currency2: str) -> float:
-        currency1 = currency1.lower()
-        currency2 = currency2.lower()
-        # if cache isn't up to date, update it accordingly
-        if currency1 not in self._currencyExchangeCache or not self.currencyUpToDate(currency1):
-            inp2 = "currencies/" + currency1 + ".json"
-            response = requests.get(API_URL.format(inp2))
-            if response.status_code == 200: 
-                data = response.json()
-                self._currencyExchangeCache[currency1] = data
-            else:
-                raise requests.RequestException("There was an error with getting the request.")
-
         # return the correct currency exchange rate from currency1 to currency2
         # ex: USD -> CAD being 1.34 means for 1 USD you get 1.34 CAD
-        exchangeRate = self._currencyExchangeCache[currency1][currency1][currency2]
+        with EXCHANGE_SECONDS.time():
+            return fxstore.getDefaultStore().getRate(currency1, currency2)
 
-        return exchangeRate
+    def warmFx(self, cachedOnly: bool = False) -> None:
+        # fetch the exchange rates the holdings need before the portfolio is
+        # locked, valuing them under the lock is then served from memory.
+        # With cachedOnly a missing rate raises LookupError instead of
+        # being fetched.
+        with self._lock:
+            codes = {currency.lower() for currency in self._table.currencies}
+        codes.discard(self.portfolioCurrency.lower())
+        if not codes:
+            return
+        codes = [self.portfolioCurrency] + sorted(codes)
+        if cachedOnly:
+            missing = fxstore.getDefaultStore().missingRates(codes)
+            if missing:
+                raise LookupError(f"No exchange rates fetched yet for {', '.join(missing).upper()}.")
+        else:
+            fxstore.getDefaultStore().getMatrix(codes)
 
-    def updateTotalPortfolioValue(self, updatePrices:bool=True, updateValues:bool=True) -> None:
+    def updateTotalPortfolioValue(self, updatePrices:bool=True, updateValues:bool=True,
+                                  maxAge: float | None = None, cachedFx: bool = False) -> RefreshResult | None:
+        result = None
         if updatePrices:
-            self.updateAllStockPrices()
+            result = self.updateAllStockPrices(maxAge=maxAge)
         if updateValues:
-            self.updateAllStockValues()
-        self._totalValue = sum(s.stockValue for s in self._stocks)
+            self.warmFx(cachedOnly=cachedFx)
+        with self._lock:
+            if updateValues:
+                self.updateAllStockValues()
+            self._totalValue = float(self._table.values.sum())
+        return result
+
+    async def updateTotalPortfolioValueAsync(self, provider: AsyncQuoteProvider | None = None,
+                                             maxAge: float | None = None) -> RefreshResult:
+        # prices and the exchange rates they need are fetched on the event
+        # loop, the values are then recomputed without any request
+        result = await self.updateAllStockPricesAsync(provider, maxAge)
+        with self._lock:
+            codes = [self.portfolioCurrency] + self._table.currencies
+        await asyncprovider.warmFx(codes, provider)
+        self.updateTotalPortfolioValue(updatePrices=False)
+        return result
 
-    def updatePortfolio(self) -> None:
-        self.updateTotalPortfolioValue()
+    def updatePortfolio(self, maxAge: float | None = None) -> RefreshResult | None:
+        return self.updateTotalPortfolioValue(maxAge=maxAge)
@@ -0,0 +1,344 @@
+import importlib
+import io
+import json
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from portfolio import Portfolio
+from stock import Stock
+from versions import VersionStore
+
+DEFAULT_FILE_NAME = "portfolios.sqlite"
+# {name}_{timestamp}.pickle copies written by savePortfolio before versions
+TIMESTAMPED_COPY = re.compile(r"^(?P<name>.+)_(?P<time>\d{4}-\d{2}-\d{2}-\d{2}:\d{2}:\d{2})$")
+TIMESTAMP_FORMAT = "%Y-%m-%d-%H:%M:%S"
+
+# the only globals a portfolio pickle may reference; pickles saved from
+# the package import path use the investool. prefix
+SAFE_PICKLE_CLASSES = {
+    ('portfolio', 'Portfolio'),
+    ('investool.portfolio', 'Portfolio'),
+    ('stock', 'Stock'),
+    ('investool.stock', 'Stock'),
+}
+
+class RestrictedUnpickler(pickle.Unpickler):
+    '''
+    Unpickler that only resolves Portfolio and Stock, so importing a pickle
+    can't run arbitrary code. Any other global raises UnpicklingError.
+    '''
+    def find_class(self, module: str, name: str):
+        if (module, name) not in SAFE_PICKLE_CLASSES:
+            raise pickle.UnpicklingError(f"global '{module}.{name}' is not allowed in a portfolio file.")
+        try:
+            return getattr(importlib.import_module(module), name)
+        except ImportError:
+            # run as a script the package itself isn't importable
+            return getattr(importlib.import_module(module.rpartition('.')[2]), name)
+
+def loadPickle(path: Path) -> Portfolio:
+    with open(path, 'rb') as f:
+        portfolio = RestrictedUnpickler(io.BytesIO(f.read())).load()
+    if type(portfolio).__name__ != 'Portfolio':
+        raise pickle.UnpicklingError(f"{path} does not contain a portfolio.")
+    return portfolio
+
+# (price, currency, units, percent, value) of one holding
+HoldingRow = tuple[float, str, int, float, float]
+
+class CatalogEntry(NamedTuple):
+    name: str
+    portfolioName: str
+    currency: str
+    totalValue: float
+    holdingCount: int
+    modifiedAt: float
+
+CATALOG_SORT_KEYS = CatalogEntry._fields
+
+class PortfolioStore:
+    '''
+    Portfolios, their holdings and metadata in one SQLite database.
+
+    Every holding is its own row, so a save only writes the holdings that
+    changed since the portfolio was last saved or loaded, and deletes the
+    ones that were removed. What is on disk is remembered per portfolio
+    together with its modification time; if another process saved the
+    portfolio in between, the rows are re-read before diffing.
+
+    Older versions of every portfolio are kept in `versions`, a
+    VersionStore in the same database file.
+    '''
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.versions = VersionStore(self.path)
+        self._saved: dict[str, tuple[float, dict[str, tuple[int, HoldingRow]]]] = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS portfolios (
+                                name TEXT PRIMARY KEY,
+                                portfolioName TEXT NOT NULL,
+                                currency TEXT NOT NULL,
+                                totalValue REAL NOT NULL,
+                                holdingCount INTEGER NOT NULL,
+                                modifiedAt REAL NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS holdings (
+                                portfolio TEXT NOT NULL,
+                                ticker TEXT NOT NULL,
+                                position INTEGER NOT NULL,
+                                price REAL NOT NULL,
+                                currency TEXT NOT NULL,
+                                units INTEGER NOT NULL,
+                                percent REAL NOT NULL,
+                                value REAL NOT NULL,
+                                PRIMARY KEY (portfolio, ticker)) WITHOUT ROWID""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS metadata (
+                                portfolio TEXT NOT NULL,
+                                key TEXT NOT NULL,
+                                value TEXT NOT NULL,
+                                PRIMARY KEY (portfolio, key)) WITHOUT ROWID""")
+            # the portfolios table doubles as the catalog, these keep
+            # filtering and sorting it from scanning every row
+            conn.execute("CREATE INDEX IF NOT EXISTS portfolios_value ON portfolios (totalValue)")
+            conn.execute("CREATE INDEX IF NOT EXISTS portfolios_modified ON portfolios (modifiedAt)")
+            conn.execute("CREATE INDEX IF NOT EXISTS portfolios_currency ON portfolios (currency COLLATE NOCASE, totalValue)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn == None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _modifiedAt(self, name: str) -> float | None:
+        row = self._connection().execute(
+            "SELECT modifiedAt FROM portfolios WHERE name = ?", (name,)).fetchone()
+        return None if row == None else row[0]
+
+    def _readHoldings(self, name: str) -> list[tuple]:
+        return self._connection().execute(
+            """SELECT ticker, position, price, currency, units, percent, value FROM holdings
+               WHERE portfolio = ? ORDER BY position""", (name,)).fetchall()
+
+    def _savedRows(self, name: str) -> dict[str, tuple[int, HoldingRow]]:
+        # ticker -> (position, row) as currently on disk
+        modifiedAt = self._modifiedAt(name)
+        if modifiedAt == None:
+            return {}
+        cached = self._saved.get(name)
+        if cached != None and cached[0] == modifiedAt:
+            return cached[1]
+        return {r[0]: (r[1], tuple(r[2:])) for r in self._readHoldings(name)}
+
+    def getModifiedAt(self, name: str) -> float | None:
+        return self._modifiedAt(name)
+
+    def exists(self, name: str) -> bool:
+        return self._modifiedAt(name) != None
+
+    def listNames(self) -> list[str]:
+        rows = self._connection().execute("SELECT name FROM portfolios ORDER BY name").fetchall()
+        return [r[0] for r in rows]
+
+    def _distinct(self, expression: str, table: str, names: list[str] | None) -> list[str]:
+        query = f"SELECT DISTINCT {expression} FROM {table}"
+        if names == None:
+            rows = self._connection().execute(query).fetchall()
+        else:
+            key = 'portfolio' if table == 'holdings' else 'name'
+            query += f" WHERE {key} IN (SELECT value FROM json_each(?))"
+            rows = self._connection().execute(query, (json.dumps(names),)).fetchall()
+        return [r[0] for r in rows]
+
+    def tickers(self, names: list[str] | None = None) -> list[str]:
+        # every ticker held by the given portfolios, without loading them
+        return self._distinct("ticker", "holdings", names)
+
+    def currencies(self, names: list[str] | None = None) -> list[str]:
+        # lower case codes of the portfolios and every holding they have
+        own = self._distinct("lower(currency)", "portfolios", names)
+        held = self._distinct("lower(currency)", "holdings", names)
+        return list(dict.fromkeys(own + held))
+
+    def catalog(self, currency: str | None = None, minValue: float | None = None,
+                maxValue: float | None = None, search: str | None = None,
+                sortBy: str = 'name', descending: bool = False,
+                limit: int | None = None) -> list[CatalogEntry]:
+        '''
+        Summary of every saved portfolio, filtered and sorted by SQLite from
+        the catalog fields kept up to date by save(). No holdings are read.
+        `search` matches part of the saved name, ignoring case.
+        '''
+        if sortBy not in CATALOG_SORT_KEYS:
+            raise ValueError(f"Can't sort the catalog by {sortBy}, expected one of {CATALOG_SORT_KEYS}.")
+        clauses = []
+        params: list = []
+        if currency != None:
+            clauses.append("currency = ? COLLATE NOCASE")
+            params.append(currency)
+        if minValue != None:
+            clauses.append("totalValue >= ?")
+            params.append(minValue)
+        if maxValue != None:
+            clauses.append("totalValue <= ?")
+            params.append(maxValue)
+        if search:
+            clauses.append("instr(lower(name), lower(?)) > 0")
+            params.append(search)
+        query = f"SELECT {', '.join(CATALOG_SORT_KEYS)} FROM portfolios"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        # name breaks ties so the order is stable
+        query += f" ORDER BY {sortBy} {'DESC' if descending else 'ASC'}, name"
+        if limit != None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._connection().execute(query, params).fetchall()
+        return [CatalogEntry(*row) for row in rows]
+
+    def save(self, portfolio: Portfolio, name: str | None = None,
+             metadata: dict[str, str] | None = None) -> int:
+        '''
+        Save `portfolio` under `name` (its portfolioName by default) and
+        return how many holding rows were written or deleted. `metadata` is
+        written in the same transaction.
+        '''
+        name = name or portfolio.portfolioName
+        if not name:
+            raise ValueError("A portfolio needs a name to be saved.")
+        stocks = portfolio.stocks
+        with self._lock:
+            saved = self._savedRows(name)
+            current: dict[str, tuple[int, HoldingRow]] = {}
+            changed = []
+            # positions only have to increase, so holdings keep the position
+            # they were saved with and only new or moved ones get a new one
+            lastPosition = -1
+            for stock in stocks:
+                row = (float(stock.price), stock.currency, int(stock.units), float(stock.percent), float(stock.stockValue))
+                previous = saved.get(stock.ticker)
+                if previous != None and previous[0] > lastPosition:
+                    position = previous[0]
+                else:
+                    position = lastPosition + 1
+                lastPosition = position
+                current[stock.ticker] = (position, row)
+                if previous != (position, row):
+                    changed.append((name, stock.ticker, position, *row))
+            removed = [(name, ticker) for ticker in saved if ticker not in current]
+
+            modifiedAt = time.time()
+            with self._connection() as conn:
+                conn.execute("INSERT OR REPLACE INTO portfolios VALUES (?, ?, ?, ?, ?, ?)",
+                             (name, portfolio.portfolioName, portfolio.portfolioCurrency, float(portfolio.totalValue), len(current), modifiedAt))
+                conn.executemany("DELETE FROM holdings WHERE portfolio = ? AND ticker = ?", removed)
+                conn.executemany("INSERT OR REPLACE INTO holdings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", changed)
+                conn.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+                                 [(name, key, value) for key, value in (metadata or {}).items()])
+            self._saved[name] = (modifiedAt, current)
+        return len(changed) + len(removed)
+
+    def load(self, name: str, lazy: bool = False) -> Portfolio:
+        '''
+        Load the portfolio saved under `name`. With lazy=True only the
+        portfolio row is read now, its holdings are read the first time
+        the portfolio's stocks are used.
+        '''
+        row = self._connection().execute(
+            "SELECT portfolioName, currency, totalValue FROM portfolios WHERE name = ?", (name,)).fetchone()
+        if row == None:
+            raise FileNotFoundError(f"portfolio {name} does not exist.")
+        portfolioName, portfolioCurrency, totalValue = row
+
+        def loadStocks() -> list[Stock]:
+            with self._lock:
+                modifiedAt = self._modifiedAt(name)
+                rows = self._readHoldings(name)
+                self._saved[name] = (modifiedAt, {r[0]: (r[1], tuple(r[2:])) for r in rows})
+            return [Stock(ticker, price, currency, units, percent, value)
+                    for ticker, _, price, currency, units, percent, value in rows]
+
+        if lazy:
+            return Portfolio.lazy(loadStocks, portfolioName, totalValue, portfolioCurrency)
+        return Portfolio(portfolioName, loadStocks(), totalValue, portfolioCurrency)
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM holdings WHERE portfolio = ?", (name,))
+                conn.execute("DELETE FROM metadata WHERE portfolio = ?", (name,))
+                conn.execute("DELETE FROM portfolios WHERE name = ?", (name,))
+            self._saved.pop(name, None)
+
+    def getMetadata(self, name: str, key: str) -> str | None:
+        row = self._connection().execute(
+            "SELECT value FROM metadata WHERE portfolio = ? AND key = ?", (name, key)).fetchone()
+        return None if row == None else row[0]
+
+    def setMetadata(self, name: str, key: str, value: str) -> None:
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)", (name, key, value))
+
+    def importPickle(self, path: Path, name: str | None = None) -> str:
+        # pickles are read with RestrictedUnpickler, the file is left in place
+        path = Path(path)
+        portfolio = loadPickle(path)
+        name = name or path.stem
+        self.save(portfolio, name)
+        self.setMetadata(name, 'importedFrom', str(path))
+        return name
+
+    def importDirectory(self, directory: Path) -> list[str]:
+        '''
+        Import every .pickle file in `directory` that isn't in the store yet.
+        Timestamped copies of a portfolio become versions of it instead of
+        portfolios of their own. Files that can't be read safely are
+        skipped. Returns the imported names.
+        '''
+        imported = []
+        copies = []
+        for path in sorted(Path(directory).glob('*.pickle')):
+            if TIMESTAMPED_COPY.match(path.stem):
+                copies.append(path)
+                continue
+            if self.exists(path.stem):
+                continue
+            try:
+                imported.append(self.importPickle(path))
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError):
+                continue
+        for path in copies:
+            match = TIMESTAMPED_COPY.match(path.stem)
+            name = match['name']
+            if self.versions.hasSource(str(path)):
+                continue
+            try:
+                portfolio = loadPickle(path)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError):
+                continue
+            if not self.exists(name):
+                # the original is gone, the copy takes its place
+                self.save(portfolio, name)
+                self.setMetadata(name, 'importedFrom', str(path))
+            createdAt = time.mktime(time.strptime(match['time'], TIMESTAMP_FORMAT))
+            self.versions.commit(portfolio, name, createdAt, source=str(path))
+            imported.append(path.stem)
+        return imported
+
+_defaultStore: PortfolioStore | None = None
+
+def getDefaultStore() -> PortfolioStore | None:
+    return _defaultStore
+
+def setDefaultStore(store: PortfolioStore | None) -> None:
+    global _defaultStore
+    _defaultStore = store
@@ -0,0 +1,127 @@
+import cProfile
+import functools
+import inspect
+import io
+import pstats
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+# functions listed per report, by cumulative time
+DEFAULT_TOP = 25
+
+class _Action:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        # nested action name -> [calls, total wall time]
+        self.nested: dict[str, list] = {}
+
+class Profiler:
+    '''
+    Profiles named actions (a menu action, a manager call, a batch command)
+    with cProfile and tracemalloc and writes one compact report per action
+    into `directory`: wall time, peak memory and the top functions, plus a
+    .prof file that pstats or snakeviz can open.
+
+    Only the outermost action is profiled, cProfile can't nest. Actions
+    started inside it are listed in its report with their call count and
+    wall time.
+    '''
+    def __init__(self, directory: Path, top: int = DEFAULT_TOP) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.top = top
+        self.reports: list[Path] = []
+        self._stack: list[_Action] = []
+        self._startedTracing = not tracemalloc.is_tracing()
+        if self._startedTracing:
+            tracemalloc.start()
+
+    def close(self) -> None:
+        if self._startedTracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._startedTracing = False
+
+    @contextmanager
+    def action(self, name: str) -> Iterator[None]:
+        if self._stack:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                entry = self._stack[-1].nested.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += time.perf_counter() - start
+            return
+
+        current = _Action(name)
+        self._stack.append(current)
+        profile = cProfile.Profile()
+        startMemory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        error = None
+        profile.enable()
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            profile.disable()
+            wall = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - startMemory
+            self._stack.pop()
+            self._write(current, profile, wall, peak, error)
+
+    def _write(self, action: _Action, profile: cProfile.Profile, wall: float, peak: int,
+               error: BaseException | None) -> None:
+        stem = f"{len(self.reports) + 1:04d}-{re.sub(r'[^A-Za-z0-9_.-]', '_', action.name)}"
+        profile.dump_stats(self.directory / f"{stem}.prof")
+
+        out = io.StringIO()
+        out.write(f"action: {action.name}\n")
+        out.write(f"wall time: {wall * 1000:.3f} ms\n")
+        out.write(f"peak memory: {peak / 1024:.1f} KiB above the start of the action\n")
+        if error != None:
+            out.write(f"raised: {type(error).__name__}: {error}\n")
+        if action.nested:
+            out.write("\nnested actions (calls, total wall time):\n")
+            for name, (calls, total) in sorted(action.nested.items(), key=lambda item: -item[1][1]):
+                out.write(f"  {name:<40}{calls:>8}  {total * 1000:>10.3f} ms\n")
+        out.write("\n")
+        stats = pstats.Stats(profile, stream=out)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+
+        path = self.directory / f"{stem}.txt"
+        path.write_text(out.getvalue())
+        self.reports.append(path)
+
+    def wrap(self, obj: object, names: list[str]) -> None:
+        # profile every call of obj.<name> as an action named Class.name
+        for name in names:
+            method = getattr(obj, name)
+            setattr(obj, name, self._wrapped(method, f"{type(obj).__name__}.{name}"))
+
+    def _wrapped(self, method, actionName: str):
+        if inspect.iscoroutinefunction(method):
+            # time the awaited call, not just the creation of the coroutine
+            @functools.wraps(method)
+            async def asyncWrapper(*args, **kwargs):
+                with self.action(actionName):
+                    return await method(*args, **kwargs)
+            return asyncWrapper
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.action(actionName):
+                return method(*args, **kwargs)
+        return wrapper
+
+def publicMethods(obj: object, prefix: str = '') -> list[str]:
+    # names of the public plain methods of obj's class starting with prefix
+    return [name for name, member in inspect.getmembers(type(obj), inspect.isfunction)
+            if not name.startswith('_') and name.startswith(prefix)]
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+DEFAULT_FILE_NAME = ".quotecache.sqlite"
+DEFAULT_TTL = float(os.environ.get("INVESTOOL_QUOTE_TTL", 300))
+DEFAULT_MAX_ENTRIES = 10000
+
+class CachedQuote(NamedTuple):
+    price: float
+    currency: str
+    fetchedAt: float
+
+class QuoteCache:
+    '''
+    On-disk quote cache shared between investool processes. Quotes are keyed
+    by ticker and expire after `ttl` seconds. When more than `maxEntries`
+    quotes are stored the ones fetched longest ago are evicted.
+
+    SQLite in WAL mode lets readers run alongside one writer, and a busy
+    timeout makes concurrent writers wait instead of failing. Connections
+    are kept per thread so the refresh thread pool can use the cache too.
+    '''
+    def __init__(self, path: Path, ttl: float = DEFAULT_TTL, maxEntries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS quotes (
+                                ticker TEXT PRIMARY KEY,
+                                price REAL NOT NULL,
+                                currency TEXT NOT NULL,
+                                fetchedAt REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS quotes_fetchedAt ON quotes (fetchedAt)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn == None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(ticker: str) -> str:
+        return ticker.upper()
+
+    def get(self, ticker: str, maxAge: float | None = None) -> CachedQuote | None:
+        if maxAge == None:
+            maxAge = self.ttl
+        row = self._connection().execute(
+            "SELECT price, currency, fetchedAt FROM quotes WHERE ticker = ?",
+            (self._key(ticker),)).fetchone()
+        if row == None:
+            return None
+        quote = CachedQuote(*row)
+        if time.time() - quote.fetchedAt > maxAge:
+            return None
+        return quote
+
+    def getMany(self, tickers: list[str], maxAge: float | None = None) -> dict[str, CachedQuote]:
+        hits = {}
+        for ticker in tickers:
+            quote = self.get(ticker, maxAge)
+            if quote != None:
+                hits[ticker] = quote
+        return hits
+
+    def put(self, ticker: str, price: float, currency: str = '', fetchedAt: float | None = None) -> None:
+        self.putMany({ticker: (price, currency)}, fetchedAt)
+
+    def putMany(self, quotes: dict[str, tuple[float, str]], fetchedAt: float | None = None) -> None:
+        if not quotes:
+            return
+        if fetchedAt == None:
+            fetchedAt = time.time()
+        rows = [(self._key(t), price, currency or '', fetchedAt) for t, (price, currency) in quotes.items()]
+        with self._connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO quotes VALUES (?, ?, ?, ?)", rows)
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        count = conn.execute("SELECT COUNT(*) FROM quotes").fetchone()[0]
+        if count <= self.maxEntries:
+            return
+        conn.execute("""DELETE FROM quotes WHERE ticker IN (
+                            SELECT ticker FROM quotes ORDER BY fetchedAt ASC LIMIT ?)""",
+                     (count - self.maxEntries,))
+
+    def purgeExpired(self) -> int:
+        with self._connection() as conn:
+            cursor = conn.execute("DELETE FROM quotes WHERE fetchedAt < ?", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM quotes")
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM quotes").fetchone()[0]
+
+_defaultCache: QuoteCache | None = None
+
+def getDefaultCache() -> QuoteCache | None:
+    return _defaultCache
+
+def setDefaultCache(cache: QuoteCache | None) -> None:
+    global _defaultCache
+    _defaultCache = cache
@@ -0,0 +1,197 @@
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from stock import Stock, fetchQuoteInfo
+from quotecache import QuoteCache
+import metrics
+import fetching
+from lazyimport import lazyImport
+
+yf = lazyImport("yfinance")
+
+DEFAULT_MAX_WORKERS = 8
+
+@dataclass(frozen=True)
+class Quote:
+    price: float
+    currency: str = ''
+    # when the price was fetched, None for just now
+    fetchedAt: float | None = field(default=None, compare=False)
+
+@dataclass
+class RefreshResult:
+    quotes: dict[str, Quote] = field(default_factory=dict)
+    errors: dict[str, Exception] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return len(self.errors) == 0
+
+class QuoteProvider(ABC):
+    '''
+    Base class for anything that can price a list of tickers in one call.
+    Implementations return a RefreshResult; a ticker that could not be
+    priced goes into `errors` instead of raising.
+    '''
+    @abstractmethod
+    def getQuotes(self, tickers: list[str]) -> RefreshResult:
+        ...
+
+class YFinanceQuoteProvider(QuoteProvider):
+    def __init__(self, maxWorkers: int = DEFAULT_MAX_WORKERS) -> None:
+        self.maxWorkers = maxWorkers
+
+    def _fetchOne(self, tickers: "yf.Tickers", ticker: str) -> Quote:
+        info = fetching.getDefaultFetcher().fetch(
+            ("quote", ticker.upper()), lambda: fetchQuoteInfo(tickers.tickers[ticker.upper()], "bulk"), "quote")
+        if info == None:
+            raise LookupError(f"No quote available for {ticker}.")
+        price, currency = info
+        if price == None:
+            raise LookupError(f"No price available for {ticker}.")
+        return Quote(price, currency or '')
+
+    def getQuotes(self, tickers: list[str]) -> RefreshResult:
+        result = RefreshResult()
+        if not tickers:
+            return result
+        # yf.Tickers shares one session between every ticker, fast_info still
+        # needs a request per ticker so those are spread over a thread pool
+        bulk = yf.Tickers(" ".join(tickers))
+        with ThreadPoolExecutor(max_workers=min(self.maxWorkers, len(tickers))) as pool:
+            futures = {ticker: pool.submit(self._fetchOne, bulk, ticker) for ticker in tickers}
+        for ticker, future in futures.items():
+            try:
+                result.quotes[ticker] = future.result()
+            except Exception as e:
+                metrics.ERRORS.inc(site="getQuotes")
+                result.errors[ticker] = e
+        return result
+
+class FakeQuoteProvider(QuoteProvider):
+    '''
+    Serves quotes from a dict, optionally sleeping per call to imitate
+    network latency. Used by tests and benchmarks.
+    '''
+    def __init__(self, quotes: dict[str, Quote], latency: float = 0.0) -> None:
+        self.quotes = dict(quotes)
+        self.latency = latency
+        self.calls = 0
+
+    def getQuotes(self, tickers: list[str]) -> RefreshResult:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        result = RefreshResult()
+        for ticker in tickers:
+            if ticker in self.quotes:
+                result.quotes[ticker] = self.quotes[ticker]
+            else:
+                result.errors[ticker] = LookupError(f"No quote available for {ticker}.")
+        return result
+
+class CachedQuoteProvider(QuoteProvider):
+    '''
+    Answers from a QuoteCache where it can and only asks the wrapped
+    provider for tickers that are missing or expired.
+    '''
+    def __init__(self, provider: QuoteProvider, cache: QuoteCache) -> None:
+        self.provider = provider
+        self.cache = cache
+
+    def getQuotes(self, tickers: list[str]) -> RefreshResult:
+        result = RefreshResult()
+        hits = self.cache.getMany(tickers)
+        metrics.CACHE_REQUESTS.inc(len(hits), cache="quote", result="hit")
+        metrics.CACHE_REQUESTS.inc(len(tickers) - len(hits), cache="quote", result="miss")
+        for ticker, cached in hits.items():
+            result.quotes[ticker] = Quote(cached.price, cached.currency, cached.fetchedAt)
+
+        misses = [ticker for ticker in tickers if ticker not in hits]
+        if misses:
+            fetched = self.provider.getQuotes(misses)
+            self.cache.putMany({t: (q.price, q.currency) for t, q in fetched.quotes.items()})
+            result.quotes.update(fetched.quotes)
+            result.errors.update(fetched.errors)
+        return result
+
+_defaultProvider: QuoteProvider | None = None
+
+def getDefaultProvider() -> QuoteProvider | None:
+    return _defaultProvider
+
+def setDefaultProvider(provider: QuoteProvider | None) -> None:
+    global _defaultProvider
+    _defaultProvider = provider
+
+def _fetchFromStocks(stocks: list[Stock], maxWorkers: int) -> RefreshResult:
+    # fallback when there is no bulk provider: each stock prices itself but
+    # at most maxWorkers requests are in flight at once
+    def fetch(stock: Stock) -> Quote | None:
+        # the stock may be live in a portfolio, the currency is only written
+        # back later by applyQuotes
+        price, currency = stock.fetchQuote()
+        if price == None:
+            return None
+        return Quote(price, currency)
+
+    result = RefreshResult()
+    if not stocks:
+        return result
+    # one request per ticker even when several stocks share it
+    unique: dict[str, Stock] = {}
+    for stock in stocks:
+        unique.setdefault(stock.ticker, stock)
+    with ThreadPoolExecutor(max_workers=min(maxWorkers, len(unique))) as pool:
+        futures = [(ticker, pool.submit(fetch, stock)) for ticker, stock in unique.items()]
+    for ticker, future in futures:
+        try:
+            quote = future.result()
+        except Exception as e:
+            result.errors[ticker] = e
+            continue
+        if quote == None:
+            result.errors[ticker] = LookupError(f"No price available for {ticker}.")
+        else:
+            result.quotes[ticker] = quote
+    return result
+
+def fetchQuotes(stocks: list[Stock], provider: QuoteProvider | None = None,
+                maxWorkers: int = DEFAULT_MAX_WORKERS) -> RefreshResult:
+    # quotes for every stock, nothing is written back to the stocks
+    if provider == None:
+        provider = _defaultProvider
+    if provider == None:
+        return _fetchFromStocks(stocks, maxWorkers)
+    tickers = list(dict.fromkeys(stock.ticker for stock in stocks))
+    return provider.getQuotes(tickers)
+
+def applyQuotes(stocks: list[Stock], result: RefreshResult) -> None:
+    # write fetched prices and currencies back, a price the stock rejects
+    # moves its ticker into the errors
+    for stock in stocks:
+        quote = result.quotes.get(stock.ticker)
+        if quote == None:
+            continue
+        try:
+            stock.price = quote.price
+        except (TypeError, ValueError) as e:
+            result.errors[stock.ticker] = e
+            continue
+        if quote.currency:
+            stock.currency = quote.currency
+
+def refreshStocks(stocks: list[Stock], provider: QuoteProvider | None = None,
+                  maxWorkers: int = DEFAULT_MAX_WORKERS) -> RefreshResult:
+    '''
+    Fetch quotes for every stock and write prices and currencies back in a
+    single pass once all requests are done. Uses `provider` (or the default
+    provider) for one bulk request, otherwise falls back to a bounded thread
+    pool over Stock.fetchQuote. Failed tickers are reported in the
+    result and keep their previous price.
+    '''
+    result = fetchQuotes(stocks, provider, maxWorkers)
+    applyQuotes(stocks, result)
+    return result
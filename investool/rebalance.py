@@ -0,0 +1,270 @@
+import heapq
+import math
+
+import numpy as np
+
+import metrics
+
+ALLOCATION_MODES = ('greedy', 'optimal', 'exact')
+# branch and bound is only attempted up to this many buy candidates
+EXACT_MAX_HOLDINGS = 10
+
+# greedy fills are resolved one block at a time so a partial fill only
+# re-scans the rest of its block instead of every remaining holding
+FILL_BLOCK_SIZE = 1024
+
+PLAN_SECONDS = metrics.histogram("investool_plan_seconds", "Time to plan a rebalance, by planner and mode.")
+
+def adjustedPrices(prices: np.ndarray, fx: np.ndarray | None = None) -> np.ndarray:
+    prices = np.asarray(prices, dtype=float)
+    if fx is None:
+        return prices
+    return prices * np.asarray(fx, dtype=float)
+
+def allocationDifference(prices: np.ndarray, units: np.ndarray, targets: np.ndarray,
+                         totalValue: float, fx: np.ndarray | None = None) -> np.ndarray:
+    '''
+    Units to buy (+ve) or sell (-ve) per holding so each one reaches its
+    target share of totalValue. Ties round to even, like round(). Raises
+    ValueError when a holding has no price above 0.
+    '''
+    prices = adjustedPrices(prices, fx)
+    if not np.all(prices > 0):
+        # a missing price would plan an infinite number of units
+        raise ValueError("Every holding needs a price above 0 to be rebalanced.")
+    targetUnits = np.rint((np.asarray(targets, dtype=float) * totalValue) / prices).astype(np.int64)
+    return targetUnits - np.asarray(units, dtype=np.int64)
+
+def _sellOrder(diff: np.ndarray) -> np.ndarray:
+    # biggest sells first, ties keep their original order
+    idx = np.flatnonzero(diff < 0)
+    return idx[np.argsort(diff[idx], kind='stable')]
+
+def _buyOrder(diff: np.ndarray) -> np.ndarray:
+    # biggest buys first, ties keep their original order
+    idx = np.flatnonzero(diff >= 0)
+    return idx[np.argsort(-diff[idx], kind='stable')]
+
+def greedyFill(prices: np.ndarray, wanted: np.ndarray, cash: float) -> tuple[np.ndarray, float]:
+    '''
+    Buy `wanted` units of each holding in order while cash lasts. When a
+    holding can't be bought in full, as many whole units as the remaining
+    cash allows are bought instead and the next holding is tried.
+
+    Returns the units bought and the cash left over.
+    '''
+    prices = np.asarray(prices, dtype=float)
+    bought = np.array(wanted, dtype=np.int64)
+    costs = bought * prices
+    n = len(bought)
+    start = 0
+    while start < n:
+        end = min(n, start + FILL_BLOCK_SIZE)
+        # cash left before each holding if everything so far was bought in full
+        running = np.cumsum(np.concatenate(([cash], -costs[start:end])))
+        short = np.flatnonzero(costs[start:end] > running[:-1])
+        if short.size == 0:
+            cash = float(running[-1])
+            start = end
+            continue
+        k = start + int(short[0])
+        cash = float(running[short[0]])
+        units = int(cash / prices[k])
+        bought[k] = units
+        cash -= units * prices[k]
+        start = k + 1
+    return bought, cash
+
+def _weights(weights: np.ndarray | None, n: int) -> np.ndarray:
+    # every holding counts the same unless weighted
+    if weights is None:
+        return np.ones(n)
+    weights = np.asarray(weights, dtype=float)
+    if not np.all(weights > 0):
+        raise ValueError("Drift weights must be above 0.")
+    return weights
+
+def _drift(deviations: np.ndarray, weights: np.ndarray) -> float:
+    return float(np.sum(weights * deviations * deviations))
+
+def _waterFill(deviations: np.ndarray, weights: np.ndarray, cash: float) -> np.ndarray:
+    '''
+    Continuous relaxation: dollars to add to each holding to minimize
+    sum(w * (d + y)^2) with y >= 0 and sum(y) <= cash. Every holding that
+    gets money ends at the same weighted shortfall (water level).
+    '''
+    need = np.maximum(0.0, -deviations)
+    if need.sum() <= cash:
+        return need
+    breakpoints = need * weights
+    order = np.argsort(-breakpoints, kind='stable')
+    shortfall = np.cumsum(need[order])
+    inverseWeight = np.cumsum(1.0 / weights[order])
+    level = 0.0
+    for k in range(len(order)):
+        level = (shortfall[k] - cash) / inverseWeight[k]
+        nextBreakpoint = breakpoints[order[k + 1]] if k + 1 < len(order) else 0.0
+        if level >= nextBreakpoint:
+            break
+    return np.maximum(0.0, need - level / weights)
+
+def optimalFill(prices: np.ndarray, deviations: np.ndarray, cash: float,
+                weights: np.ndarray | None = None) -> tuple[np.ndarray, float]:
+    '''
+    Spend cash on whole units to minimize sum(w * d^2), where d is each
+    holding's value minus its target value and w its weight (1.0 unless
+    given). This is the fast marginal-gain allocation; exactFill gives the
+    true optimum for small portfolios.
+
+    Units from the continuous water-filling solution are bought first, then
+    the leftover cash goes one unit at a time to the holding with the best
+    drift reduction per dollar, kept in a max-heap. Only holdings still
+    short by more than half a unit can improve, so the heap phase adds
+    about one unit per holding and the whole fill is O(n log n).
+    '''
+    prices = np.asarray(prices, dtype=float)
+    d = np.array(deviations, dtype=float)
+    w = _weights(weights, len(prices))
+
+    bought = np.floor(_waterFill(d, w, cash) / prices).astype(np.int64)
+    spent = bought * prices
+    cash = float(cash - spent.sum())
+    d += spent
+
+    # gain per dollar of one more unit: w * (d^2 - (d + p)^2) / p
+    gains = w * (-2 * d - prices)
+    heap = [(-g, i) for i, g in enumerate(gains.tolist()) if g > 0]
+    heapq.heapify(heap)
+    while heap:
+        _, i = heapq.heappop(heap)
+        price = prices[i]
+        if price > cash:
+            # cash only goes down, this holding can never be afforded again
+            continue
+        bought[i] += 1
+        cash -= price
+        d[i] += price
+        gain = w[i] * (-2 * d[i] - price)
+        if gain > 0:
+            heapq.heappush(heap, (-gain, i))
+    return bought, cash
+
+def exactFill(prices: np.ndarray, deviations: np.ndarray, cash: float,
+              weights: np.ndarray | None = None) -> tuple[np.ndarray, float]:
+    '''
+    Same objective as optimalFill, solved exactly by branch and bound with
+    the water-filling relaxation as the lower bound. Meant for small
+    portfolios, raises ValueError past EXACT_MAX_HOLDINGS candidates.
+
+    The bound is convex in the units of the holding being branched on and
+    lowest next to its relaxed optimum, so units are tried outwards from
+    there and each direction stops at the first count it prunes. Only a
+    few counts per level are visited however much cash there is.
+    '''
+    prices = np.asarray(prices, dtype=float)
+    d = np.array(deviations, dtype=float)
+    w = _weights(weights, len(prices))
+    bought = np.zeros(len(prices), dtype=np.int64)
+
+    # only holdings short by more than half a unit can ever be worth buying,
+    # and never past the point where they overshoot their target
+    candidates = np.flatnonzero(-2 * d - prices > 0)
+    if len(candidates) > EXACT_MAX_HOLDINGS:
+        raise ValueError(f"exact allocation supports at most {EXACT_MAX_HOLDINGS} holdings to buy, got {len(candidates)}.")
+    p = prices[candidates]
+    cd = d[candidates]
+    cw = w[candidates]
+    upper = np.floor(-cd / p + 0.5).astype(np.int64)
+
+    best = [math.inf, np.zeros(len(candidates), dtype=np.int64)]
+    current = np.zeros(len(candidates), dtype=np.int64)
+
+    def search(k: int, remaining: float, driftSoFar: float) -> bool:
+        # False when the bound prunes this branch
+        relaxed = _waterFill(cd[k:], cw[k:], remaining)
+        bound = driftSoFar + _drift(cd[k:] + relaxed, cw[k:])
+        if bound >= best[0] - 1e-9:
+            return False
+        if k == len(candidates):
+            best[0] = driftSoFar
+            best[1] = current.copy()
+            return True
+        limit = min(int(upper[k]), int(remaining // p[k]))
+        start = min(limit, int(relaxed[0] // p[k]))
+
+        def branch(units: int) -> bool:
+            current[k] = units
+            cost = units * p[k]
+            dev = cd[k] + cost
+            return search(k + 1, remaining - cost, driftSoFar + float(cw[k] * dev * dev))
+
+        # the relaxed optimum lies between start and start + 1
+        branch(start)
+        for units in range(start + 1, limit + 1):
+            if not branch(units):
+                break
+        for units in range(start - 1, -1, -1):
+            if not branch(units):
+                break
+        current[k] = 0
+        return True
+
+    search(0, float(cash), 0.0)
+    bought[candidates] = best[1]
+    return bought, float(cash - np.sum(bought * prices))
+
+def _fill(mode: str, prices: np.ndarray, units: np.ndarray, targets: np.ndarray, totalValue: float,
+          cash: float, greedyWanted: np.ndarray, weights: np.ndarray | None) -> tuple[np.ndarray, float]:
+    if mode == 'greedy':
+        return greedyFill(prices, greedyWanted, cash)
+    deviations = np.asarray(units, dtype=float) * prices - np.asarray(targets, dtype=float) * totalValue
+    if mode == 'optimal':
+        return optimalFill(prices, deviations, cash, weights)
+    if mode == 'exact':
+        return exactFill(prices, deviations, cash, weights)
+    raise ValueError(f"Unknown allocation mode {mode}, expected one of {ALLOCATION_MODES}.")
+
+def planSellBuy(prices: np.ndarray, units: np.ndarray, targets: np.ndarray, totalValue: float,
+                liquidCash: float = 0.0, fx: np.ndarray | None = None,
+                mode: str = 'greedy', weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Vectorized PortfolioManager.calculateRebalanceSellBuy. Sells every
+    overweight holding, then buys underweight ones with the proceeds plus
+    liquidCash. `mode` picks how the buys are allocated: 'greedy' (the
+    original planner), 'optimal' (optimalFill) or 'exact' (exactFill).
+    `weights` (one per holding, 1.0 by default) scale each holding's
+    drift for the last two, greedy ignores them.
+
+    Returns holding indices in plan order (sells, then buys) and the unit
+    change for each of them.
+    '''
+    with PLAN_SECONDS.time(planner="sellbuy", mode=mode):
+        prices = adjustedPrices(prices, fx)
+        units = np.asarray(units, dtype=np.int64)
+        diff = allocationDifference(prices, units, targets, totalValue)
+        sells = _sellOrder(diff)
+        buys = _buyOrder(diff)
+
+        proceeds = (-1 * diff[sells]) * prices[sells]
+        totalCash = float(np.cumsum(np.concatenate(([liquidCash], proceeds)))[-1])
+        targets = np.asarray(targets, dtype=float)
+        w = None if weights is None else np.asarray(weights, dtype=float)[buys]
+        bought, _ = _fill(mode, prices[buys], units[buys], targets[buys], totalValue, totalCash, diff[buys], w)
+        return np.concatenate((sells, buys)), np.concatenate((diff[sells], bought))
+
+def planBuyOnly(prices: np.ndarray, units: np.ndarray, targets: np.ndarray, totalValue: float,
+                liquidCash: float = 0.0, fx: np.ndarray | None = None,
+                mode: str = 'greedy', weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Vectorized PortfolioManager.calculateRebalanceBuyOnly. Only liquidCash
+    is spent, with the same allocation modes as planSellBuy.
+    '''
+    with PLAN_SECONDS.time(planner="buyonly", mode=mode):
+        prices = adjustedPrices(prices, fx)
+        units = np.asarray(units, dtype=np.int64)
+        diff = allocationDifference(prices, units, targets, totalValue)
+        buys = _buyOrder(diff)
+        targets = np.asarray(targets, dtype=float)
+        w = None if weights is None else np.asarray(weights, dtype=float)[buys]
+        bought, _ = _fill(mode, prices[buys], units[buys], targets[buys], totalValue, liquidCash, diff[buys], w)
+        return buys, bought
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+
+import fxstore
+import metrics
+from quotes import QuoteProvider, RefreshResult, fetchQuotes
+from stock import Stock
+from lazyimport import lazyImport
+
+requests = lazyImport("requests")
+
+# seconds between two background refreshes
+DEFAULT_INTERVAL = float(os.environ.get("INVESTOOL_REFRESH_INTERVAL", 60))
+
+REFRESH_SECONDS = metrics.histogram("investool_background_refresh_seconds",
+                                    "Time taken by one background refresh.")
+
+class BackgroundRefresher:
+    '''
+    Keeps the quotes and exchange rates of the manager's current portfolio,
+    and of any watched portfolios in its store, warm from a daemon thread.
+    Every `interval` seconds (or when woken) prices older than the interval
+    are fetched without holding any lock, then written into the current
+    portfolio under its lock. Watched portfolios aren't loaded, their
+    quotes and rates only warm the quote cache and the FX store.
+
+    The thread never raises, a failed refresh is counted in the metrics
+    and kept in `lastResult` (or `lastFxError`) until the next one.
+    '''
+    def __init__(self, manager, interval: float = DEFAULT_INTERVAL, watched: list[str] | None = None,
+                 provider: QuoteProvider | None = None) -> None:
+        self.manager = manager
+        self.interval = interval
+        self.provider = provider
+        self.lastResult: RefreshResult | None = None
+        self.lastRefreshAt: float | None = None
+        self.lastFxError: Exception | None = None
+        self._watched = list(dict.fromkeys(watched or []))
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread != None and self._thread.is_alive()
+
+    @property
+    def watched(self) -> list[str]:
+        return list(self._watched)
+
+    def watch(self, name: str) -> None:
+        if name not in self._watched:
+            self._watched = self._watched + [name]
+
+    def unwatch(self, name: str) -> None:
+        self._watched = [n for n in self._watched if n != name]
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="investool-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread != None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self) -> None:
+        # refresh now instead of at the end of the interval
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refreshOnce()
+            except Exception:
+                metrics.ERRORS.inc(site="backgroundRefresh")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _watchedHoldings(self) -> tuple[list[str], list[str]]:
+        # tickers and currencies of the watched portfolios, from the store index
+        store = self.manager.store
+        names = self._watched
+        if store == None or not names:
+            return [], []
+        names = [name for name in names if store.exists(name)]
+        return store.tickers(names), store.currencies(names)
+
+    def refreshOnce(self) -> RefreshResult:
+        with REFRESH_SECONDS.time():
+            portfolio = self.manager.currentPortfolio
+            with portfolio.lock:
+                # detached copies, fetching never touches the live holdings
+                stocks = [Stock(s.ticker, currency=s.currency) for s in portfolio.staleStocks(self.interval)]
+                codes = [portfolio.portfolioCurrency] + portfolio.holdings.currencies
+            watchedTickers, watchedCodes = self._watchedHoldings()
+            known = {stock.ticker for stock in stocks}
+            stocks += [Stock(ticker) for ticker in watchedTickers if ticker not in known]
+
+            result = fetchQuotes(stocks, self.provider) if stocks else RefreshResult()
+            codes += watchedCodes + [quote.currency for quote in result.quotes.values() if quote.currency]
+            codes = list(dict.fromkeys(code.lower() for code in codes if code))
+            self.lastFxError = None
+            if len(codes) > 1:
+                try:
+                    fxstore.getDefaultStore().getMatrix(codes)
+                except (requests.RequestException, LookupError) as e:
+                    metrics.ERRORS.inc(site="backgroundRefresh")
+                    self.lastFxError = e
+
+            # the user may have loaded another portfolio meanwhile
+            if self.manager.currentPortfolio is portfolio:
+                portfolio.applyQuotes(result)
+                if self.lastFxError == None:
+                    portfolio.updateTotalPortfolioValue(updatePrices=False)
+            self.lastResult = result
+            self.lastRefreshAt = time.time()
+            return result
@@ -0,0 +1,170 @@
+import gzip
+import json
+import threading
+import time
+from bisect import bisect_right
+from pathlib import Path
+from typing import Callable
+
+import fxstore
+from quotes import Quote, QuoteProvider, RefreshResult
+
+FORMAT_VERSION = 1
+
+class Recording:
+    '''
+    Quotes and exchange rates captured from live sources, every call
+    stamped with the seconds since the recording started. Saved as gzipped
+    JSON lines, a header and then one line per provider call, so a market
+    day of refreshes stays small and can be replayed later without any
+    network.
+    '''
+    def __init__(self, startedAt: float | None = None) -> None:
+        self.startedAt = startedAt if startedAt != None else time.time()
+        self.rates: dict[tuple[str, str], dict[str, float]] = {}
+        self._times: dict[str, list[float]] = {}
+        self._quotes: dict[str, list[Quote]] = {}
+        self._events: list[dict] = []
+        self._lock = threading.Lock()
+
+    def addQuotes(self, t: float, quotes: dict[str, Quote]) -> None:
+        # calls are added in time order, each ticker keeps a sorted series
+        if not quotes:
+            return
+        with self._lock:
+            for ticker, quote in quotes.items():
+                self._times.setdefault(ticker, []).append(t)
+                self._quotes.setdefault(ticker, []).append(Quote(quote.price, quote.currency))
+            self._events.append({'t': round(t, 3),
+                                 'quotes': {ticker: [q.price, q.currency] for ticker, q in quotes.items()}})
+
+    def addRates(self, t: float, base: str, day: str, rates: dict[str, float]) -> None:
+        with self._lock:
+            self.rates[(day, base)] = dict(rates)
+            self._events.append({'t': round(t, 3), 'base': base, 'day': day, 'rates': rates})
+
+    @property
+    def tickers(self) -> list[str]:
+        return list(self._times)
+
+    @property
+    def duration(self) -> float:
+        return self._events[-1]['t'] if self._events else 0.0
+
+    def quoteAt(self, ticker: str, t: float) -> Quote | None:
+        # the last quote recorded at or before t, a ticker is priced at its
+        # first quote until then
+        times = self._times.get(ticker)
+        if times == None:
+            return None
+        return self._quotes[ticker][max(0, bisect_right(times, t) - 1)]
+
+    def ratesFor(self, base: str, day: str) -> dict[str, float] | None:
+        # rates of `day`, otherwise of the latest day recorded before it (or
+        # any day at all) so a recorded day can be replayed on another date
+        if (day, base) in self.rates:
+            return self.rates[(day, base)]
+        days = sorted(d for d, b in self.rates if b == base)
+        if not days:
+            return None
+        earlier = [d for d in days if d <= day]
+        return self.rates[((earlier or days)[-1], base)]
+
+    def save(self, path: Path) -> None:
+        with self._lock:
+            events = list(self._events)
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'version': FORMAT_VERSION, 'startedAt': self.startedAt}) + "\n")
+            for event in events:
+                f.write(json.dumps(event, separators=(',', ':')) + "\n")
+
+    @classmethod
+    def load(cls, path: Path) -> "Recording":
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported recording version {header.get('version')}.")
+            recording = cls(header['startedAt'])
+            for line in f:
+                event = json.loads(line)
+                if 'quotes' in event:
+                    recording.addQuotes(event['t'], {ticker: Quote(price, currency)
+                                                     for ticker, (price, currency) in event['quotes'].items()})
+                else:
+                    recording.addRates(event['t'], event['base'], event['day'], event['rates'])
+        return recording
+
+class RecordingQuoteProvider(QuoteProvider):
+    '''
+    Passes every call on to `provider` and adds the quotes it returned to a
+    recording. fetchRates does the same for exchange rates and can be used
+    as the fetcher of an FxStore.
+    '''
+    def __init__(self, provider: QuoteProvider, recording: Recording | None = None,
+                 fxFetcher: Callable[[str, str], dict[str, float]] = fxstore.fetchRates,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.provider = provider
+        self.recording = recording if recording != None else Recording(clock())
+        self.fxFetcher = fxFetcher
+        self._clock = clock
+
+    def getQuotes(self, tickers: list[str]) -> RefreshResult:
+        result = self.provider.getQuotes(tickers)
+        self.recording.addQuotes(self._clock() - self.recording.startedAt, result.quotes)
+        return result
+
+    def fetchRates(self, base: str, day: str) -> dict[str, float]:
+        rates = self.fxFetcher(base, day)
+        self.recording.addRates(self._clock() - self.recording.startedAt, base, day, rates)
+        return rates
+
+class ReplayQuoteProvider(QuoteProvider):
+    '''
+    Serves a recording as if it was live. Recorded time advances `speed`
+    times faster than the clock from `start` seconds into the recording (0
+    freezes it) and every call sleeps `latency` seconds first, so load
+    tests see realistic round trips. fetchRates can be used as the fetcher
+    of an FxStore. Tickers that were never recorded go into the errors.
+    '''
+    def __init__(self, recording: Recording, speed: float = 1.0, latency: float = 0.0, start: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep) -> None:
+        self.recording = recording
+        self.speed = speed
+        self.latency = latency
+        self.calls = 0
+        self.fxCalls = 0
+        self._clock = clock
+        self._sleep = sleep
+        self.seek(start)
+
+    @property
+    def position(self) -> float:
+        # seconds into the recording
+        return self._start + (self._clock() - self._startedAt) * self.speed
+
+    def seek(self, t: float) -> None:
+        self._start = t
+        self._startedAt = self._clock()
+
+    def getQuotes(self, tickers: list[str]) -> RefreshResult:
+        self.calls += 1
+        if self.latency:
+            self._sleep(self.latency)
+        t = self.position
+        result = RefreshResult()
+        for ticker in tickers:
+            quote = self.recording.quoteAt(ticker, t)
+            if quote != None:
+                result.quotes[ticker] = quote
+            else:
+                result.errors[ticker] = LookupError(f"No quote recorded for {ticker}.")
+        return result
+
+    def fetchRates(self, base: str, day: str) -> dict[str, float]:
+        self.fxCalls += 1
+        if self.latency:
+            self._sleep(self.latency)
+        rates = self.recording.ratesFor(base, day)
+        if rates == None:
+            raise LookupError(f"No exchange rates recorded for {base}.")
+        return dict(rates)
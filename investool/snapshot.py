@@ -0,0 +1,104 @@
+import time
+from types import MappingProxyType
+from typing import Mapping
+
+import numpy as np
+
+from fxstore import FxStore
+from portfolio import Portfolio
+
+class MarketSnapshot:
+    '''
+    Prices and exchange rates of one portfolio frozen at a point in time.
+    Planning and executing a rebalance against the same snapshot means the
+    trades that are executed are exactly the ones that were previewed, and
+    nothing is fetched twice.
+    '''
+    __slots__ = ('_portfolioCurrency', '_prices', '_currencies', '_fxRates', '_totalValue', '_takenAt')
+
+    def __init__(self, portfolioCurrency: str, prices: Mapping[str, float], currencies: Mapping[str, str],
+                 fxRates: Mapping[str, float], totalValue: float, takenAt: float | None = None) -> None:
+        self._portfolioCurrency = portfolioCurrency
+        self._prices = MappingProxyType(dict(prices))
+        self._currencies = MappingProxyType(dict(currencies))
+        self._fxRates = MappingProxyType(dict(fxRates))
+        self._totalValue = totalValue
+        self._takenAt = time.time() if takenAt == None else takenAt
+
+    def __setattr__(self, name, value) -> None:
+        if hasattr(self, '_takenAt'):
+            raise AttributeError("MarketSnapshot is immutable.")
+        object.__setattr__(self, name, value)
+
+    def __repr__(self) -> str:
+        return f"MarketSnapshot('{self._portfolioCurrency}', {len(self._prices)} prices, takenAt={self._takenAt})"
+
+    @property
+    def portfolioCurrency(self) -> str:
+        return self._portfolioCurrency
+
+    @property
+    def prices(self) -> Mapping[str, float]:
+        return self._prices
+
+    @property
+    def currencies(self) -> Mapping[str, str]:
+        return self._currencies
+
+    @property
+    def fxRates(self) -> Mapping[str, float]:
+        return self._fxRates
+
+    @property
+    def totalValue(self) -> float:
+        return self._totalValue
+
+    @property
+    def takenAt(self) -> float:
+        return self._takenAt
+
+    def adjustedPrice(self, ticker: str) -> float:
+        # price of one unit in the portfolio currency
+        return self._prices[ticker] * self._fxRates[self._currencies[ticker].lower()]
+
+    def priceArrays(self, tickers: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        # prices and FX rates into the portfolio currency, aligned with tickers
+        prices = np.array([self._prices[t] for t in tickers], dtype=float)
+        fx = np.array([self._fxRates[self._currencies[t].lower()] for t in tickers], dtype=float)
+        return prices, fx
+
+    @classmethod
+    def fromPortfolio(cls, portfolio: Portfolio, fx: FxStore | None = None,
+                      cachedOnly: bool = False) -> "MarketSnapshot":
+        # a background refresh can't change prices halfway through, the
+        # rates are fetched before locking it. They come from the default
+        # FX store unless `fx` is given, with cachedOnly they must already
+        # be in it.
+        if fx == None:
+            portfolio.warmFx(cachedOnly)
+        with portfolio.lock:
+            return cls._fromPortfolio(portfolio, fx)
+
+    @classmethod
+    def _fromPortfolio(cls, portfolio: Portfolio, fx: FxStore | None) -> "MarketSnapshot":
+        prices = {}
+        currencies = {}
+        fxRates = {}
+        for stock in portfolio.stocks:
+            prices[stock.ticker] = stock.price
+            currencies[stock.ticker] = stock.currency
+            currency = stock.currency.lower()
+            if currency in fxRates:
+                continue
+            if stock.currency == portfolio.portfolioCurrency:
+                fxRates[currency] = 1.0
+                continue
+            # raises when the rate can't be fetched, a snapshot never
+            # prices a holding at a made up rate
+            if fx == None:
+                fxRates[currency] = portfolio.getCurrencyExchange(stock.currency, portfolio.portfolioCurrency)
+            else:
+                fxRates[currency] = fx.getRate(stock.currency, portfolio.portfolioCurrency)
+        totalValue = sum(stock.units * prices[stock.ticker] * fxRates[stock.currency.lower()]
+                         for stock in portfolio.stocks)
+        return cls(portfolio.portfolioCurrency, prices, currencies, fxRates, totalValue)
@@ -1,6 +1,24 @@
-import yfinance as yf
 import re
-import requests
+
+import quotecache
+import metrics
+import fetching
+from lazyimport import lazyImport
+
+# yfinance pulls in pandas and is only needed once a quote is fetched
+yf = lazyImport("yfinance")
+requests = lazyImport("requests")
+
+QUOTE_SECONDS = metrics.histogram("investool_quote_fetch_seconds", "Time to fetch quotes from the network.")
+
+def fetchQuoteInfo(ticker, source: str) -> tuple[float | None, str | None] | None:
+    # last price and currency of a yfinance Ticker, one request
+    metrics.HTTP_REQUESTS.inc(kind="quote")
+    with QUOTE_SECONDS.time(source=source):
+        stockInfo = ticker.fast_info
+        if stockInfo == None:
+            return None
+        return stockInfo.get("lastPrice"), stockInfo.get("currency")
 
 FORM="""-------------------
 Stock ticker: {}
@@ -13,35 +31,83 @@ Stock ticker: {}
 
 TICKER_PATTERN = "[a-zA-Z]{1,4}(\.[a-zA-Z]{0,2})?"
 
+def wholeUnits(units) -> int:
+    # units live in an int64 column, a fraction would be cut off silently
+    whole = int(units)
+    if whole != units:
+        raise ValueError("Units must be a whole number.")
+    return whole
+
 class Stock:
+    # Numeric fields live either in the slots below (a standalone stock) or
+    # in one row of a HoldingsTable once the stock belongs to a portfolio.
+    __slots__ = ('_ticker', '_currency', '_price', '_units', '_percent', '_stockValue',
+                 '_table', '_row')
+
     def __init__(self, ticker='', price=0.0, currency='',  units=0, percent=0.0, stockValue=0.0) -> None:
+        self._table = None
+        self._row: int = -1
         self._ticker: str = ticker
         self._price: float = price
         self._currency: str = currency
-        self._units: int = units
+        self._units: int = wholeUnits(units)
         self._percent: float = percent
         self._stockValue: float = stockValue
 
     def __str__(self) -> str:
-        return FORM.format(self._ticker, self._price, self._currency, self._units, self._percent, self._stockValue)
+        return FORM.format(self._ticker, self.price, self._currency, self.units, self.percent, self.stockValue)
 
     def __repr__(self) -> str:
-        return f"Stock('{self._ticker}', {self._price}, '{self._currency}', {self._units}, {self._percent}, {self._stockValue})"
+        return f"Stock('{self._ticker}', {self.price}, '{self._currency}', {self.units}, {self.percent}, {self.stockValue})"
 
     def __eq__(self, other) -> bool:
         if not isinstance(other, Stock):
             return NotImplemented
         if (self._ticker == other._ticker and
-            self._price == other._price and
+            self.price == other.price and
             self._currency == other._currency and
-            self._units == other._units and
-            self._percent == other._percent and
-            self._stockValue == other._stockValue):
+            self.units == other.units and
+            self.percent == other.percent and
+            self.stockValue == other.stockValue):
             return True
         return False
 
     def __hash__(self) -> int:
-        return hash((self._ticker, self._price, self._currency, self._units, self._percent, self._stockValue))
+        return hash((self._ticker, self.price, self._currency, self.units, self.percent, self.stockValue))
+
+    def __getstate__(self) -> dict:
+        # same layout as stocks pickled before __slots__, always detached
+        return {'_ticker': self._ticker, '_price': self.price, '_currency': self._currency,
+                '_units': self.units, '_percent': self.percent, '_stockValue': self.stockValue}
+
+    def __setstate__(self, state: dict) -> None:
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        self._table = None
+        self._row = -1
+        for name in ('_ticker', '_price', '_currency', '_percent', '_stockValue'):
+            object.__setattr__(self, name, state[name])
+        self._units = wholeUnits(state['_units'])
+
+    def copy(self) -> "Stock":
+        # a detached stock with the same fields
+        return Stock(self._ticker, self.price, self._currency, self.units, self.percent, self.stockValue)
+
+    def _attach(self, table, row: int) -> None:
+        self._table = table
+        self._row = row
+
+    def _detach(self) -> None:
+        # copy the row back into the slots before leaving the table
+        table = self._table
+        if table == None:
+            return
+        self._price = float(table._price[self._row])
+        self._units = int(table._units[self._row])
+        self._percent = float(table._percent[self._row])
+        self._stockValue = float(table._value[self._row])
+        self._table = None
+        self._row = -1
 
     @property
     def ticker(self) -> str:
@@ -51,17 +117,25 @@ class Stock:
     def ticker(self, ticker: str) -> None:
         if not self.validTicker(ticker):
             raise Exception("Ticker format is invalid.")
+        if self._table != None:
+            # the portfolio holding it looks stocks up by ticker
+            raise ValueError("A stock can't be renamed while it belongs to a portfolio.")
         self._ticker = ticker
 
     @property
     def price(self) -> float:
-        return self._price
+        if self._table == None:
+            return self._price
+        return float(self._table._price[self._row])
 
     @price.setter
     def price(self, value: float) -> None:
         if value < 0:
             raise ValueError("Price can't be set to less than 0.")
-        self._price = value
+        if self._table == None:
+            self._price = value
+        else:
+            self._table._price[self._row] = value
 
     @property
     def currency(self) -> str:
@@ -70,20 +144,30 @@ class Stock:
     @currency.setter
     def currency(self, currency: str) -> None:
         self._currency = currency
+        if self._table != None:
+            self._table.setCurrency(self._row, currency)
 
     @property
     def units(self) -> int:
-        return self._units
+        if self._table == None:
+            return self._units
+        return int(self._table._units[self._row])
 
     @units.setter
     def units(self, value: int) -> None:
         if value < 0:
             raise ValueError("Cannot have a value of less than 0 for number of units.")
-        self._units = value
+        value = wholeUnits(value)
+        if self._table == None:
+            self._units = value
+        else:
+            self._table._units[self._row] = value
 
     @property
     def percent(self) -> float:
-        return self._percent
+        if self._table == None:
+            return self._percent
+        return float(self._table._percent[self._row])
 
     @percent.setter
     def percent(self, value: float) -> None:
@@ -91,35 +175,58 @@ class Stock:
             raise ValueError("Percent cannot be less than 0.")
         if value > 1:
             raise ValueError("Percent cannot be greater than 1.")
-        self._percent = value
+        if self._table == None:
+            self._percent = value
+        else:
+            self._table._percent[self._row] = value
 
     @property
     def stockValue(self) -> float:
-        return self._stockValue
+        if self._table == None:
+            return self._stockValue
+        return float(self._table._value[self._row])
 
     @stockValue.setter
     def stockValue(self, value: float) -> None:
         if value < 0:
             raise ValueError("Stock can't have a value less than 0.")
-        self._stockValue = value
+        if self._table == None:
+            self._stockValue = value
+        else:
+            self._table._value[self._row] = value
 
     def getCurrentPrice(self) -> float | None:
-        currentPrice = None
+        currentPrice, currency = self.fetchQuote()
+        if currency:
+            self.currency = currency
+        return currentPrice
+
+    def fetchQuote(self) -> tuple[float | None, str]:
+        # price and currency of the ticker, the stock itself is left alone
+        # so it can be fetched from any thread
+        cache = quotecache.getDefaultCache()
+        if cache != None and self.ticker:
+            cached = cache.get(self.ticker)
+            metrics.CACHE_REQUESTS.inc(cache="quote", result="miss" if cached == None else "hit")
+            if cached != None:
+                return cached.price, cached.currency
+
+        # concurrent requests for the same ticker share one fetch
         try:
-            stockInfo = yf.Ticker(self.ticker).fast_info
-            if stockInfo == None:
-                return None
-            else:
-                currentPrice = stockInfo.get("lastPrice")
+            info = fetching.getDefaultFetcher().fetch(
+                ("quote", self.ticker.upper()), lambda: fetchQuoteInfo(yf.Ticker(self.ticker), "stock"), "quote")
         except requests.HTTPError:
+            metrics.ERRORS.inc(site="getCurrentPrice")
             raise requests.HTTPError(f"Invalid ticker code {self.ticker} or unable to get request.")
         except KeyError:
-            return None
-        else:
-            stockCurrency = stockInfo.get("currency")
-            if stockCurrency:
-                self.currency = stockCurrency
-            return currentPrice
+            metrics.ERRORS.inc(site="getCurrentPrice")
+            return None, ''
+        if info == None:
+            return None, ''
+        currentPrice, stockCurrency = info
+        if cache != None and currentPrice != None:
+            cache.put(self.ticker, currentPrice, stockCurrency or self.currency)
+        return currentPrice, stockCurrency or ''
 
     def updatePrice(self) -> None:
         currentPrice = self.getCurrentPrice()
@@ -130,7 +237,7 @@ class Stock:
             self.price = currentPrice
 
     def updateValue(self) -> None:
-        self.stockValue = self._price * self._units
+        self.stockValue = self.price * self.units
 
     @classmethod
     def validTicker(cls, ticker: str) -> bool:
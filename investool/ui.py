@@ -1,12 +1,24 @@
+import datetime
+import time
 from pathlib import Path
 import manager
-from portfolio import Portfolio
+import constants
+from portfolio import Portfolio, DEFAULT_MAX_PRICE_AGE
+from snapshot import MarketSnapshot
 from stock import Stock
+from lazyimport import lazyImport
 import os
 
+requests = lazyImport("requests")
+
 class UI:
-    def __init__(self):
+    def __init__(self, maxPriceAge: float = DEFAULT_MAX_PRICE_AGE):
         self.manager = manager.PortfolioManager()
+        # menu redraws only fetch prices older than this, in seconds
+        self.maxPriceAge = maxPriceAge
+        # a running BackgroundRefresher, prices are then never fetched by
+        # the menus unless asked for
+        self.refresher = None
 
     def loadPortfolio(self, filename) -> bool:
         try:
@@ -47,16 +59,29 @@ class UI:
 
     def listPortfolios(self) -> list[str]:
         # shows list of portfolios and returns the list
-        listOfPortfolios = os.listdir(self.manager.DEFAULT_PATH)
+        if self.manager.store != None:
+            catalog = self.manager.getCatalog()
+            listOfPortfolios = [entry.name for entry in catalog]
+            descriptions = [self.describeCatalogEntry(entry) for entry in catalog]
+        else:
+            listOfPortfolios = self.manager.listPortfolios()
+            descriptions = listOfPortfolios
         print("List of portfolios available:")
         if len(listOfPortfolios) == 0:
             print(" empty")
         else:
-            for i, p in enumerate(listOfPortfolios):
+            for i, p in enumerate(descriptions):
                 print(f" {i} - {p}")
         return listOfPortfolios
 
+    def describeCatalogEntry(self, entry) -> str:
+        modified = datetime.datetime.fromtimestamp(entry.modifiedAt).strftime("%Y-%m-%d %H:%M")
+        return (f"{entry.name} ({entry.holdingCount} holdings, "
+                f"{entry.totalValue:.2f} {entry.currency.upper()}, saved {modified})")
+
     def createNewPortfolio(self) -> None:
+        # start from an empty portfolio, not the one loaded before going back
+        self.manager.currentPortfolio = Portfolio()
         # should ask for a new name for portfolio
         while True:
             newPortfolioName = input("Provide a portfolio name: ")
@@ -69,10 +94,10 @@ class UI:
 
         while True:
             portfolioCurrency = input("Provide a currency code for the portfolio: ").lower()
-            if portfolioCurrency not in manager.VALID_CURRENCIES:
+            if portfolioCurrency not in constants.VALID_CURRENCIES:
                 print("The provided currency is not in the list of valid currencies")
                 print("Here is the list of valid currencies:")
-                for currency in manager.VALID_CURRENCIES:
+                for currency in constants.VALID_CURRENCIES:
                     print(f"{currency}, ", end="")
                 continue
             else:
@@ -90,6 +115,9 @@ class UI:
             print(stock)
         print(f"Total portfolio value: {self.manager.currentPortfolio.totalValue:.2f}")
         print(f"Portfolio currency: {self.manager.currentPortfolio.portfolioCurrency}")
+        fetchedAt = self.manager.currentPortfolio.pricesFetchedAt()
+        if fetchedAt != None:
+            print(f"Prices as of: {datetime.datetime.fromtimestamp(fetchedAt).strftime('%Y-%m-%d %H:%M:%S')}")
 
     def getConfirmation(self, inputMessage) -> bool:
         while True:
@@ -124,6 +152,41 @@ class UI:
             break
         return inputValue
 
+    def printRefreshErrors(self, refreshResult) -> None:
+        if refreshResult == None or refreshResult.ok:
+            return
+        for ticker, error in refreshResult.errors.items():
+            print(f"Could not update the price of {ticker}: {error}")
+
+    def UIrefreshPortfolio(self, force: bool = False) -> None:
+        # prices fetched within maxPriceAge are kept unless forced, the
+        # totals are always recomputed
+        portfolio = self.manager.currentPortfolio
+        try:
+            if self.refresher != None and not force:
+                self.refresher.wake()
+                portfolio.updateTotalPortfolioValue(updatePrices=False, cachedFx=True)
+                refreshResult = self.refresher.lastResult
+            else:
+                maxAge = None if force else self.maxPriceAge
+                refreshResult = portfolio.updateTotalPortfolioValue(maxAge=maxAge)
+        except (requests.RequestException, LookupError) as e:
+            # a replayed session raises LookupError for rates it never recorded
+            print(f"Could not get the exchange rates needed to value the portfolio: {e}")
+            return
+        self.printRefreshErrors(refreshResult)
+
+    def takeSnapshot(self) -> MarketSnapshot:
+        # with a refresher running the menus never wait on the network, the
+        # plan uses what it last fetched
+        if self.refresher == None:
+            return self.manager.takeSnapshot(maxAge=self.maxPriceAge)
+        self.refresher.wake()
+        lastRefreshAt = self.refresher.lastRefreshAt
+        if lastRefreshAt == None or time.time() - lastRefreshAt > self.maxPriceAge:
+            print("Prices haven't been refreshed recently, the plan may use old prices.")
+        return self.manager.takeSnapshot(cachedOnly=True)
+
     def printHowUnitsHaveToChange(self, stockUnitMap: dict[Stock, int]) -> None:
         print()
         print("Showing how many units of each stock need to be sold or bought:")
@@ -146,11 +209,23 @@ class UI:
             print("The portfolio target allocation percentages are not valid.")
             self._resetTargetPercentAllocation()
 
-        stocksUnitDifferences = self.manager.calculateRebalanceSellBuy(liquidCash)
+        try:
+            snapshot = self.takeSnapshot()
+        except (requests.RequestException, LookupError) as e:
+            print(f"Could not get the exchange rates needed to rebalance: {e}")
+            print("Returning to previous menu.")
+            return
+        try:
+            stocksUnitDifferences = self.manager.calculateRebalanceSellBuy(liquidCash, snapshot)
+        except ValueError as e:
+            # e.g. a holding whose price could not be fetched
+            print(f"Could not plan the rebalance: {e}")
+            print("Returning to previous menu.")
+            return
         self.printHowUnitsHaveToChange(stocksUnitDifferences)
 
         if self.getConfirmation("Would you like to continue with this rebalancing? (y/N): "):
-            self.manager.rebalanceSellBuy(liquidCash)
+            self.manager.rebalanceSellBuy(liquidCash, plan=stocksUnitDifferences)
             remainingCash = self.manager.cashRemaining(stocksUnitDifferences, liquidCash)
             print(f"Cash Remaining is after rebalancing is: {remainingCash:.2f}")
         else:
@@ -167,11 +242,23 @@ class UI:
             print("The portfolio target allocation percentages are not valid.")
             self._resetTargetPercentAllocation()
 
-        stocksUnitDifferences = self.manager.calculateRebalanceBuyOnly(liquidCash)
+        try:
+            snapshot = self.takeSnapshot()
+        except (requests.RequestException, LookupError) as e:
+            print(f"Could not get the exchange rates needed to rebalance: {e}")
+            print("Returning to previous menu.")
+            return
+        try:
+            stocksUnitDifferences = self.manager.calculateRebalanceBuyOnly(liquidCash, snapshot)
+        except ValueError as e:
+            # e.g. a holding whose price could not be fetched
+            print(f"Could not plan the rebalance: {e}")
+            print("Returning to previous menu.")
+            return
         self.printHowUnitsHaveToChange(stocksUnitDifferences)
 
         if self.getConfirmation("Would you like to continue with this rebalancing? (y/N): "):
-            self.manager.rebalanceOnlyBuy(liquidCash)
+            self.manager.rebalanceOnlyBuy(liquidCash, plan=stocksUnitDifferences)
             remainingCash = self.manager.cashRemaining(stocksUnitDifferences, liquidCash)
             print(f"Cash Remaining is after rebalancing is: {remainingCash:.2f}")
         else:
@@ -207,7 +294,7 @@ class UI:
         # get ticker
         while True:
             ticker = self.getValidTicker("Please provide the ticker for the stock you would like to add: ")
-            if ticker in self.manager.currentPortfolio.getStockTickers():
+            if self.manager.currentPortfolio.hasStock(ticker):
                 print("The provided ticker already exists in the portfolio.")
                 if self.getConfirmation("Would you like to add a different stock? (y/N) (N returns to previous menu.): "):
                     continue
@@ -221,8 +308,13 @@ class UI:
         percent = self.getValidType("Please provide the target percent allocation for this stock (0 to 1): ", float, lowerLimit=0, upperLimit=1)
 
         if self.getConfirmation(f"Would you like to add this stock ({ticker}) (y/N)? "):
+            try:
+                refreshResult = self.manager.addStockToPortfolio(ticker, units, percent, maxAge=self.maxPriceAge)
+            except (requests.RequestException, LookupError) as e:
+                print(f"Stock {ticker} was added but the portfolio could not be valued: {e}")
+                return
             print(f"Stock {ticker} successfully added!")
-            self.manager.addStockToPortfolio(ticker, units, percent)
+            self.printRefreshErrors(refreshResult)
         else:
             print("Did not add the stock, returning to previous menu.")
         return
@@ -232,7 +324,7 @@ class UI:
             print("Please provide new target percentages for each stock.")
             for stock in self.manager.currentPortfolio.stocks:
                 newTargetPercent = self.getValidType(f"Please provide a new target allocation percent for {stock.ticker} (0 to 1): ", float)
-                stock.percent = newTargetPercent
+                self.manager.changePercentage(stock.ticker, newTargetPercent)
             print(f"New total percent is {round(self.manager.currentPortfolio.getTotalPercent(), 2)}")
 
     def UIremoveStock(self) -> None:
@@ -256,10 +348,11 @@ class UI:
     def UIbuyStock(self) -> None:
         print(" -- Buy stock -- ")
         ticker = self.getValidTicker("Please provide the ticker for the stock you would like to buy: ")
-        stock = self.manager.getStock(ticker)
+        # fails before asking for units when the ticker isn't held
+        self.manager.getStock(ticker)
 
         newUnits = self.getValidType("How many new units are you purchasing?: ", int)
-        stock.units += newUnits
+        self.manager.buyStock(ticker, newUnits)
         print(f"New units added to stock {ticker}.")
 
     def UIsellStock(self) -> None:
@@ -276,13 +369,13 @@ class UI:
             else:
                 print("No changes made. Returning to previous menu.")
         else:
-            stock.units -= unitsToSell
+            self.manager.sellStock(ticker, -unitsToSell)
             print(f"Removed {unitsToSell} from {stock.ticker}. Have {stock.units} units remaining.")
 
     def UIsaveAllChanges(self) -> None:
         if self.getConfirmation("Would you like to save all changes? (y/N): "):
             print("------")
-            print("Not overwritting the file will cause a new one to be created using the current date.")
+            print("Not overwritting the file will keep the current saved copy in the portfolio history.")
             overwrite = self.getConfirmation("Would you like to overwrite the current file? (y/N): ")
             self.manager.savePortfolio(overwrite=overwrite)
         self.clearScreen()
@@ -326,8 +419,9 @@ class UI:
         print(" 8 - sell stock")
         print(" 9 - go back and save portfolio")
         print(" 10 - Exit")
+        print(" 11 - refresh prices now")
 
-        getValidChoice = self.getValidType("Provide your choice: ", int, lowerLimit=1, upperLimit=10)
+        getValidChoice = self.getValidType("Provide your choice: ", int, lowerLimit=1, upperLimit=11)
 
         return getValidChoice
 
@@ -365,7 +459,7 @@ class UI:
             self.clearScreen()
             while True:
                 # main loop. Show main menu and perform action based on choice
-                self.manager.currentPortfolio.updateTotalPortfolioValue()
+                self.UIrefreshPortfolio()
                 mainChoice = self.mainMenu()
 
                 self.clearScreen()
@@ -393,6 +487,9 @@ class UI:
                     case 10:
                         print("Exiting Application (no saves)")
                         exit(0)
+                    case 11:
+                        self.UIrefreshPortfolio(force=True)
+                        self.UIprintCurrentPortfolioInformation()
                     case _:
                         exit(1)
                 input("Press any key to continue.")
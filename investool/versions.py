@@ -0,0 +1,151 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from portfolio import Portfolio
+from stock import Stock
+
+# holdings per content-addressed block
+BLOCK_SIZE = 64
+
+class VersionEntry(NamedTuple):
+    id: int
+    portfolio: str
+    createdAt: float
+    portfolioName: str
+    currency: str
+    totalValue: float
+    holdingCount: int
+
+class VersionStore:
+    '''
+    History of saved portfolios. A version stores the slow moving part of
+    its holdings (ticker, currency, units, target percent) as compressed
+    blocks of BLOCK_SIZE holdings, addressed by the hash of their content,
+    so versions where those didn't change share the same blocks. Prices
+    and values change with every refresh and are stored per version as one
+    compressed array.
+
+    Deleting versions never deletes blocks, gc() drops the ones no version
+    references anymore.
+    '''
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS version_blocks (
+                                hash TEXT PRIMARY KEY,
+                                data BLOB NOT NULL) WITHOUT ROWID""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS versions (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                portfolio TEXT NOT NULL,
+                                createdAt REAL NOT NULL,
+                                portfolioName TEXT NOT NULL,
+                                currency TEXT NOT NULL,
+                                totalValue REAL NOT NULL,
+                                holdingCount INTEGER NOT NULL,
+                                blocks TEXT NOT NULL,
+                                prices BLOB NOT NULL,
+                                source TEXT)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS versions_portfolio ON versions (portfolio, createdAt)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn == None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def commit(self, portfolio: Portfolio, name: str, createdAt: float | None = None,
+               source: str | None = None) -> int:
+        # record `portfolio` as a new version of `name`, returns its id
+        stocks = portfolio.stocks
+        rows = [[s.ticker, s.currency, int(s.units), float(s.percent)] for s in stocks]
+        blocks = []
+        hashes = []
+        for start in range(0, len(rows), BLOCK_SIZE):
+            data = json.dumps(rows[start:start + BLOCK_SIZE], separators=(',', ':')).encode()
+            digest = hashlib.sha256(data).hexdigest()
+            blocks.append((digest, zlib.compress(data)))
+            hashes.append(digest)
+        prices = np.array([[s.price, s.stockValue] for s in stocks], dtype=np.float64).reshape(-1, 2)
+        with self._connection() as conn:
+            conn.executemany("INSERT OR IGNORE INTO version_blocks VALUES (?, ?)", blocks)
+            cursor = conn.execute(
+                """INSERT INTO versions (portfolio, createdAt, portfolioName, currency, totalValue,
+                                         holdingCount, blocks, prices, source)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (name, time.time() if createdAt == None else createdAt, portfolio.portfolioName,
+                 portfolio.portfolioCurrency, float(portfolio.totalValue), len(rows),
+                 json.dumps(hashes), zlib.compress(prices.tobytes()), source))
+        return cursor.lastrowid
+
+    def listVersions(self, name: str) -> list[VersionEntry]:
+        # newest first, no blocks are read
+        rows = self._connection().execute(
+            f"SELECT {', '.join(VersionEntry._fields)} FROM versions WHERE portfolio = ? ORDER BY createdAt DESC, id DESC",
+            (name,)).fetchall()
+        return [VersionEntry(*row) for row in rows]
+
+    def hasSource(self, source: str) -> bool:
+        row = self._connection().execute("SELECT 1 FROM versions WHERE source = ?", (source,)).fetchone()
+        return row != None
+
+    def restore(self, versionId: int, name: str) -> Portfolio:
+        # the version must belong to `name`, ids are shared by every portfolio
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT portfolioName, currency, totalValue, blocks, prices FROM versions WHERE id = ? AND portfolio = ?",
+            (versionId, name)).fetchone()
+        if row == None:
+            raise ValueError(f"{name} has no version {versionId}.")
+        portfolioName, currency, totalValue, hashes, prices = row
+        hashes = json.loads(hashes)
+        data = dict(conn.execute(
+            f"SELECT hash, data FROM version_blocks WHERE hash IN ({', '.join('?' * len(hashes))})",
+            hashes).fetchall()) if hashes else {}
+        rows = [r for digest in hashes for r in json.loads(zlib.decompress(data[digest]))]
+        prices = np.frombuffer(zlib.decompress(prices), dtype=np.float64).reshape(-1, 2).tolist()
+        stocks = [Stock(ticker, price, stockCurrency, units, percent, value)
+                  for (ticker, stockCurrency, units, percent), (price, value) in zip(rows, prices)]
+        return Portfolio(portfolioName, stocks, totalValue, currency)
+
+    def delete(self, versionId: int) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM versions WHERE id = ?", (versionId,))
+
+    def prune(self, name: str, keep: int) -> int:
+        # delete all but the newest `keep` versions of `name`
+        old = [entry.id for entry in self.listVersions(name)[keep:]]
+        with self._connection() as conn:
+            conn.executemany("DELETE FROM versions WHERE id = ?", [(i,) for i in old])
+        return len(old)
+
+    def portfolios(self) -> list[str]:
+        rows = self._connection().execute("SELECT DISTINCT portfolio FROM versions ORDER BY portfolio").fetchall()
+        return [r[0] for r in rows]
+
+    def gc(self) -> int:
+        # drop blocks no version references, returns how many were dropped
+        conn = self._connection()
+        with conn:
+            # hold the write lock so no version can start using a block
+            # between finding it unused and deleting it
+            conn.execute("BEGIN IMMEDIATE")
+            referenced = set()
+            for (hashes,) in conn.execute("SELECT blocks FROM versions"):
+                referenced.update(json.loads(hashes))
+            unused = [(digest,) for (digest,) in conn.execute("SELECT hash FROM version_blocks")
+                      if digest not in referenced]
+            conn.executemany("DELETE FROM version_blocks WHERE hash = ?", unused)
+        conn.execute("VACUUM")
+        return len(unused)
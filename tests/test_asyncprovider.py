@@ -0,0 +1,87 @@
+import asyncio
+import time
+import pytest
+from investool import asyncprovider, portfolio
+from investool.asyncprovider import FakeAsyncProvider, warmFx
+from investool.fxstore import FxStore
+from investool.manager import PortfolioManager
+from investool.portfolio import Portfolio
+from investool.quotes import Quote
+from investool.stock import Stock
+
+QUOTES = {'msft': Quote(100.0, 'USD'), 'aapl': Quote(50.0, 'USD'), 'ry': Quote(130.0, 'CAD')}
+RATES = {'usd': {'cad': 1.25, 'usd': 1.0}}
+
+@pytest.fixture
+def store(monkeypatch):
+    def unreachable(base, day):
+        raise AssertionError("the synchronous fetcher was used")
+    store = FxStore(fetcher=unreachable)
+    monkeypatch.setattr(portfolio.fxstore, '_defaultStore', store)
+    return store
+
+@pytest.fixture
+def manager():
+    stocks = [Stock('msft', 90.0, 'USD', 10, 0.5, 0.0),
+              Stock('aapl', 40.0, 'USD', 10, 0.3, 0.0),
+              Stock('ry', 120.0, 'CAD', 5, 0.2, 0.0)]
+    return PortfolioManager(Portfolio('test', stocks, 0.0, 'CAD'))
+
+def test_fan_out():
+    quotes = {f't{i}': Quote(float(i), 'USD') for i in range(200)}
+    provider = FakeAsyncProvider(quotes, latency=0.05)
+
+    start = time.perf_counter()
+    result = asyncio.run(provider.getQuotes(list(quotes) + ['missing']))
+    elapsed = time.perf_counter() - start
+
+    assert result.quotes == quotes
+    assert list(result.errors) == ['missing']
+    # every request is in flight at once instead of one after the other
+    assert provider.maxInFlight == 201
+    assert elapsed < 1.0
+
+def test_warmFx(store):
+    provider = FakeAsyncProvider({}, RATES)
+    asyncio.run(warmFx(['CAD', 'USD'], provider))
+
+    assert store.getRate('USD', 'CAD') == 1.25
+    # rates already held are not fetched again
+    asyncio.run(warmFx(['CAD'], provider))
+    assert provider.fxCalls == 1
+
+def test_refresh_async(store, manager):
+    provider = FakeAsyncProvider(QUOTES, RATES)
+    p = manager.currentPortfolio
+    result = asyncio.run(p.updateTotalPortfolioValueAsync(provider))
+
+    assert result.ok
+    assert [s.price for s in p.stocks] == [100.0, 50.0, 130.0]
+    assert p.totalValue == pytest.approx(1000 * 1.25 + 500 * 1.25 + 650)
+    assert p.staleStocks(60) == []
+
+    # nothing is stale, so nothing is fetched
+    asyncio.run(p.updateAllStockPricesAsync(provider, maxAge=60))
+    assert provider.calls == 1
+
+@pytest.mark.parametrize("method", ['calculateRebalanceSellBuy', 'calculateRebalanceBuyOnly'])
+def test_async_plan_matches_sync(store, manager, method):
+    provider = FakeAsyncProvider(QUOTES, RATES)
+    plan = asyncio.run(getattr(manager, method + 'Async')(1000.0, provider))
+
+    assert dict(plan) == dict(getattr(manager, method)(1000.0, plan.snapshot))
+    assert plan.snapshot.totalValue == pytest.approx(2525.0)
+
+def test_provider_must_implement_fx():
+    class QuotesOnly(asyncprovider.AsyncQuoteProvider):
+        async def getQuotes(self, tickers):
+            return None
+
+    with pytest.raises(TypeError):
+        QuotesOnly()
+
+def test_default_provider(monkeypatch):
+    monkeypatch.setattr(asyncprovider, '_defaultProvider', None)
+    provider = asyncprovider.getDefaultProvider()
+    assert provider is asyncprovider.getDefaultProvider()
+    provider.close()
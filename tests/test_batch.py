@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+import pytest
+from investool.batch import rebalanceAll, writePlans
+from investool.manager import PortfolioManager
+from investool.portfolio import Portfolio
+from investool.portfoliostore import PortfolioStore
+from investool.quotes import FakeQuoteProvider, Quote
+from investool.stock import Stock
+
+QUOTES = {'msft': Quote(100.0, 'USD'), 'aapl': Quote(50.0, 'USD'), 'vti': Quote(20.0, 'USD')}
+
+def makePortfolio(name, units):
+    stocks = [Stock('msft', 0.0, 'USD', units[0], 0.5, 0.0),
+              Stock('aapl', 0.0, 'USD', units[1], 0.3, 0.0),
+              Stock('vti', 0.0, 'USD', units[2], 0.2, 0.0)]
+    return Portfolio(name, stocks, 0.0, 'USD')
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(PortfolioManager, 'DEFAULT_PATH', tmp_path)
+    store = PortfolioStore(tmp_path / "portfolios.sqlite")
+    for i in range(4):
+        store.save(makePortfolio(f"client{i}", [i, 10 - i, 5 * i]))
+    store.save(Portfolio('empty', [], 0.0, 'USD'))
+    return store
+
+def expectedPlan(store, name, cash, buyOnly):
+    portfolio = store.load(name)
+    for stock in portfolio.stocks:
+        stock.price = QUOTES[stock.ticker].price
+    manager = PortfolioManager(portfolio)
+    snapshot = manager.takeSnapshot(refresh=False)
+    if buyOnly:
+        plan = manager.calculateRebalanceBuyOnly(cash, snapshot)
+    else:
+        plan = manager.calculateRebalanceSellBuy(cash, snapshot)
+    return [(stock.ticker, units) for stock, units in plan.items()]
+
+@pytest.mark.parametrize("buyOnly", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_matches_manager_plans(store, buyOnly, workers):
+    provider = FakeQuoteProvider(QUOTES)
+    plans, result = rebalanceAll(store, liquidCash=500.0, buyOnly=buyOnly, provider=provider, maxWorkers=workers)
+    assert result.ok
+    # the union of every portfolio's tickers is fetched once
+    assert provider.calls == 1
+    assert [p.portfolio for p in plans] == ['client0', 'client1', 'client2', 'client3', 'empty']
+    for plan in plans:
+        trades = [(t.ticker, t.units) for t in plan.trades]
+        assert trades == expectedPlan(store, plan.portfolio, 500.0, buyOnly)
+        assert plan.cashRemaining == pytest.approx(500.0 - sum(t.units * t.price for t in plan.trades))
+
+def test_missing_price_is_reported(store):
+    provider = FakeQuoteProvider({'msft': QUOTES['msft']})
+    plans, result = rebalanceAll(store, ['client1'], provider=provider)
+    assert set(result.errors) == {'aapl', 'vti'}
+    assert plans[0].trades == []
+    assert plans[0].error
+
+def test_output_formats(store):
+    plans, _ = rebalanceAll(store, ['client1', 'empty'], 100.0, provider=FakeQuoteProvider(QUOTES))
+
+    out = io.StringIO()
+    writePlans(plans, out, 'json')
+    data = json.loads(out.getvalue())
+    assert data[0]['portfolio'] == 'client1'
+    assert {t['ticker'] for t in data[0]['trades']} == {'msft', 'aapl', 'vti'}
+    assert data[1]['trades'] == []
+
+    out = io.StringIO()
+    writePlans(plans, out, 'csv')
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert [r['ticker'] for r in rows] == [t.ticker for t in plans[0].trades] + ['']
+    with pytest.raises(ValueError):
+        writePlans(plans, io.StringIO(), 'xml')
+
+def test_currencies_use_one_fx_fetch(store, monkeypatch):
+    from investool import batch
+    from investool.fxstore import FxStore
+    fetches = []
+    def fetch(base, day):
+        fetches.append(base)
+        return {'usd': 1.0, 'cad': 1.25}
+    monkeypatch.setattr(batch.fxstore, '_defaultStore', FxStore(fetcher=fetch))
+    store.save(Portfolio('canadian', [Stock('msft', 0.0, 'USD', 1, 0.5, 0.0),
+                                      Stock('aapl', 0.0, 'USD', 1, 0.5, 0.0)], 0.0, 'CAD'))
+    store.save(Portfolio('loonie', [Stock('vti', 0.0, 'USD', 1, 1.0, 0.0)], 0.0, 'CAD'))
+
+    plans, _ = rebalanceAll(store, ['canadian', 'loonie'], provider=FakeQuoteProvider(QUOTES), maxWorkers=1)
+    assert fetches == ['usd']
+    assert plans[0].totalValue == pytest.approx(150.0 * 1.25)
+    assert {t.ticker: t.price for t in plans[0].trades}['msft'] == pytest.approx(125.0)
+    assert plans[1].error == None
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_errors_stay_with_their_portfolio(store, workers):
+    stocks = [Stock(f"t{i}", 0.0, 'USD', 0, 1 / 12, 0.0) for i in range(12)]
+    store.save(Portfolio('wide', stocks, 0.0, 'USD'))
+    quotes = {**QUOTES, **{f"t{i}": Quote(10.0, 'USD') for i in range(12)}}
+
+    plans, _ = rebalanceAll(store, ['client1', 'wide', 'missing'], 1000.0, mode='exact',
+                            provider=FakeQuoteProvider(quotes), maxWorkers=workers)
+    assert [p.portfolio for p in plans] == ['client1', 'wide', 'missing']
+    assert plans[0].error == None and plans[0].trades
+    # too many holdings for exact mode, and a name the store doesn't have
+    assert 'exact allocation' in plans[1].error and plans[1].currency == 'USD'
+    assert plans[2].error and plans[2].trades == []
+
+def test_reading_journal_leaves_it_alone(store):
+    manager = PortfolioManager(store=store)
+    manager.loadPortfolio('client1')
+    manager.buyStock('msft', 1)
+    path = manager.journal.path
+    with open(path, 'ab') as f:
+        # a write still in progress in the interactive session
+        f.write(b'{"seq": 2, "op": "tra')
+    size = path.stat().st_size
+
+    rebalanceAll(store, ['client1'], provider=FakeQuoteProvider(QUOTES), maxWorkers=1)
+    assert path.stat().st_size == size
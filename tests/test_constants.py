@@ -0,0 +1,61 @@
+import json
+import subprocess
+import sys
+import time
+import pytest
+from pathlib import Path
+from investool import constants
+
+IMPORT_BUDGET = 0.25
+
+@pytest.fixture
+def fresh_constants(tmp_path, monkeypatch):
+    monkeypatch.setattr(constants, "CACHE_DIRECTORY", tmp_path)
+    monkeypatch.setattr(constants, "_validCurrencies", None)
+    monkeypatch.setattr(constants, "_revalidation", None)
+    revalidations = []
+    monkeypatch.setattr(constants, "revalidateCurrencies", lambda: revalidations.append(1))
+    return revalidations
+
+def test_import_is_offline_and_fast():
+    code = ("import sys, time\n"
+            "sys.modules['requests'] = None\n"
+            "start = time.perf_counter()\n"
+            "import constants\n"
+            "print(time.perf_counter() - start)\n")
+    investoolDir = Path(constants.__file__).parent
+    out = subprocess.run([sys.executable, "-c", code], cwd=investoolDir,
+                         capture_output=True, text=True, check=True)
+    assert float(out.stdout.strip()) < IMPORT_BUDGET
+
+def test_bundled_fallback(fresh_constants):
+    currencies = constants.VALID_CURRENCIES
+    assert 'usd' in currencies
+    assert 'cad' in currencies
+    # no cache yet, so a revalidation is started in the background
+    constants._revalidation.join(timeout=5)
+    assert fresh_constants == [1]
+
+def test_fresh_cache_used(fresh_constants, tmp_path):
+    cacheFile = tmp_path / constants.CURRENCY_CACHE_FILE
+    cacheFile.write_text(json.dumps({"version": constants.CURRENCY_CACHE_VERSION,
+                                     "fetchedAt": time.time(),
+                                     "currencies": ["usd", "xyz"]}))
+    assert constants.getValidCurrencies() == {"usd", "xyz"}
+    assert constants._revalidation == None
+    assert fresh_constants == []
+
+def test_old_cache_version_ignored(fresh_constants, tmp_path):
+    cacheFile = tmp_path / constants.CURRENCY_CACHE_FILE
+    cacheFile.write_text(json.dumps({"version": 0, "fetchedAt": time.time(), "currencies": ["xyz"]}))
+    assert 'xyz' not in constants.getValidCurrencies()
+
+def test_revalidate_writes_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(constants, "CACHE_DIRECTORY", tmp_path)
+    monkeypatch.setattr(constants, "_validCurrencies", None)
+    monkeypatch.setattr(constants, "fetchCurrencies", lambda: {"usd", "eur"})
+    constants.revalidateCurrencies()
+
+    assert constants.getValidCurrencies() == {"usd", "eur"}
+    cached = json.loads((tmp_path / constants.CURRENCY_CACHE_FILE).read_text())
+    assert cached["currencies"] == ["eur", "usd"]
@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from investool import fxstore, portfolio
+from investool.fetching import Coalescer, Fetcher, TokenBucket, retry
+from investool.snapshot import MarketSnapshot
+from investool.stock import Stock
+
+class StubServer:
+    '''
+    Local HTTP server answering every GET with `status` for the first
+    `failures` requests and then with `body`, after `delay` seconds.
+    '''
+    def __init__(self, body: dict, failures: int = 0, status: int = 429, delay: float = 0.0) -> None:
+        self.body = body
+        self.failures = failures
+        self.status = status
+        self.delay = delay
+        self.hits = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.hits += 1
+                    failing = stub.hits <= stub.failures
+                time.sleep(stub.delay)
+                if failing:
+                    self.send_response(stub.status)
+                    self.send_header("Retry-After", "0")
+                    self.end_headers()
+                    return
+                data = json.dumps(stub.body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/{{}}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub(monkeypatch):
+    servers = []
+    def start(*args, **kwargs):
+        server = StubServer(*args, **kwargs)
+        servers.append(server)
+        monkeypatch.setattr(fxstore, 'API_URL', server.url)
+        return server
+    # fast retries, no rate limit unless a test asks for one
+    monkeypatch.setattr(fxstore.fetching, '_defaultFetcher', Fetcher(rate=None, baseDelay=0.01))
+    yield start
+    for server in servers:
+        server.close()
+
+def test_token_bucket():
+    now = [0.0]
+    def sleep(seconds):
+        now[0] += seconds
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert now[0] == pytest.approx(0.5)
+
+def test_retry_backoff():
+    calls = []
+    delays = []
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError
+        return "ok"
+
+    assert retry(flaky, attempts=4, baseDelay=1.0, sleep=delays.append) == "ok"
+    assert len(calls) == 3
+    # full jitter: each wait is between 0 and base * 2**attempt
+    assert 0 <= delays[0] <= 1.0 and 0 <= delays[1] <= 2.0
+
+@pytest.mark.parametrize("error, attempts", [(ConnectionError, 2), (ValueError, 1)])
+def test_retry_gives_up(error, attempts):
+    calls = []
+    def broken():
+        calls.append(1)
+        raise error
+    with pytest.raises(error):
+        retry(broken, attempts=2, sleep=lambda s: None)
+    # errors that aren't transient are not retried
+    assert len(calls) == attempts
+
+def test_coalescer_shares_one_call():
+    coalescer = Coalescer()
+    release = threading.Event()
+    calls = []
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 42
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(coalescer.do("key", slow))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [42] * 8
+    assert len(calls) == 1
+
+def test_fetchRates_retries_throttling(stub):
+    server = stub({'usd': {'cad': 1.3}}, failures=2)
+    assert fxstore.fetchRates('usd', date.today().isoformat()) == {'cad': 1.3}
+    assert server.hits == 3
+
+def test_fetchRates_coalesces(stub):
+    server = stub({'usd': {'cad': 1.3}}, delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fxstore.fetchRates('usd', date.today().isoformat())))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [{'cad': 1.3}] * 5
+    assert server.hits == 1
+
+def test_fetchRates_client_error_not_retried(stub):
+    server = stub({}, failures=10, status=404)
+    with pytest.raises(requests.HTTPError):
+        fxstore.fetchRates('usd', date.today().isoformat())
+    assert server.hits == 1
+
+def test_snapshot_raises_instead_of_rate_of_one(monkeypatch):
+    def unreachable(base, day):
+        raise requests.ConnectionError("no network")
+    monkeypatch.setattr(portfolio.fxstore, '_defaultStore', portfolio.fxstore.FxStore(fetcher=unreachable))
+    p = portfolio.Portfolio('test', [Stock('msft', 10, 'USD', 1, 1.0, 10)], 10.0, 'CAD')
+
+    with pytest.raises(requests.ConnectionError):
+        MarketSnapshot.fromPortfolio(p)
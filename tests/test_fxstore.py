@@ -0,0 +1,122 @@
+import pickle
+import pytest
+from investool import portfolio
+from investool.fxstore import FxStore
+from investool.manager import PortfolioManager
+
+RATES = {'usd': {'usd': 1.0, 'cad': 1.34, 'eur': 0.91, 'jpy': 150.0}}
+
+@pytest.fixture
+def fetches():
+    return []
+
+@pytest.fixture
+def fetcher(fetches):
+    def fetch(base, day):
+        fetches.append((base, day))
+        return dict(RATES[base])
+    return fetch
+
+def test_getRate(fetcher, fetches):
+    store = FxStore(fetcher=fetcher)
+    assert store.getRate('USD', 'CAD') == 1.34
+    assert store.getRate('usd', 'eur') == 0.91
+    assert store.getRate('cad', 'CAD') == 1.0
+    assert len(fetches) == 1
+
+def test_persisted_only_used_rates(tmp_path, fetcher, fetches):
+    path = tmp_path / "fx.sqlite"
+    store = FxStore(path, fetcher)
+    store.getRate('usd', 'cad', '2024-01-02')
+
+    reopened = FxStore(path, fetcher)
+    assert reopened.getRate('usd', 'cad', '2024-01-02') == 1.34
+    assert reopened.hasRates('usd', '2024-01-02')
+    assert not reopened.hasRates('usd', '2024-01-03')
+    assert len(fetches) == 1
+
+    rows = reopened._connection().execute("SELECT quote FROM fx_rates").fetchall()
+    assert rows == [('cad',)]
+
+def test_putRates_persisted(tmp_path, fetcher, fetches):
+    path = tmp_path / "fx.sqlite"
+    FxStore(path, fetcher).putRates(RATES['usd'], '2024-01-02')
+
+    assert FxStore(path, fetcher).getRate('usd', 'jpy', '2024-01-02') == 150.0
+    assert fetches == []
+
+def test_missing_quote_refetches(tmp_path, fetcher, fetches):
+    path = tmp_path / "fx.sqlite"
+    FxStore(path, fetcher).getRate('usd', 'cad', '2024-01-02')
+    FxStore(path, fetcher).getRate('usd', 'jpy', '2024-01-02')
+    assert len(fetches) == 2
+
+def test_portfolio_uses_shared_store(fetcher, fetches, monkeypatch):
+    store = FxStore(fetcher=fetcher)
+    monkeypatch.setattr(portfolio.fxstore, "_defaultStore", store)
+    p1 = portfolio.Portfolio('a', [], 0.0, 'CAD')
+    p2 = portfolio.Portfolio('b', [], 0.0, 'EUR')
+    assert p1.getCurrencyExchange('USD', 'CAD') == 1.34
+    assert p2.getCurrencyExchange('USD', 'EUR') == 0.91
+    assert p1.currencyUpToDate('usd')
+    assert len(fetches) == 1
+
+def test_old_pickle_cache_dropped():
+    p = portfolio.Portfolio('old', [], 0.0, 'CAD')
+    p._currencyExchangeCache = {'usd': {'date': '2024-01-01', 'usd': {'cad': 1.3}}}
+    loaded = pickle.loads(pickle.dumps(p))
+    assert not hasattr(loaded, '_currencyExchangeCache')
+    assert loaded == p
+
+def test_triangulation_single_fetch(fetcher, fetches):
+    store = FxStore(fetcher=fetcher)
+    assert store.getRate('cad', 'eur') == pytest.approx(0.91 / 1.34)
+    assert store.getRate('eur', 'usd') == pytest.approx(1 / 0.91)
+    assert store.getRate('jpy', 'cad') == pytest.approx(1.34 / 150.0)
+    assert fetches == [('usd', fetches[0][1])]
+
+def test_matrix(fetcher):
+    store = FxStore(fetcher=fetcher)
+    fx = store.getMatrix(['USD', 'cad', 'eur', 'cad'])
+    assert fx.codes == ['usd', 'cad', 'eur']
+    assert fx.matrix.shape == (3, 3)
+    assert fx.matrix[fx.index['cad'], fx.index['eur']] == pytest.approx(0.91 / 1.34)
+    assert fx.rate('eur', 'cad') == pytest.approx(1.34 / 0.91)
+    assert fx.ratesInto('cad').tolist() == pytest.approx([1.34, 1.0, 1.34 / 0.91])
+
+def test_updateAllStockValues_vectorized(fetcher, fetches, monkeypatch):
+    monkeypatch.setattr(portfolio.fxstore, "_defaultStore", FxStore(fetcher=fetcher))
+    stocks = [portfolio.Stock('msft', 10, 'USD', 2, 0.5, 0),
+              portfolio.Stock('sap', 20, 'EUR', 1, 0.25, 0),
+              portfolio.Stock('zag.to', 30, 'CAD', 1, 0.25, 0)]
+    p = portfolio.Portfolio('multi', stocks, 0.0, 'CAD')
+    p.updateTotalPortfolioValue(updatePrices=False)
+
+    assert stocks[0].stockValue == pytest.approx(20 * 1.34)
+    assert stocks[1].stockValue == pytest.approx(20 * 1.34 / 0.91)
+    assert stocks[2].stockValue == 30
+    assert p.totalValue == pytest.approx(sum(s.stockValue for s in stocks))
+    assert len(fetches) == 1
+
+def test_single_currency_no_fetch(fetcher, fetches, monkeypatch):
+    monkeypatch.setattr(portfolio.fxstore, "_defaultStore", FxStore(fetcher=fetcher))
+    p = portfolio.Portfolio('cad', [portfolio.Stock('zag.to', 30, 'CAD', 2, 1.0, 0)], 0.0, 'CAD')
+    p.updateAllStockValues()
+    assert p.stocks[0].stockValue == 60
+    assert fetches == []
+
+def test_cached_snapshot_never_fetches(fetcher, fetches, monkeypatch):
+    monkeypatch.setattr(portfolio.fxstore, "_defaultStore", FxStore(fetcher=fetcher))
+    stocks = [portfolio.Stock('msft', 10, 'USD', 2, 0.5, 0),
+              portfolio.Stock('zag.to', 30, 'CAD', 1, 0.5, 0)]
+    manager = PortfolioManager(portfolio.Portfolio('multi', stocks, 0.0, 'CAD'))
+    with pytest.raises(LookupError):
+        manager.takeSnapshot(cachedOnly=True)
+    with pytest.raises(LookupError):
+        manager.currentPortfolio.updateTotalPortfolioValue(updatePrices=False, cachedFx=True)
+    assert fetches == []
+
+    portfolio.fxstore.getDefaultStore().getRate('usd', 'cad')
+    snapshot = manager.takeSnapshot(cachedOnly=True)
+    assert snapshot.totalValue == pytest.approx(20 * 1.34 + 30)
+    assert len(fetches) == 1
@@ -0,0 +1,56 @@
+import pickle
+import numpy as np
+import pytest
+from investool.stock import Stock
+from investool.portfolio import Portfolio
+from investool.holdings import HoldingsTable
+
+@pytest.fixture
+def stocks():
+    return [Stock('msft', 10.0, 'USD', 10, 0.5, 0),
+            Stock('appl', 20.0, 'USD', 10, 0.25, 0),
+            Stock('zag.to', 30.0, 'CAD', 10, 0.25, 0)]
+
+def test_stock_is_row_view(stocks):
+    table = HoldingsTable.fromStocks(stocks)
+    stocks[1].price = 21.0
+    assert table.prices.tolist() == [10.0, 21.0, 30.0]
+
+    table.units[:] += 1
+    assert [s.units for s in stocks] == [11, 11, 11]
+
+def test_columns_are_views(stocks):
+    table = HoldingsTable.fromStocks(stocks)
+    assert np.shares_memory(table.prices, table._price)
+    values = table.values
+    values[:] = table.prices * table.units
+    assert stocks[2].stockValue == 300.0
+
+def test_remove_keeps_order(stocks):
+    table = HoldingsTable.fromStocks(stocks)
+    table.remove(stocks[0])
+    assert len(table) == 2
+    assert table.tickers == ['appl', 'zag.to']
+    assert table.prices.tolist() == [20.0, 30.0]
+    # removed stocks keep their values once detached
+    stocks[0].units = 3
+    assert stocks[0].units == 3 and stocks[0].price == 10.0
+
+def test_grow():
+    table = HoldingsTable(2)
+    for i in range(50):
+        table.append(Stock(f"t{i}", float(i), 'USD', i, 0.0, 0))
+    assert table.units.tolist() == list(range(50))
+
+def test_slots_and_pickle(stocks):
+    p = Portfolio('test', stocks, 0.0, 'CAD')
+    assert not hasattr(stocks[0], '__dict__')
+    loaded = pickle.loads(pickle.dumps(p))
+    assert loaded == p
+    assert loaded.holdings.prices.tolist() == [10.0, 20.0, 30.0]
+
+def test_portfolio_updates_value_column(stocks):
+    p = Portfolio('cad', [Stock('zag.to', 30.0, 'CAD', 2, 0.5, 0), Stock('xiu.to', 10.0, 'CAD', 3, 0.5, 0)], 0.0, 'CAD')
+    p.updateTotalPortfolioValue(updatePrices=False)
+    assert p.holdings.values.tolist() == [60.0, 30.0]
+    assert p.totalValue == 90.0
@@ -0,0 +1,78 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from investool import httpcache
+from investool.httpcache import HttpCache, getJson
+
+BODY = {'usd': {'cad': 1.3, 'eur': 0.9}}
+ETAG = '"v1"'
+
+@pytest.fixture
+def server():
+    # answers with an ETag and honours If-None-Match, over keep-alive
+    # connections; records the status sent and the client port of each request
+    log = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path == "/missing.json":
+                status, data = 404, b""
+            elif self.headers.get("If-None-Match") == ETAG:
+                status, data = 304, b""
+            else:
+                status, data = 200, json.dumps(BODY).encode()
+            log.append((status, self.client_address[1]))
+            self.send_response(status)
+            if status != 404:
+                self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.log = log
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def cache(tmp_path):
+    return HttpCache(tmp_path / "http.sqlite")
+
+def test_conditional_get(server, cache):
+    url = server.url + "usd.json"
+    assert getJson(url, cache=cache) == BODY
+    assert getJson(url, cache=cache) == BODY
+
+    # the second request was answered with a 304 and the stored body
+    assert [status for status, _ in server.log] == [200, 304]
+    assert cache.get(url).etag == ETAG
+
+def test_cache_shared_between_instances(server, tmp_path):
+    url = server.url + "usd.json"
+    getJson(url, cache=HttpCache(tmp_path / "http.sqlite"))
+    # another process opening the same file revalidates too
+    assert getJson(url, cache=HttpCache(tmp_path / "http.sqlite")) == BODY
+    assert [status for status, _ in server.log] == [200, 304]
+
+def test_pooled_session_reuses_connection(server):
+    for _ in range(3):
+        getJson(server.url + "usd.json")
+    ports = {port for _, port in server.log}
+    assert len(ports) == 1
+    assert httpcache.getSession() is httpcache.getSession()
+
+def test_errors_raise(server, cache):
+    with pytest.raises(requests.HTTPError):
+        getJson(server.url + "missing.json", cache=cache)
+    assert len(cache) == 0
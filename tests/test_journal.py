@@ -0,0 +1,143 @@
+import pytest
+from investool import manager
+from investool.journal import TradeJournal
+from investool.manager import PortfolioManager
+from investool.portfolio import Portfolio
+from investool.stock import Stock
+from investool.portfoliostore import PortfolioStore
+from tests.test_portfolio import standard_portfolio
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return tmp_path / "test.log"
+
+def test_append_and_replay(journal_path, standard_portfolio):
+    journal = TradeJournal(journal_path)
+    assert journal.append('trade', 'msft', units=5) == 1
+    journal.append('percent', 'appl', percent=0.3)
+    journal.append('remove', 'zag.to')
+    journal.close()
+
+    reopened = TradeJournal(journal_path)
+    assert (reopened.lastSeq, reopened.pending) == (3, 3)
+    assert reopened.replay(standard_portfolio) == 3
+    assert standard_portfolio.getStock('msft').units == 15
+    assert standard_portfolio.getStock('appl').percent == 0.3
+    assert not standard_portfolio.hasStock('zag.to')
+
+def test_replay_after_seq(journal_path, standard_portfolio):
+    journal = TradeJournal(journal_path)
+    journal.append('trade', 'msft', units=5)
+    journal.append('trade', 'msft', units=1)
+    assert journal.replay(standard_portfolio, afterSeq=1) == 2
+    assert standard_portfolio.getStock('msft').units == 11
+
+def test_torn_line_is_dropped(journal_path, standard_portfolio):
+    journal = TradeJournal(journal_path)
+    journal.append('trade', 'msft', units=5)
+    journal.close()
+    with open(journal_path, 'ab') as f:
+        f.write(b'{"seq": 2, "op": "tra')
+
+    reopened = TradeJournal(journal_path)
+    assert reopened.lastSeq == 1
+    assert reopened.append('trade', 'msft', units=1) == 2
+    reopened.replay(standard_portfolio)
+    assert standard_portfolio.getStock('msft').units == 16
+
+def test_two_writers(journal_path):
+    first = TradeJournal(journal_path)
+    second = TradeJournal(journal_path)
+    assert first.append('trade', 'msft', units=1) == 1
+    # the second writer catches up instead of reusing seq 1
+    assert second.append('trade', 'msft', units=2) == 2
+    assert first.append('trade', 'msft', units=3) == 3
+
+    second.compact(3)
+    # the first still had the replaced file open, its next entry goes into
+    # the new one after the checkpoint
+    assert first.append('trade', 'msft', units=4) == 4
+    assert [(e['seq'], e['units']) for e in TradeJournal(journal_path).entries()] == [(4, 4)]
+
+def test_compact_keeps_sequence(journal_path):
+    journal = TradeJournal(journal_path)
+    for _ in range(3):
+        journal.append('trade', 'msft', units=1)
+    journal.compact(2)
+    assert [e['seq'] for e in journal.entries()] == [3]
+    assert journal.pending == 1
+
+    journal.compact(3)
+    reopened = TradeJournal(journal_path)
+    assert list(reopened.entries()) == []
+    assert reopened.append('trade', 'msft', units=1) == 4
+
+@pytest.fixture
+def journaled_manager(tmp_path, standard_portfolio):
+    store = PortfolioStore(tmp_path / "portfolios.sqlite")
+    m = PortfolioManager(standard_portfolio, store)
+    m.DEFAULT_PATH = tmp_path
+    m.savePortfolio()
+    return m
+
+def reload(m):
+    other = PortfolioManager(store=m.store)
+    other.DEFAULT_PATH = m.DEFAULT_PATH
+    other.loadPortfolio('test')
+    return other
+
+def test_trades_survive_without_save(journaled_manager):
+    journaled_manager.buyStock('msft', 3)
+    journaled_manager.sellStock('appl', 100)
+    journaled_manager.changePercentage('zag.to', 0.5)
+
+    other = reload(journaled_manager)
+    assert other.getStock('msft').units == 13
+    assert other.getStock('appl').units == 0
+    assert other.getStock('zag.to').percent == 0.5
+
+def test_save_compacts_journal(journaled_manager):
+    journaled_manager.buyStock('msft', 3)
+    journaled_manager.savePortfolio(overwrite=True)
+    assert journaled_manager.journal.pending == 0
+    assert journaled_manager.store.getMetadata('test', 'journalSeq') == '1'
+    # nothing is replayed twice
+    assert reload(journaled_manager).getStock('msft').units == 13
+
+def test_journal_compacts_itself(journaled_manager, monkeypatch):
+    monkeypatch.setattr(manager.journal, 'COMPACT_EVERY', 3)
+    for _ in range(3):
+        journaled_manager.buyStock('msft', 1)
+    assert journaled_manager.journal.pending == 0
+    assert journaled_manager.store.load('test').getStock('msft').units == 13
+
+def test_new_portfolio_gets_own_journal(journaled_manager):
+    journaled_manager.currentPortfolio = Portfolio('other', [Stock('bbb', 1.0, 'CAD', 1, 1.0, 0)], 0.0, 'CAD')
+    assert journaled_manager.journal == None
+    journaled_manager.buyStock('bbb', 3)
+    journaled_manager.savePortfolio()
+
+    # nothing was written to the journal of the portfolio loaded before
+    assert list(TradeJournal(journaled_manager.DEFAULT_PATH / ".journal" / "test.log").entries()) == []
+    assert reload(journaled_manager).getStock('msft').units == 10
+    journaled_manager.buyStock('bbb', 1)
+    assert [e['ticker'] for e in journaled_manager.journal.entries()] == ['bbb']
+
+def test_bad_entry_is_quarantined(journaled_manager):
+    journaled_manager.buyStock('msft', 3)
+    journaled_manager.journal.append('trade', 'gone', units=1)
+    journaled_manager.buyStock('msft', 1)
+
+    for _ in range(2):
+        other = reload(journaled_manager)
+        assert other.getStock('msft').units == 14
+    rejected = other.journal.rejectedPath.read_text().splitlines()
+    assert len(rejected) == 1 and '"gone"' in rejected[0]
+
+def test_add_records_stock_currency(journaled_manager, mocker):
+    # the manager creates stocks from the flat stock module
+    mocker.patch.object(manager.Stock, 'fetchQuote', autospec=True, return_value=(5.0, 'USD'))
+    mocker.patch.object(type(journaled_manager.currentPortfolio), 'updatePortfolio')
+    journaled_manager.addStockToPortfolio('goog', 2, 0.1)
+
+    assert reload(journaled_manager).getStock('goog').currency == 'USD'
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+from investool.lazyimport import lazyImport
+
+INVESTOOL_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "investool")
+# modules that must not be imported before a quote is fetched
+HEAVY_MODULES = ('yfinance', 'pandas', 'lxml', 'requests')
+# cumulative -X importtime of the CLI entry point, in microseconds
+STARTUP_BUDGET_US = 400_000
+
+def importTimes(module: str) -> dict[str, int]:
+    # module -> cumulative import time in microseconds, from -X importtime
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=INVESTOOL_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+def test_startup_budget():
+    times = importTimes("investool")
+    heavy = [name for name in times if name.split('.')[0] in HEAVY_MODULES]
+    assert heavy == []
+    assert times["investool"] < STARTUP_BUDGET_US
+
+def test_lazy_module_loads_on_use():
+    json = lazyImport("json")
+    assert "not loaded" in repr(json)
+    assert json.loads("[1]") == [1]
+    assert "(loaded)" in repr(json)
+
+def test_lazy_module_can_be_patched(mocker):
+    json = lazyImport("json")
+    mocker.patch.object(json, "loads", return_value=42)
+    assert json.loads("[1]") == 42
+    mocker.stopall()
+    assert json.loads("[1]") == [1]
@@ -1,5 +1,9 @@
 import pytest
+from investool import portfolio
+from investool.fxstore import FxStore
 from investool.manager import PortfolioManager, Portfolio, Stock
+from investool.quotes import Quote
+from investool.replay import Recording, ReplayQuoteProvider
 from tests.test_portfolio import standard_portfolio
 
 @pytest.fixture
@@ -16,14 +20,23 @@ def standard_manager_path(tmp_path, standard_manager):
     standard_manager.DEFAULT_PATH = d
     return standard_manager
 
-@pytest.fixture
-def standard_manager_fixed_prices(standard_manager, mocker):
-    stockPrices = [10, 20, 30]
+PRICES = {'msft': 10, 'appl': 20, 'zag.to': 30, 'aapl': 20, 'amzn': 30, 'nvda': 40}
 
-    for i in range(len(standard_manager.currentPortfolio.stocks)):
-        stock = standard_manager.currentPortfolio.stocks[i]
-        stock.getCurrentPrice = mocker.MagicMock(return_value=stockPrices[i])
+@pytest.fixture
+def fixed_prices(monkeypatch):
+    # a frozen recording prices every ticker and values USD at par with CAD,
+    # nothing is downloaded. The manager refreshes through the flat quotes
+    # module, not investool.quotes.
+    recording = Recording(0.0)
+    recording.addQuotes(0.0, {ticker: Quote(price) for ticker, price in PRICES.items()})
+    recording.addRates(0.0, 'usd', '2024-03-01', {'cad': 1.0, 'usd': 1.0})
+    provider = ReplayQuoteProvider(recording, speed=0)
+    monkeypatch.setattr('quotes._defaultProvider', provider)
+    monkeypatch.setattr(portfolio.fxstore, '_defaultStore', FxStore(fetcher=provider.fetchRates))
+    return provider
 
+@pytest.fixture
+def standard_manager_fixed_prices(standard_manager, fixed_prices):
     return standard_manager
 
 @pytest.fixture
@@ -40,13 +53,7 @@ def real_stock_manager(real_stock_portfolio):
     return PortfolioManager(real_stock_portfolio)
 
 @pytest.fixture
-def real_stock_manager_fixed(real_stock_manager, mocker):
-    stockPrices = [10, 20, 30, 40]
-
-    for i in range(len(real_stock_manager.currentPortfolio.stocks)):
-        stock = real_stock_manager.currentPortfolio.stocks[i]
-        stock.getCurrentPrice = mocker.MagicMock(return_value=stockPrices[i])
-
+def real_stock_manager_fixed(real_stock_manager, fixed_prices):
     return real_stock_manager
 
 def test_manager_creation(standard_manager, standard_portfolio):
@@ -158,3 +165,73 @@ def test_loadPortfolio(standard_manager_path):
     new_manager.loadPortfolio(test_file)
 
     assert new_manager.currentPortfolio == standard_manager_path.currentPortfolio
+
+def test_plan_uses_single_snapshot(standard_manager_fixed_prices, fixed_prices):
+    snapshot = standard_manager_fixed_prices.takeSnapshot()
+    calls = fixed_prices.calls
+
+    plan = standard_manager_fixed_prices.calculateRebalanceSellBuy(100, snapshot)
+    remaining = standard_manager_fixed_prices.cashRemaining(plan, 100)
+
+    assert plan.snapshot is snapshot
+    assert remaining == 0
+    assert fixed_prices.calls == calls
+
+def test_rebalanceSellBuy_applies_previewed_plan(standard_manager_fixed_prices, fixed_prices):
+    plan = standard_manager_fixed_prices.calculateRebalanceSellBuy(100)
+    expected = {stock.ticker: stock.units + units for stock, units in plan.items()}
+    calls = fixed_prices.calls
+
+    standard_manager_fixed_prices.rebalanceSellBuy(100, plan=plan)
+
+    for stock in standard_manager_fixed_prices.currentPortfolio.stocks:
+        assert stock.units == expected[stock.ticker]
+    assert fixed_prices.calls == calls
+
+def test_rebalanceOnlyBuy_skips_sells(real_stock_manager_fixed):
+    plan = real_stock_manager_fixed.calculateRebalanceBuyOnly(200)
+    real_stock_manager_fixed.rebalanceOnlyBuy(200, plan=plan)
+
+    units = [s.units for s in real_stock_manager_fixed.currentPortfolio.stocks]
+    assert units == [18, 8, 5, 5]
+
+def test_calculateRebalanceBuyOnly_optimal(real_stock_manager_fixed):
+    liquidCash = 200
+    res = real_stock_manager_fixed.calculateRebalanceBuyOnly(liquidCash, mode='optimal')
+
+    assert real_stock_manager_fixed.cashRemaining(res, liquidCash) >= 0
+    assert all(units >= 0 for units in res.values())
+
+def test_addStockToPortfolio_uses_provider(standard_manager_fixed_prices):
+    result = standard_manager_fixed_prices.addStockToPortfolio('nvda', 2, 0.1, 'USD')
+
+    assert result.ok
+    assert standard_manager_fixed_prices.getStock('nvda').price == 40
+    # a ticker the provider can't price is reported, not raised
+    result = standard_manager_fixed_prices.addStockToPortfolio('nope', 1, 0.1, 'USD')
+    assert list(result.errors) == ['nope']
+
+def test_getCatalog_pickles(standard_manager_path):
+    standard_manager_path.savePortfolio("beta")
+    standard_manager_path.savePortfolio("alpha")
+
+    assert [e.name for e in standard_manager_path.getCatalog()] == ['alpha', 'beta']
+    assert [e.name for e in standard_manager_path.getCatalog(search='ET')] == ['beta']
+    assert len(standard_manager_path.getCatalog(sortBy='modifiedAt', descending=True, limit=1)) == 1
+    with pytest.raises(ValueError):
+        standard_manager_path.getCatalog(currency='cad')
+    with pytest.raises(ValueError):
+        standard_manager_path.getCatalog(sortBy='totalValue')
+
+def test_addStockToPortfolio_maxAge(standard_manager_fixed_prices, fixed_prices):
+    manager = standard_manager_fixed_prices
+    manager.addStockToPortfolio('nvda', 2, 0.1, 'USD', maxAge=3600)
+    assert manager.currentPortfolio.staleStocks(3600) == []
+
+    # every price is younger than maxAge, only the new stock is fetched
+    calls = fixed_prices.calls
+    manager.addStockToPortfolio('amzn', 1, 0.1, 'USD', maxAge=3600)
+    assert fixed_prices.calls == calls + 1
+    # with no maxAge every price is fetched again
+    manager.addStockToPortfolio('aapl', 1, 0.1, 'USD', maxAge=None)
+    assert fixed_prices.calls == calls + 3
@@ -0,0 +1,88 @@
+import json
+import pytest
+from investool.metrics import Counter, Histogram, Registry
+from investool import quotes
+from investool.quotecache import QuoteCache
+from investool.fxstore import FxStore
+
+def test_counter_labels():
+    requests = Counter("requests_total", "Requests.")
+    requests.inc(kind="quote")
+    requests.inc(2, kind="quote")
+    requests.inc(kind="fx")
+
+    assert requests.value(kind="quote") == 3
+    assert requests.value(kind="fx") == 1
+    assert requests.value(kind="other") == 0
+    assert requests.total() == 4
+
+def test_histogram_buckets():
+    latency = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value, site="a")
+
+    assert latency.count(site="a") == 4
+    assert latency.sum(site="a") == pytest.approx(2.65)
+    assert latency.toJson()[0]['buckets'] == {'0.1': 2, '1': 3, '+Inf': 4}
+
+def test_histogram_time():
+    latency = Histogram("latency_seconds")
+    with latency.time():
+        pass
+    with pytest.raises(KeyError):
+        with latency.time():
+            raise KeyError
+
+    # failed calls are timed too
+    assert latency.count() == 2
+
+def test_registry_prometheus():
+    registry = Registry()
+    registry.counter("errors_total", "Errors.").inc(site='say "hi"')
+    registry.histogram("plan_seconds", "Plans.", buckets=(1.0,)).observe(0.5, planner="buyonly")
+
+    text = registry.toPrometheus()
+    assert "# TYPE errors_total counter" in text
+    assert 'errors_total{site="say \\"hi\\""} 1' in text
+    assert 'plan_seconds_bucket{planner="buyonly",le="1"} 1' in text
+    assert 'plan_seconds_bucket{planner="buyonly",le="+Inf"} 1' in text
+    assert 'plan_seconds_count{planner="buyonly"} 1' in text
+
+def test_registry_returns_existing_metric():
+    registry = Registry()
+    assert registry.counter("a") is registry.counter("a")
+    with pytest.raises(ValueError):
+        registry.histogram("a")
+
+def test_registry_dump(tmp_path):
+    registry = Registry()
+    registry.counter("a", "A.").inc(3)
+    registry.dump(tmp_path / "metrics.json")
+    registry.dump(tmp_path / "metrics.prom")
+
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data['a'] == {'type': 'counter', 'help': 'A.', 'values': [{'labels': {}, 'value': 3}]}
+    assert "a 3" in (tmp_path / "metrics.prom").read_text()
+
+def test_cached_provider_hit_rate(tmp_path):
+    requests = quotes.metrics.CACHE_REQUESTS
+    hits = requests.value(cache="quote", result="hit")
+    misses = requests.value(cache="quote", result="miss")
+    provider = quotes.CachedQuoteProvider(quotes.FakeQuoteProvider({'msft': quotes.Quote(1, 'USD')}),
+                                          QuoteCache(tmp_path / "quotes.sqlite"))
+    provider.getQuotes(['msft', 'appl'])
+    provider.getQuotes(['msft'])
+
+    assert requests.value(cache="quote", result="hit") - hits == 1
+    assert requests.value(cache="quote", result="miss") - misses == 2
+
+def test_fxstore_fetches_counted():
+    store = FxStore(fetcher=lambda base, day: {'cad': 1.3})
+    requests = quotes.metrics.CACHE_REQUESTS
+    misses = requests.value(cache="fx", result="miss")
+    hits = requests.value(cache="fx", result="hit")
+    store.getRate('usd', 'cad')
+    store.getRate('cad', 'usd')
+
+    assert requests.value(cache="fx", result="miss") - misses == 1
+    assert requests.value(cache="fx", result="hit") - hits == 1
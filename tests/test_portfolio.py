@@ -1,6 +1,8 @@
 import pytest
+import time
 from investool.stock import Stock
 from investool.portfolio import Portfolio
+from investool.quotes import FakeQuoteProvider, Quote
 
 @pytest.fixture(scope="function")
 def standard_portfolio():
@@ -70,3 +72,102 @@ def test_stocks_setter(empty_portfolio):
     new_stocks = [Stock('not_stock', 1, 2, 3, 4)]
     empty_portfolio.stocks = new_stocks
     assert empty_portfolio.stocks == [Stock('not_stock', 1, 2, 3, 4)]
+
+def test_ticker_index(standard_portfolio):
+    assert standard_portfolio.hasStock('appl')
+    assert not standard_portfolio.hasStock('goog')
+    assert standard_portfolio.getStock('zag.to') is standard_portfolio.stocks[2]
+    with pytest.raises(ValueError):
+        standard_portfolio.getStock('goog')
+
+def test_add_remove_keeps_index(standard_portfolio):
+    standard_portfolio.removeStock('appl')
+    assert not standard_portfolio.hasStock('appl')
+    assert standard_portfolio.getStockTickers() == ['msft', 'zag.to']
+    with pytest.raises(ValueError):
+        standard_portfolio.removeStock('appl')
+
+    standard_portfolio.addStock(Stock('goog', 5, 'USD', 2, 0.1, 0), updatePrice=False)
+    assert standard_portfolio.getStock('goog').stockValue == 10
+    assert [s.ticker for s in standard_portfolio.stocks] == ['msft', 'zag.to', 'goog']
+
+def test_index_survives_pickle(standard_portfolio):
+    import pickle
+    loaded = pickle.loads(pickle.dumps(standard_portfolio))
+    assert loaded == standard_portfolio
+    assert loaded.getStock('msft') is loaded.stocks[0]
+
+def test_old_pickle_stock_list(standard_portfolio):
+    # portfolios pickled before the index kept a plain `_stocks` list
+    old = Portfolio.__new__(Portfolio)
+    old.__setstate__({'_portfolioName': 'test', '_stocks': list(standard_portfolio.stocks),
+                      '_totalValue': 100.0, '_portfolioCurrency': 'CAD',
+                      '_currencyExchangeCache': {}})
+    assert old == standard_portfolio
+    assert old.hasStock('zag.to')
+
+def test_stale_refresh(standard_portfolio):
+    provider = FakeQuoteProvider({'msft': Quote(11, 'USD'), 'appl': Quote(21, 'USD'),
+                                  'zag.to': Quote(31, 'CAD')})
+    # nothing was fetched yet, everything is stale
+    assert standard_portfolio.pricesFetchedAt() == None
+    standard_portfolio.updateAllStockPrices(provider, maxAge=60)
+    assert provider.calls == 1
+    assert standard_portfolio.pricesFetchedAt() != None
+
+    # fresh prices are not fetched again
+    result = standard_portfolio.updateAllStockPrices(provider, maxAge=60)
+    assert result.ok
+    assert provider.calls == 1
+
+def test_stale_stocks(standard_portfolio):
+    provider = FakeQuoteProvider({'msft': Quote(11, 'USD'), 'appl': Quote(21, 'USD', time.time() - 120)})
+    standard_portfolio.updateAllStockPrices(provider, maxAge=60)
+
+    # appl was served from a quote two minutes old, zag.to failed
+    assert [s.ticker for s in standard_portfolio.staleStocks(60)] == ['appl', 'zag.to']
+    assert standard_portfolio.staleStocks(60, now=time.time() + 3600) == standard_portfolio.stocks
+
+def test_stock_shared_between_portfolios():
+    a = Stock('aaa', 10.0, 'CAD', 5, 0.5, 0)
+    b = Stock('bbb', 10.0, 'CAD', 5, 0.5, 0)
+    p1 = Portfolio('p1', [a, b], 0.0, 'CAD')
+    p2 = Portfolio('p2', [a], 0.0, 'CAD')
+    p2.addStock(b, updatePrice=False)
+
+    # the second portfolio holds copies, the first one is left intact
+    assert p2.getStock('aaa') is not a
+    a.units = 7
+    p1.updateTotalPortfolioValue(updatePrices=False)
+    assert p1.holdings.units.tolist() == [7, 5]
+    assert p1.totalValue == 120.0
+    assert p2.getStock('aaa').units == 5
+
+    p1.removeStock('aaa')
+    assert p1.getStockTickers() == ['bbb']
+
+def test_removeStock_failure_keeps_holdings(standard_portfolio):
+    stock = standard_portfolio.getStock('msft')
+    standard_portfolio.holdings.remove(stock)
+    with pytest.raises(ValueError):
+        standard_portfolio.removeStock('msft')
+    assert standard_portfolio.hasStock('msft')
+
+def test_stocks_read_only(standard_portfolio):
+    with pytest.raises(TypeError):
+        standard_portfolio.stocks.append(Stock('goog', 5, 'USD', 2, 0.1, 0))
+    with pytest.raises(TypeError):
+        standard_portfolio.stocks.remove(standard_portfolio.getStock('msft'))
+    with pytest.raises(TypeError):
+        standard_portfolio.stocks[0] = Stock('goog', 5, 'USD', 2, 0.1, 0)
+    assert standard_portfolio.getStockTickers() == ['msft', 'appl', 'zag.to']
+
+def test_held_stock_cannot_be_renamed(standard_portfolio):
+    stock = standard_portfolio.getStock('msft')
+    with pytest.raises(ValueError):
+        stock.ticker = 'goog'
+    assert standard_portfolio.getStock('msft') is stock
+    # once removed it is a plain stock again
+    standard_portfolio.removeStock('msft')
+    stock.ticker = 'goog'
+    assert stock.ticker == 'goog'
@@ -0,0 +1,138 @@
+import os
+import pickle
+import pytest
+from investool.portfoliostore import PortfolioStore, loadPickle
+from investool.manager import PortfolioManager
+from tests.test_portfolio import standard_portfolio
+
+@pytest.fixture
+def store(tmp_path):
+    return PortfolioStore(tmp_path / "portfolios.sqlite")
+
+def test_save_load_roundtrip(store, standard_portfolio):
+    assert store.save(standard_portfolio) == 3
+    loaded = store.load('test')
+    assert repr(loaded) == repr(standard_portfolio)
+    assert loaded.getStockTickers() == ['msft', 'appl', 'zag.to']
+    assert store.listNames() == ['test']
+
+def test_load_missing(store):
+    with pytest.raises(FileNotFoundError):
+        store.load('nope')
+
+def test_save_writes_only_changed_rows(store, standard_portfolio):
+    store.save(standard_portfolio)
+    assert store.save(standard_portfolio) == 0
+
+    standard_portfolio.getStock('appl').units = 12
+    assert store.save(standard_portfolio) == 1
+
+    standard_portfolio.removeStock('msft')
+    assert store.save(standard_portfolio) == 1
+    assert store.load('test').getStockTickers() == ['appl', 'zag.to']
+    assert store.load('test').getStock('appl').units == 12
+
+def test_save_after_other_writer(tmp_path, standard_portfolio):
+    path = tmp_path / "portfolios.sqlite"
+    first = PortfolioStore(path)
+    first.save(standard_portfolio)
+
+    other = PortfolioStore(path)
+    changed = other.load('test')
+    changed.getStock('msft').units = 1
+    other.save(changed)
+
+    # the first store notices its view of the rows is stale
+    assert first.save(standard_portfolio) == 1
+    assert first.load('test').getStock('msft').units == 10
+
+def test_lazy_load(store, standard_portfolio):
+    store.save(standard_portfolio)
+    loaded = store.load('test', lazy=True)
+    assert not loaded.stocksLoaded
+    assert loaded.portfolioName == 'test'
+    assert loaded.totalValue == 100.0
+
+    assert loaded.hasStock('zag.to')
+    assert loaded.stocksLoaded
+    assert repr(loaded) == repr(standard_portfolio)
+
+def test_import_pickle(tmp_path, store, standard_portfolio):
+    path = tmp_path / "old.pickle"
+    with open(path, 'wb') as f:
+        pickle.dump(standard_portfolio, f, pickle.HIGHEST_PROTOCOL)
+
+    assert store.importDirectory(tmp_path) == ['old']
+    assert store.importDirectory(tmp_path) == []
+    assert repr(store.load('old')) == repr(standard_portfolio)
+    assert store.getMetadata('old', 'importedFrom') == str(path)
+
+class Exploit:
+    def __reduce__(self):
+        return (os.system, ("echo pwned",))
+
+def test_timestamped_copies_become_versions(tmp_path, store, standard_portfolio):
+    with open(tmp_path / "test.pickle", 'wb') as f:
+        pickle.dump(standard_portfolio, f, pickle.HIGHEST_PROTOCOL)
+    standard_portfolio.getStock('msft').units = 1
+    with open(tmp_path / "test_2024-01-02-10:00:00.pickle", 'wb') as f:
+        pickle.dump(standard_portfolio, f, pickle.HIGHEST_PROTOCOL)
+
+    store.importDirectory(tmp_path)
+    assert store.listNames() == ['test']
+    version, = store.versions.listVersions('test')
+    assert store.versions.restore(version.id, 'test').getStock('msft').units == 1
+    assert store.importDirectory(tmp_path) == []
+
+def test_pickle_cannot_run_code(tmp_path, store):
+    path = tmp_path / "evil.pickle"
+    with open(path, 'wb') as f:
+        pickle.dump(Exploit(), f)
+
+    with pytest.raises(pickle.UnpicklingError):
+        loadPickle(path)
+    assert store.importDirectory(tmp_path) == []
+
+def test_manager_uses_store(tmp_path, store, standard_portfolio):
+    manager = PortfolioManager(standard_portfolio, store)
+    manager.DEFAULT_PATH = tmp_path
+    assert manager.savePortfolio()
+    assert manager.checkFileExists('test')
+    assert not (tmp_path / 'test.pickle').exists()
+
+    # saving again without overwrite keeps the first copy as a version
+    assert manager.savePortfolio()
+    assert manager.listPortfolios() == ['test']
+    assert len(manager.listVersions()) == 1
+
+    other = PortfolioManager(store=store)
+    other.loadPortfolio('test')
+    assert repr(other.currentPortfolio) == repr(standard_portfolio)
+
+def test_catalog(store):
+    from investool.portfolio import Portfolio
+    from investool.stock import Stock
+    for name, value, currency, count in [('alpha', 500.0, 'CAD', 1), ('beta', 1500.0, 'usd', 2), ('gamma', 50.0, 'CAD', 3)]:
+        stocks = [Stock(f"s{i}", 1.0, 'CAD', 1, 0.1, 1.0) for i in range(count)]
+        store.save(Portfolio(name, stocks, value, currency))
+
+    catalog = store.catalog()
+    assert [e.name for e in catalog] == ['alpha', 'beta', 'gamma']
+    assert catalog[1].totalValue == 1500.0
+    assert catalog[1].holdingCount == 2
+
+    assert [e.name for e in store.catalog(sortBy='totalValue', descending=True)] == ['beta', 'alpha', 'gamma']
+    assert [e.name for e in store.catalog(currency='cad')] == ['alpha', 'gamma']
+    assert [e.name for e in store.catalog(minValue=100, maxValue=1000)] == ['alpha']
+    assert [e.name for e in store.catalog(search='MM')] == ['gamma']
+    assert len(store.catalog(sortBy='modifiedAt', limit=2)) == 2
+    with pytest.raises(ValueError):
+        store.catalog(sortBy='name; DROP TABLE portfolios')
+
+def test_catalog_follows_saves(store, standard_portfolio):
+    store.save(standard_portfolio)
+    standard_portfolio.removeStock('msft')
+    standard_portfolio.totalValue = 60.0
+    store.save(standard_portfolio)
+    entry, = store.catalog()
+    assert (entry.holdingCount, entry.totalValue) == (2, 60.0)
@@ -0,0 +1,69 @@
+import asyncio
+import pstats
+import pytest
+from investool.profiling import Profiler, publicMethods
+from investool.manager import PortfolioManager
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = Profiler(tmp_path / "profile")
+    yield profiler
+    profiler.close()
+
+def test_action_report(profiler):
+    with profiler.action("buildList"):
+        data = [str(i) for i in range(10000)]
+
+    assert len(profiler.reports) == 1
+    report = profiler.reports[0]
+    assert report.name == "0001-buildList.txt"
+    text = report.read_text()
+    assert "action: buildList" in text
+    assert "wall time:" in text
+    assert "peak memory:" in text
+    # the .prof file next to it loads with pstats
+    pstats.Stats(str(report.with_suffix(".prof")))
+
+def test_nested_actions(profiler):
+    with profiler.action("outer"):
+        for _ in range(3):
+            with profiler.action("inner"):
+                pass
+
+    assert len(profiler.reports) == 1
+    assert "inner" in profiler.reports[0].read_text()
+
+def test_failed_action_is_reported(profiler):
+    with pytest.raises(KeyError):
+        with profiler.action("fails"):
+            raise KeyError("missing")
+
+    assert "raised: KeyError" in profiler.reports[0].read_text()
+
+def test_wrap_manager(profiler):
+    manager = PortfolioManager()
+    profiler.wrap(manager, ['addStockToPortfolio', 'getStock'])
+    manager.addStockToPortfolio('msft', 1, 0.5)
+    manager.getStock('msft')
+
+    assert [r.name for r in profiler.reports] == ["0001-PortfolioManager.addStockToPortfolio.txt",
+                                                  "0002-PortfolioManager.getStock.txt"]
+
+def test_publicMethods():
+    names = publicMethods(PortfolioManager())
+    assert 'loadPortfolio' in names
+    assert '_planInputs' not in names
+
+def test_wrap_coroutine(profiler):
+    class Slow:
+        async def wait(self):
+            await asyncio.sleep(0.05)
+            return 1
+
+    slow = Slow()
+    profiler.wrap(slow, ['wait'])
+    assert asyncio.run(slow.wait()) == 1
+
+    text = profiler.reports[0].read_text()
+    assert "action: Slow.wait" in text
+    assert float(text.split("wall time: ")[1].split()[0]) >= 40
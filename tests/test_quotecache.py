@@ -0,0 +1,69 @@
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from investool import stock
+from investool.quotecache import QuoteCache
+from investool.quotes import CachedQuoteProvider, FakeQuoteProvider, Quote
+
+@pytest.fixture
+def cache(tmp_path):
+    return QuoteCache(tmp_path / "quotes.sqlite", ttl=60, maxEntries=5)
+
+def test_put_get(cache):
+    cache.put('msft', 123.45, 'USD')
+    hit = cache.get('MSFT')
+    assert hit.price == 123.45
+    assert hit.currency == 'USD'
+    assert cache.get('aapl') == None
+
+def test_ttl(cache):
+    cache.put('msft', 1.0, 'USD', fetchedAt=time.time() - 120)
+    assert cache.get('msft') == None
+    assert cache.get('msft', maxAge=300).price == 1.0
+    assert cache.purgeExpired() == 1
+    assert len(cache) == 0
+
+def test_eviction(cache):
+    now = time.time()
+    for i in range(8):
+        cache.put(f"t{i}", float(i), 'USD', fetchedAt=now - 8 + i)
+    assert len(cache) == 5
+    # oldest fetches are evicted first
+    assert cache.get('t0') == None
+    assert cache.get('t7').price == 7.0
+
+def test_shared_between_instances(cache, tmp_path):
+    other = QuoteCache(tmp_path / "quotes.sqlite")
+    cache.put('msft', 2.0, 'USD')
+    assert other.get('msft').price == 2.0
+
+def test_concurrent_writes(tmp_path):
+    cache = QuoteCache(tmp_path / "quotes.sqlite", maxEntries=1000)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: cache.put(f"t{i}", float(i), 'USD'), range(200)))
+    assert len(cache) == 200
+
+def test_cached_provider(cache):
+    fake = FakeQuoteProvider({'msft': Quote(10, 'USD'), 'appl': Quote(20, 'USD')})
+    provider = CachedQuoteProvider(fake, cache)
+
+    first = provider.getQuotes(['msft', 'appl'])
+    second = provider.getQuotes(['msft', 'appl', 'nope'])
+
+    assert first.quotes == second.quotes
+    assert fake.calls == 2
+    assert set(second.errors) == {'nope'}
+
+def test_getCurrentPrice_uses_cache(cache, mocker):
+    stock.quotecache.setDefaultCache(cache)
+    try:
+        mockTicker = mocker.patch("investool.stock.yf.Ticker")
+        mockTicker.return_value.fast_info = {"lastPrice": 50.0, "currency": "USD"}
+        s = stock.Stock('msft')
+        assert s.getCurrentPrice() == 50.0
+
+        mockTicker.return_value.fast_info = {"lastPrice": 99.0, "currency": "USD"}
+        assert stock.Stock('msft').getCurrentPrice() == 50.0
+        assert mockTicker.call_count == 1
+    finally:
+        stock.quotecache.setDefaultCache(None)
@@ -0,0 +1,55 @@
+import pytest
+from investool.stock import Stock
+from investool.quotes import FakeQuoteProvider, Quote, fetchQuotes, refreshStocks
+
+@pytest.fixture
+def stocks():
+    return [Stock('msft', 10, 'USD', 10, 0.5, 0),
+            Stock('appl', 20, 'USD', 10, 0.25, 0),
+            Stock('zag.to', 30, 'CAD', 10, 0.25, 0)]
+
+def test_refreshStocks_provider(stocks):
+    provider = FakeQuoteProvider({'msft': Quote(11, 'USD'),
+                                  'appl': Quote(21, 'USD'),
+                                  'zag.to': Quote(31, 'CAD')})
+    res = refreshStocks(stocks, provider)
+
+    assert res.ok
+    assert provider.calls == 1
+    assert [s.price for s in stocks] == [11, 21, 31]
+
+def test_refreshStocks_partial_failure(stocks):
+    provider = FakeQuoteProvider({'msft': Quote(11, 'EUR')})
+    res = refreshStocks(stocks, provider)
+
+    assert set(res.errors) == {'appl', 'zag.to'}
+    assert stocks[0].price == 11
+    assert stocks[0].currency == 'EUR'
+    # failed tickers keep their previous price
+    assert stocks[1].price == 20
+    assert stocks[2].price == 30
+
+def test_refreshStocks_thread_pool_fallback(stocks, mocker):
+    def fetchQuote(stock):
+        if stock.ticker == 'zag.to':
+            raise ConnectionError
+        return {'msft': (42, 'EUR')}.get(stock.ticker, (None, ''))
+    mocker.patch.object(Stock, 'fetchQuote', autospec=True, side_effect=fetchQuote)
+
+    res = refreshStocks(stocks, maxWorkers=2)
+
+    assert stocks[0].price == 42
+    assert stocks[0].currency == 'EUR'
+    assert stocks[1].price == 20
+    assert stocks[2].price == 30
+    assert set(res.errors) == {'appl', 'zag.to'}
+    assert isinstance(res.errors['zag.to'], ConnectionError)
+
+def test_fallback_leaves_stocks_alone(stocks, mocker):
+    mocker.patch.object(Stock, 'fetchQuote', autospec=True, return_value=(42, 'EUR'))
+
+    res = fetchQuotes(stocks[:1], maxWorkers=1)
+
+    assert res.quotes['msft'] == Quote(42, 'EUR')
+    # nothing is written back until the quotes are applied
+    assert stocks[0].currency == 'USD'
@@ -0,0 +1,167 @@
+import numpy as np
+import pytest
+from investool import rebalance
+
+def referenceSellBuy(prices, units, targets, totalValue, liquidCash):
+    # the original per-stock planner from PortfolioManager
+    diff = {i: round((targets[i] * totalValue) / prices[i]) - units[i] for i in range(len(prices))}
+    sellList = sorted([x for x in diff.items() if x[1] < 0], key=lambda x: x[1])
+    buyList = sorted([x for x in diff.items() if x[1] >= 0], key=lambda x: x[1], reverse=True)
+    totalCash = liquidCash
+    for i, u in sellList:
+        totalCash += (-1 * u) * prices[i]
+    finalBuyList = []
+    for i, u in buyList:
+        if u * prices[i] > totalCash:
+            u = int(totalCash / prices[i])
+        totalCash -= u * prices[i]
+        finalBuyList.append((i, u))
+    return sellList + finalBuyList
+
+def referenceBuyOnly(prices, units, targets, totalValue, liquidCash):
+    diff = {i: round((targets[i] * totalValue) / prices[i]) - units[i] for i in range(len(prices))}
+    buyList = sorted([x for x in diff.items() if x[1] >= 0], key=lambda x: x[1], reverse=True)
+    res = []
+    for i, u in buyList:
+        if u * prices[i] > liquidCash:
+            u = int(liquidCash / prices[i])
+        liquidCash -= u * prices[i]
+        res.append((i, u))
+    return res
+
+def randomPortfolio(n, seed):
+    rng = np.random.default_rng(seed)
+    prices = rng.uniform(1, 500, n).round(2)
+    units = rng.integers(0, 200, n)
+    targets = rng.dirichlet(np.ones(n))
+    return prices, units, targets
+
+@pytest.mark.parametrize("n,seed", [(1, 0), (5, 1), (50, 2), (3000, 3)])
+@pytest.mark.parametrize("cash", [0.0, 1000.0, 250000.0])
+def test_matches_reference_planners(n, seed, cash):
+    prices, units, targets = randomPortfolio(n, seed)
+    totalValue = float(sum(prices.tolist()[i] * units.tolist()[i] for i in range(n))) + cash
+    args = (prices.tolist(), units.tolist(), targets.tolist(), totalValue, cash)
+
+    order, deltas = rebalance.planSellBuy(prices, units, targets, totalValue, cash)
+    assert list(zip(order.tolist(), deltas.tolist())) == referenceSellBuy(*args)
+
+    order, deltas = rebalance.planBuyOnly(prices, units, targets, totalValue, cash)
+    assert list(zip(order.tolist(), deltas.tolist())) == referenceBuyOnly(*args)
+
+def test_fx_applied():
+    diff = rebalance.allocationDifference([10, 10], [0, 0], [0.5, 0.5], 100.0, fx=[1.0, 2.0])
+    assert diff.tolist() == [5, 2]
+
+def test_greedyFill_partial():
+    bought, cash = rebalance.greedyFill([10.0, 30.0, 5.0], [3, 2, 4], 75.0)
+    assert bought.tolist() == [3, 1, 3]
+    assert cash == 0.0
+
+def test_small_fill_blocks(monkeypatch):
+    monkeypatch.setattr(rebalance, "FILL_BLOCK_SIZE", 7)
+    prices, units, targets = randomPortfolio(500, 4)
+    totalValue = float(np.dot(prices, units)) + 5000.0
+    args = (prices.tolist(), units.tolist(), targets.tolist(), totalValue, 5000.0)
+
+    order, deltas = rebalance.planSellBuy(prices, units, targets, totalValue, 5000.0)
+    assert list(zip(order.tolist(), deltas.tolist())) == referenceSellBuy(*args)
+
+def drift(prices, deviations, bought, weights=1.0):
+    return float(np.sum(weights * (np.asarray(deviations) + bought * np.asarray(prices)) ** 2))
+
+def bruteForce(prices, deviations, cash, weights=1.0):
+    import itertools
+    best = None
+    for x in itertools.product(*[range(int(cash // p) + 1) for p in prices]):
+        x = np.array(x)
+        if x @ prices <= cash:
+            value = drift(prices, deviations, x, weights)
+            if best == None or value < best:
+                best = value
+    return best
+
+def test_optimal_spends_cash_greedy_leaves():
+    # greedy fills the cheap holding first and can then no longer afford a
+    # single unit of the expensive one, leaving most of the cash unspent
+    prices = np.array([95.0, 10.0])
+    units = np.array([0, 0])
+    targets = np.array([0.5, 0.5])
+    cash = 190.0
+    order, greedy = rebalance.planBuyOnly(prices, units, targets, cash, cash)
+    _, optimal = rebalance.planBuyOnly(prices, units, targets, cash, cash, mode='optimal')
+
+    deviations = -targets[order] * cash
+    assert greedy.tolist() == [10, 0]
+    assert optimal.tolist() == [9, 1]
+    assert drift(prices[order], deviations, optimal) < drift(prices[order], deviations, greedy)
+
+@pytest.mark.parametrize("seed", range(20))
+def test_exact_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 4))
+    prices = rng.uniform(5, 100, n).round(2)
+    deviations = -rng.uniform(0, 200, n)
+    cash = float(rng.uniform(0, 250))
+
+    bought, left = rebalance.exactFill(prices, deviations, cash)
+    assert drift(prices, deviations, bought) == pytest.approx(bruteForce(prices, deviations, cash))
+    assert left >= 0
+
+    optimal, left = rebalance.optimalFill(prices, deviations, cash)
+    assert left >= 0
+    assert drift(prices, deviations, optimal) >= drift(prices, deviations, bought) - 1e-6
+
+@pytest.mark.parametrize("seed", range(10))
+def test_weighted_exact_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 4))
+    prices = rng.uniform(5, 100, n).round(2)
+    deviations = -rng.uniform(0, 200, n)
+    weights = rng.uniform(0.2, 5, n)
+    cash = float(rng.uniform(0, 250))
+
+    bought, left = rebalance.exactFill(prices, deviations, cash, weights)
+    assert drift(prices, deviations, bought, weights) == pytest.approx(bruteForce(prices, deviations, cash, weights))
+    assert left >= 0
+
+    optimal, left = rebalance.optimalFill(prices, deviations, cash, weights)
+    assert left >= 0
+    assert drift(prices, deviations, optimal, weights) >= drift(prices, deviations, bought, weights) - 1e-6
+
+def test_weights_shift_the_fill():
+    # the same shortfall on both holdings, cash for only one unit
+    prices = np.array([10.0, 10.0])
+    deviations = np.array([-10.0, -10.0])
+    bought, _ = rebalance.optimalFill(prices, deviations, 10.0, np.array([1.0, 3.0]))
+    assert bought.tolist() == [0, 1]
+    bought, _ = rebalance.exactFill(prices, deviations, 10.0, np.array([3.0, 1.0]))
+    assert bought.tolist() == [1, 0]
+
+def test_exact_large_cash():
+    # a million dollars is hundreds of thousands of unit counts per holding,
+    # only the few next to the relaxed optimum are searched
+    rng = np.random.default_rng(0)
+    prices = rng.uniform(5, 100, 6).round(2)
+    deviations = -rng.uniform(0, 4e5, 6)
+
+    bought, left = rebalance.exactFill(prices, deviations, 1e6)
+    optimal, _ = rebalance.optimalFill(prices, deviations, 1e6)
+    assert left >= 0
+    assert drift(prices, deviations, bought) <= drift(prices, deviations, optimal) + 1e-6
+
+def test_exact_too_many_holdings():
+    n = rebalance.EXACT_MAX_HOLDINGS + 1
+    with pytest.raises(ValueError):
+        rebalance.exactFill(np.ones(n), -np.full(n, 10.0), 100.0)
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        rebalance.planBuyOnly([10.0], [0], [1.0], 100.0, 100.0, mode='best')
+
+@pytest.mark.parametrize("planner", [rebalance.planSellBuy, rebalance.planBuyOnly])
+@pytest.mark.parametrize("price", [0.0, -1.0, np.nan])
+def test_missing_price_rejected(planner, price):
+    prices = np.array([10.0, price, 30.0])
+    with pytest.raises(ValueError):
+        planner(prices, np.array([1, 0, 1]), np.array([0.4, 0.2, 0.4]), 100.0, liquidCash=50.0)
@@ -0,0 +1,93 @@
+import threading
+import time
+import pytest
+from investool.refresher import BackgroundRefresher
+from investool.manager import PortfolioManager
+from investool.portfolio import Portfolio
+from investool.portfoliostore import PortfolioStore
+from investool.quotes import CachedQuoteProvider, FakeQuoteProvider, Quote
+from investool.quotecache import QuoteCache
+from investool.stock import Stock
+
+QUOTES = {'msft': Quote(100.0, 'USD'), 'aapl': Quote(50.0, 'USD'), 'vti': Quote(20.0, 'USD')}
+
+@pytest.fixture
+def manager():
+    stocks = [Stock('msft', 90.0, 'USD', 10, 0.6, 0.0),
+              Stock('aapl', 40.0, 'USD', 10, 0.4, 0.0)]
+    return PortfolioManager(Portfolio('test', stocks, 0.0, 'USD'))
+
+def test_refreshOnce(manager):
+    provider = FakeQuoteProvider(QUOTES)
+    refresher = BackgroundRefresher(manager, interval=60, provider=provider)
+    result = refresher.refreshOnce()
+
+    assert result.ok
+    portfolio = manager.currentPortfolio
+    assert [s.price for s in portfolio.stocks] == [100.0, 50.0]
+    assert portfolio.totalValue == 1500.0
+    assert portfolio.staleStocks(60) == []
+
+    # nothing is stale, so nothing is fetched
+    refresher.refreshOnce()
+    assert provider.calls == 1
+
+def test_replaced_portfolio_untouched(manager):
+    provider = FakeQuoteProvider(QUOTES)
+    refresher = BackgroundRefresher(manager, provider=provider)
+    portfolio = manager.currentPortfolio
+    original = provider.getQuotes
+
+    def swap(tickers):
+        manager.currentPortfolio = Portfolio('other', [], 0.0, 'USD')
+        return original(tickers)
+    provider.getQuotes = swap
+    refresher.refreshOnce()
+
+    assert [s.price for s in portfolio.stocks] == [90.0, 40.0]
+
+def test_watched_portfolios_warm_cache(manager, tmp_path):
+    store = PortfolioStore(tmp_path / "portfolios.sqlite")
+    store.save(Portfolio('watched', [Stock('vti', 0.0, 'USD', 1, 1.0, 0.0)], 0.0, 'USD'))
+    manager.store = store
+    cache = QuoteCache(tmp_path / "quotes.sqlite")
+    refresher = BackgroundRefresher(manager, watched=['watched', 'missing'],
+                                    provider=CachedQuoteProvider(FakeQuoteProvider(QUOTES), cache))
+    refresher.refreshOnce()
+
+    assert cache.get('vti').price == 20.0
+    assert not manager.currentPortfolio.hasStock('vti')
+
+def test_thread_start_stop(manager):
+    refresher = BackgroundRefresher(manager, interval=60, provider=FakeQuoteProvider(QUOTES))
+    refresher.start()
+    deadline = time.time() + 5
+    while refresher.lastRefreshAt == None and time.time() < deadline:
+        time.sleep(0.01)
+    refresher.stop(timeout=5)
+
+    assert refresher.lastRefreshAt != None
+    assert not refresher.running
+    assert manager.currentPortfolio.stocks[0].price == 100.0
+
+def test_snapshots_are_consistent(manager):
+    # prices flip between two quote sets while snapshots are taken, every
+    # snapshot must price all holdings from the same set
+    low = FakeQuoteProvider({'msft': Quote(1.0, 'USD'), 'aapl': Quote(1.0, 'USD')})
+    high = FakeQuoteProvider({'msft': Quote(2.0, 'USD'), 'aapl': Quote(2.0, 'USD')})
+    refreshers = [BackgroundRefresher(manager, interval=-1, provider=p) for p in (low, high)]
+    done = threading.Event()
+
+    def flip():
+        while not done.is_set():
+            for refresher in refreshers:
+                refresher.refreshOnce()
+    thread = threading.Thread(target=flip)
+    thread.start()
+    try:
+        for _ in range(200):
+            snapshot = manager.takeSnapshot(refresh=False)
+            assert snapshot.adjustedPrice('msft') == snapshot.adjustedPrice('aapl')
+    finally:
+        done.set()
+        thread.join()
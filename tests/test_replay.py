@@ -0,0 +1,92 @@
+import gzip
+import pytest
+from investool import portfolio
+from investool.fxstore import FxStore
+from investool.manager import PortfolioManager
+from investool.portfolio import Portfolio
+from investool.quotes import FakeQuoteProvider, Quote
+from investool.replay import Recording, RecordingQuoteProvider, ReplayQuoteProvider
+from investool.stock import Stock
+
+DAY = '2024-03-01'
+RATES = {'cad': 1.25, 'usd': 1.0}
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+@pytest.fixture
+def recording(tmp_path):
+    # two refreshes an hour apart, saved and loaded back
+    clock = FakeClock()
+    live = FakeQuoteProvider({'msft': Quote(100.0, 'USD'), 'ry': Quote(130.0, 'CAD')})
+    recorder = RecordingQuoteProvider(live, fxFetcher=lambda base, day: dict(RATES), clock=clock)
+    recorder.getQuotes(['msft', 'ry', 'missing'])
+    recorder.fetchRates('usd', DAY)
+    clock.now += 3600
+    live.quotes['msft'] = Quote(110.0, 'USD')
+    recorder.getQuotes(['msft'])
+
+    path = tmp_path / "day.jsonl.gz"
+    recorder.recording.save(path)
+    return Recording.load(path)
+
+def test_roundtrip(recording):
+    assert recording.startedAt == 1000.0
+    assert recording.tickers == ['msft', 'ry']
+    assert recording.duration == 3600
+    assert recording.quoteAt('msft', 0).price == 100.0
+    assert recording.quoteAt('msft', 3600).price == 110.0
+    assert recording.quoteAt('ry', 7200).currency == 'CAD'
+    assert recording.quoteAt('missing', 0) == None
+
+def test_rates_of_earlier_day(recording):
+    assert recording.ratesFor('usd', DAY) == RATES
+    # replaying on a later date uses the last recorded day
+    assert recording.ratesFor('usd', '2024-03-04') == RATES
+    assert recording.ratesFor('eur', DAY) == None
+
+def test_replay_speed_and_latency(recording):
+    clock = FakeClock()
+    provider = ReplayQuoteProvider(recording, speed=60, latency=0.5, clock=clock, sleep=clock.sleep)
+
+    result = provider.getQuotes(['msft', 'nope'])
+    assert result.quotes['msft'].price == 100.0
+    assert list(result.errors) == ['nope']
+    # every call waited the latency, which also moves the replay on
+    assert clock.now == 1000.5
+
+    # an hour of the recording in a minute
+    clock.now += 60
+    assert provider.getQuotes(['msft']).quotes['msft'].price == 110.0
+
+    provider.seek(0)
+    provider.speed = 0
+    clock.now += 1000
+    assert provider.getQuotes(['msft']).quotes['msft'].price == 100.0
+    assert provider.calls == 3
+
+def test_replay_portfolio_offline(recording, monkeypatch):
+    provider = ReplayQuoteProvider(recording, speed=0)
+    monkeypatch.setattr(portfolio.fxstore, '_defaultStore', FxStore(fetcher=provider.fetchRates))
+    stocks = [Stock('msft', 0.0, 'USD', 10, 0.5, 0.0), Stock('ry', 0.0, 'CAD', 5, 0.5, 0.0)]
+    manager = PortfolioManager(Portfolio('replayed', stocks, 0.0, 'CAD'))
+
+    assert manager.currentPortfolio.updateAllStockPrices(provider).ok
+    snapshot = manager.takeSnapshot(refresh=False)
+    assert snapshot.totalValue == pytest.approx(100.0 * 10 * 1.25 + 130.0 * 5)
+    assert manager.calculateRebalanceBuyOnly(500.0, snapshot).snapshot is snapshot
+    assert provider.fxCalls == 1
+
+def test_unsupported_version(tmp_path):
+    path = tmp_path / "old.jsonl.gz"
+    with gzip.open(path, 'wt') as f:
+        f.write('{"version": 0, "startedAt": 0}\n')
+    with pytest.raises(ValueError):
+        Recording.load(path)
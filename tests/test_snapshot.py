@@ -0,0 +1,46 @@
+import threading
+import pytest
+from investool import portfolio
+from investool.fxstore import FxStore
+from investool.stock import Stock
+from investool.portfolio import Portfolio
+from investool.snapshot import MarketSnapshot
+
+def test_fromPortfolio_same_currency():
+    stocks = [Stock('zag.to', 30, 'CAD', 10, 0.5, 0), Stock('xiu.to', 20, 'CAD', 5, 0.5, 0)]
+    snap = MarketSnapshot.fromPortfolio(Portfolio('cad', stocks, 0.0, 'CAD'))
+
+    assert snap.adjustedPrice('zag.to') == 30
+    assert snap.totalValue == 400
+    assert dict(snap.prices) == {'zag.to': 30, 'xiu.to': 20}
+
+def test_immutable():
+    snap = MarketSnapshot('CAD', {'msft': 10.0}, {'msft': 'USD'}, {'usd': 1.3}, 13.0)
+    assert snap.adjustedPrice('msft') == pytest.approx(13.0)
+    with pytest.raises(AttributeError):
+        snap.totalValue = 0
+    with pytest.raises(TypeError):
+        snap.prices['msft'] = 1.0
+
+def test_rates_fetched_without_lock(monkeypatch):
+    p = Portfolio('cad', [Stock('msft', 10, 'USD', 10, 1.0, 0)], 0.0, 'CAD')
+    locked = []
+
+    def tryLock():
+        acquired = p.lock.acquire(timeout=1)
+        if acquired:
+            p.lock.release()
+        locked.append(not acquired)
+
+    def fetcher(base, day):
+        # another thread can take the portfolio lock during the download
+        thread = threading.Thread(target=tryLock)
+        thread.start()
+        thread.join()
+        return {'cad': 1.25, 'usd': 1.0}
+    monkeypatch.setattr(portfolio.fxstore, '_defaultStore', FxStore(fetcher=fetcher))
+
+    assert MarketSnapshot.fromPortfolio(p).totalValue == pytest.approx(125.0)
+    p.updateTotalPortfolioValue(updatePrices=False)
+    assert p.totalValue == pytest.approx(125.0)
+    assert locked == [False]
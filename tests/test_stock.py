@@ -84,6 +84,13 @@ def test_units(msft_stock, empty_stock):
 
     with pytest.raises(ValueError):
         empty_stock.units = -10
+    # fractions would be truncated by the holdings table
+    empty_stock.units = 3.0
+    assert empty_stock.units == 3
+    with pytest.raises(ValueError):
+        empty_stock.units = 2.5
+    with pytest.raises(ValueError):
+        stock.Stock('msft', units=0.5)
 
 def test_percent(msft_stock, empty_stock):
     assert msft_stock.percent == 0.3
@@ -136,7 +143,7 @@ def test_updatePrice(msft_stock, empty_stock, mocker):
     empty_stock.updatePrice() 
     assert empty_stock.price == 0.0
 
-    msft_stock.getCurrentPrice = mocker.MagicMock(return_value=42)
+    mocker.patch.object(stock.Stock, 'getCurrentPrice', return_value=42)
     msft_stock.updatePrice()
     assert msft_stock.price != MSFT_STOCK_PRICE
     assert msft_stock.price == 42
@@ -0,0 +1,119 @@
+import pytest
+from investool import versions
+from investool.versions import VersionStore
+from investool.stock import Stock
+from investool.portfolio import Portfolio
+from investool.manager import PortfolioManager
+from investool.portfoliostore import PortfolioStore
+from tests.test_portfolio import standard_portfolio
+
+@pytest.fixture
+def store(tmp_path):
+    return VersionStore(tmp_path / "versions.sqlite")
+
+def blockCount(store):
+    return store._connection().execute("SELECT COUNT(*) FROM version_blocks").fetchone()[0]
+
+def test_commit_restore(store, standard_portfolio):
+    versionId = store.commit(standard_portfolio, 'test')
+    restored = store.restore(versionId, 'test')
+    assert repr(restored) == repr(standard_portfolio)
+    with pytest.raises(ValueError):
+        store.restore(versionId + 1, 'test')
+    # ids are shared, a version of another portfolio is not found
+    with pytest.raises(ValueError):
+        store.restore(versionId, 'other')
+
+def test_versions_share_blocks(store, monkeypatch):
+    monkeypatch.setattr(versions, 'BLOCK_SIZE', 2)
+    stocks = [Stock(f"t{i}", 10.0, 'USD', 1, 0.1, 10.0) for i in range(6)]
+    portfolio = Portfolio('big', stocks, 60.0, 'USD')
+    store.commit(portfolio, 'big')
+    assert blockCount(store) == 3
+
+    # a price refresh doesn't touch the blocks, a trade only touches its own
+    portfolio.getStock('t0').price = 11.0
+    store.commit(portfolio, 'big')
+    assert blockCount(store) == 3
+    portfolio.getStock('t5').units = 2
+    latest = store.commit(portfolio, 'big')
+    assert blockCount(store) == 4
+
+    restored = store.restore(latest, 'big')
+    assert restored.getStock('t0').price == 11.0
+    assert restored.getStock('t5').units == 2
+
+def test_listVersions_newest_first(store, standard_portfolio):
+    first = store.commit(standard_portfolio, 'test', createdAt=1.0)
+    second = store.commit(standard_portfolio, 'test', createdAt=2.0)
+    store.commit(standard_portfolio, 'other')
+    assert [v.id for v in store.listVersions('test')] == [second, first]
+    assert store.listVersions('test')[0].holdingCount == 3
+
+def test_prune_and_gc(store, standard_portfolio):
+    store.commit(standard_portfolio, 'test', createdAt=1.0)
+    standard_portfolio.getStock('msft').units = 1
+    kept = store.commit(standard_portfolio, 'test', createdAt=2.0)
+    assert store.gc() == 0
+
+    assert store.prune('test', keep=1) == 1
+    assert store.gc() == 1
+    assert [v.id for v in store.listVersions('test')] == [kept]
+    assert store.restore(kept, 'test').getStock('msft').units == 1
+
+def test_manager_restore(tmp_path, standard_portfolio):
+    m = PortfolioManager(standard_portfolio, PortfolioStore(tmp_path / "portfolios.sqlite"))
+    m.DEFAULT_PATH = tmp_path
+    m.savePortfolio()
+    m.buyStock('msft', 5)
+    m.savePortfolio()
+    assert m.store.load('test').getStock('msft').units == 15
+
+    old, = m.listVersions()
+    m.restoreVersion(old.id)
+    assert m.currentPortfolio.getStock('msft').units == 10
+    assert m.store.load('test').getStock('msft').units == 10
+    assert len(m.listVersions()) == 2
+
+@pytest.fixture
+def manager(tmp_path, standard_portfolio):
+    m = PortfolioManager(standard_portfolio, PortfolioStore(tmp_path / "portfolios.sqlite"))
+    m.DEFAULT_PATH = tmp_path
+    m.savePortfolio()
+    return m
+
+def test_restore_checks_portfolio(manager):
+    manager.savePortfolio()
+    version, = manager.listVersions()
+    manager.currentPortfolio = Portfolio('other', [Stock('bbb', 1.0, 'CAD', 1, 1.0, 0)], 0.0, 'CAD')
+    manager.savePortfolio()
+
+    with pytest.raises(ValueError):
+        manager.restoreVersion(version.id, 'other')
+    assert manager.store.load('other').getStockTickers() == ['bbb']
+
+def test_restore_keeps_journaled_trades(manager):
+    manager.buyStock('msft', 1)
+    manager.savePortfolio()
+    first, = manager.listVersions()
+    # journaled, never saved
+    manager.buyStock('msft', 4)
+
+    manager.restoreVersion(first.id)
+    assert manager.currentPortfolio.getStock('msft').units == 10
+    replaced = manager.listVersions()[0]
+    assert manager.store.versions.restore(replaced.id, 'test').getStock('msft').units == 15
+
+def test_restore_other_portfolio_keeps_its_trades(manager, tmp_path):
+    other = PortfolioManager(store=manager.store)
+    other.DEFAULT_PATH = tmp_path
+    other.loadPortfolio('test')
+    other.buyStock('msft', 2)
+    version = manager.store.versions.commit(manager.store.load('test'), 'test')
+
+    fresh = PortfolioManager(store=manager.store)
+    fresh.DEFAULT_PATH = tmp_path
+    fresh.restoreVersion(version, 'test')
+    # versions are dated by the save they replace
+    replaced = max(v.id for v in fresh.listVersions('test'))
+    assert fresh.store.versions.restore(replaced, 'test').getStock('msft').units == 12